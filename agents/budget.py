@@ -0,0 +1,163 @@
+from contextvars import ContextVar
+import os
+import threading
+
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+from tokens import count_tokens
+
+# Spend of the run active in the current context, so concurrent runs sharing
+# one system each count against their own ceiling
+_current_spend = ContextVar("run_spend", default=None)
+
+
+class CostCeilingExceeded(Exception):
+    pass
+
+
+class RunBudget:
+    """Tracks what the current run has spent on LLM calls against an optional ceiling
+
+    Costs use the same flat per-token estimate as the dashboard
+    (COST_PER_TOKEN, default $3 per million tokens). With no ceiling set
+    the budget only tracks spend.
+
+    Each call reserves its estimated tokens before it is made and settles
+    to its actual usage afterwards, as the rate limiter does. A call is
+    refused when it could take the run past the ceiling counting the calls
+    already in flight, so parallel branches can't all start on the last of
+    the budget.
+    """
+
+    def __init__(self, ceiling_usd: float = None, cost_per_token: float = None):
+        self.ceiling_usd = ceiling_usd
+        self.cost_per_token = cost_per_token or float(os.getenv("COST_PER_TOKEN", "0.000003"))
+        self._lock = threading.Lock()
+        self._adhoc = _Spend(self)
+
+    @classmethod
+    def from_env(cls):
+        ceiling = os.getenv("RUN_COST_CEILING_USD")
+        return cls(ceiling_usd=float(ceiling) if ceiling else None)
+
+    def start_run(self):
+        """Start counting a new run's spend in the caller's context"""
+        _current_spend.set(_Spend(self))
+
+    def _spend(self):
+        spend = _current_spend.get()
+        return spend if spend is not None and spend.owner is self else self._adhoc
+
+    @property
+    def tokens(self) -> int:
+        return self._spend().tokens
+
+    def charge(self, tokens: int):
+        spend = self._spend()
+        with self._lock:
+            spend.tokens += tokens
+
+    @property
+    def spent_usd(self) -> float:
+        return self.tokens * self.cost_per_token
+
+    def remaining_tokens(self):
+        """Tokens left under the ceiling after calls in flight, or None when there is no ceiling"""
+        if self.ceiling_usd is None:
+            return None
+        spend = self._spend()
+        return max(int(self.ceiling_usd / self.cost_per_token) - spend.tokens - spend.reserved, 0)
+
+    def reserve(self, tokens: int):
+        """Hold tokens for a call about to be made; pass the result to settle() after it"""
+        spend = self._spend()
+        with self._lock:
+            held = spend.tokens + spend.reserved + tokens
+            if self.ceiling_usd is not None and held * self.cost_per_token > self.ceiling_usd:
+                raise CostCeilingExceeded(
+                    f"run cost ceiling of ${self.ceiling_usd:.4f} reached (spent ${spend.tokens * self.cost_per_token:.4f}, "
+                    f"${(spend.reserved + tokens) * self.cost_per_token:.4f} more reserved or requested)"
+                )
+            spend.reserved += tokens
+        return spend
+
+    def settle(self, spend, reserved: int, actual: int):
+        """Swap a reservation for what the call actually used"""
+        with self._lock:
+            spend.reserved -= reserved
+            spend.tokens += actual
+
+
+class _Spend:
+    def __init__(self, owner: RunBudget):
+        self.owner = owner
+        self.tokens = 0
+        self.reserved = 0
+
+
+class BudgetedLLM:
+    """Wraps a chat model so every call is checked against and charged to a RunBudget"""
+
+    def __init__(self, llm, budget: RunBudget):
+        self.llm = llm
+        self.budget = budget
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _reserve(self, messages):
+        # Same estimate as the rate limiter: the prompt plus the most the reply can be
+        prompt = sum(count_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+        estimate = prompt + (getattr(self.llm, "max_tokens", None) or 1024)
+        return self.budget.reserve(estimate), estimate
+
+    def invoke(self, messages, **kwargs):
+        spend, estimate = self._reserve(messages)
+        tokens = 0
+        try:
+            response = self.llm.invoke(messages, **kwargs)
+            usage = response.response_metadata.get('usage', {})
+            tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        finally:
+            self.budget.settle(spend, estimate, tokens)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        spend, estimate = self._reserve(messages)
+        tokens = 0
+        try:
+            response = await self.llm.ainvoke(messages, **kwargs)
+            usage = response.response_metadata.get('usage', {})
+            tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        finally:
+            self.budget.settle(spend, estimate, tokens)
+        return response
+
+    def stream(self, messages, **kwargs):
+        spend, estimate = self._reserve(messages)
+        tokens = 0
+        try:
+            for chunk in self.llm.stream(messages, **kwargs):
+                usage = chunk.usage_metadata or {}
+                tokens += usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+                yield chunk
+        finally:
+            # Also reached when the consumer abandons the stream
+            self.budget.settle(spend, estimate, tokens)
+
+    async def astream(self, messages, **kwargs):
+        spend, estimate = self._reserve(messages)
+        tokens = 0
+        try:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                usage = chunk.usage_metadata or {}
+                tokens += usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+                yield chunk
+        finally:
+            self.budget.settle(spend, estimate, tokens)
+
+
+def with_budget(llm, budget: RunBudget):
+    """Return llm charged to budget, or unchanged if there is no budget"""
+    if budget is None:
+        return llm
+    return BudgetedLLM(llm, budget)
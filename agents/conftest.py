@@ -0,0 +1,116 @@
+"""pytest setup for the unit tests in agents/
+
+test_agents.py and test_modes.py are scripts that run the whole system
+against the API rather than pytest tests, so they aren't collected.
+
+Graph-level tests use the system fixture: the synthetic LLM backend over a
+small corpus embedded with a feature-hashing stand-in for MiniLM, so
+nothing needs network access or model weights.
+"""
+import os
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'agents'))
+sys.path.insert(0, str(ROOT / 'retrieval'))
+
+collect_ignore = ["test_agents.py", "test_modes.py"]
+
+# Offline defaults for the system fixture; anything already set in the environment wins
+for name, value in {
+    "LLM_BACKEND": "synthetic",
+    "SEMANTIC_CACHE": "off",
+    "RERANK": "off",
+    "EMBEDDING_CACHE_PATH": "off",
+    "TRACE_EXPORTERS": ""
+}.items():
+    os.environ.setdefault(name, value)
+
+TOPICS = [
+    "hand hygiene compliance before and after patient contact",
+    "central line bundles and bloodstream infection rates",
+    "ventilator associated pneumonia prevention in the ICU",
+    "catheter associated urinary tract infection surveillance",
+    "surgical site infection and antibiotic prophylaxis timing",
+    "environmental cleaning and disinfection of patient rooms",
+    "isolation precautions for multidrug resistant organisms",
+    "heart failure discharge education and readmission rates",
+]
+
+
+class HashEmbeddings:
+    """Feature-hashed bag of words, L2-normalised; deterministic and model-free"""
+
+    def __init__(self, dimensions: int = 64):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture(scope="session")
+def embeddings():
+    from embedding_service import EmbeddingService
+    return EmbeddingService(HashEmbeddings(), "hash-embeddings", cache_path="off")
+
+
+@pytest.fixture(scope="session")
+def system(tmp_path_factory, embeddings):
+    """HealthcareMultiAgentSystem on the synthetic LLM over a 40-chunk corpus
+
+    The agents open "../chroma_db" relative to the working directory, so the
+    system is built from a directory whose sibling is the corpus.
+    """
+    from langchain_chroma import Chroma
+    from langchain.schema import Document
+
+    import resources
+    from graph import HealthcareMultiAgentSystem
+    from vector_store import EMBEDDING_MODEL, HealthcareVectorStore
+
+    root = tmp_path_factory.mktemp("system")
+    store = HealthcareVectorStore(persist_directory=str(root / "chroma_db"), embeddings=embeddings)
+    store.vectorstore = Chroma(
+        persist_directory=store.persist_directory,
+        embedding_function=embeddings,
+        collection_name="healthcare_docs"
+    )
+    chunks = [
+        Document(
+            page_content=f"{TOPICS[i % len(TOPICS)]}: finding {i} from study {i // len(TOPICS)}",
+            metadata={"source": f"doc_{i % 4}.pdf", "doc_name": f"doc_{i % 4}",
+                      "page": i // 4, "chunk_id": f"chunk-{i:03d}"}
+        )
+        for i in range(40)
+    ]
+    store.vectorstore.add_documents(chunks, ids=[c.metadata["chunk_id"] for c in chunks])
+    store.build_bm25_index()
+    (root / "work").mkdir()
+
+    previous_cwd = os.getcwd()
+    previous_get_embeddings = resources.get_embeddings
+    os.chdir(root / "work")
+    resources.get_embeddings = lambda model_name=EMBEDDING_MODEL: embeddings
+    try:
+        system = HealthcareMultiAgentSystem()
+    finally:
+        resources.get_embeddings = previous_get_embeddings
+        os.chdir(previous_cwd)
+    yield system
+    resources.shutdown()
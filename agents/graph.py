@@ -5,42 +5,388 @@ from research_agent import ResearchAgent
 from writer_agent import WriterAgent
 from verifier_agent import VerifierAgent
 from observability import AgentObservability
-from typing import Literal
+from budget import RunBudget
+import resources
+import tracing
+import metrics
+from semantic_cache import SemanticQueryCache
+from research_agent import ResearchBatch
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import AsyncIterator, Iterator, List, Literal, Union
 from datetime import datetime
+import asyncio
+import contextvars
+import copy
+import os
+import time
 
 class HealthcareMultiAgentSystem:
     """Complete multi-agent system using LangGraph"""
     
     def __init__(self):
         self.obs = AgentObservability()
+        self.llm_cache = resources.get_llm_cache()
+        # Spend per run, capped by RUN_COST_CEILING_USD when set
+        self.budget = RunBudget.from_env()
         
-        self.planner = PlannerAgent(self.obs)
-        self.researcher = ResearchAgent(self.obs)
-        self.writer = WriterAgent(self.obs)
-        self.verifier = VerifierAgent(self.obs)
+        self.planner = PlannerAgent(self.obs, self.llm_cache, self.budget)
+        self.researcher = ResearchAgent(self.obs, self.llm_cache, budget=self.budget)
+        self.writer = WriterAgent(self.obs, self.llm_cache, self.budget)
+        self.verifier = VerifierAgent(self.obs, self.llm_cache, self.budget)
+        
+        self.semantic_cache = SemanticQueryCache.from_env(self.researcher.vector_store)
         
         self.graph = self._build_graph()
         self.app = self.graph.compile()
+        # run_batch plans ahead of the graph, so its graph starts at retrieval
+        self.batch_app = self._build_graph(plan=False).compile()
+        # arun's graph has the same shape with async nodes
+        self.async_app = self._build_graph(asynchronous=True).compile()
     
-    def _build_graph(self) -> StateGraph:
+    def _build_graph(self, plan: bool = True, asynchronous: bool = False) -> StateGraph:
         """Construct the agent workflow graph"""
         workflow = StateGraph(AgentState)
         
-        workflow.add_node("planner", self.planner.plan)
-        workflow.add_node("researcher", self.researcher.research)
-        workflow.add_node("writer", self.writer.write)
-        workflow.add_node("verifier", self.verifier.verify)
+        if asynchronous:
+            nodes = {
+                "planner": self.planner.aplan,
+                "research_retrieve": self.researcher.aretrieve,
+                "research_query": self.researcher.aresearch_query,
+                "research_reduce": self.researcher.aresearch_reduce,
+                "writer": self.writer.awrite,
+                "verifier": self.verifier.averify
+            }
+        else:
+            nodes = {
+                "planner": self.planner.plan,
+                "research_retrieve": self.researcher.retrieve,
+                "research_query": self.researcher.research_query,
+                "research_reduce": self.researcher.research_reduce,
+                "writer": self.writer.write,
+                "verifier": self.verifier.verify
+            }
+        if not plan:
+            del nodes["planner"]
+        for name, node in nodes.items():
+            workflow.add_node(name, node)
         
-        workflow.set_entry_point("planner")
-        workflow.add_edge("planner", "researcher")
-        workflow.add_edge("researcher", "writer")
+        if plan:
+            workflow.set_entry_point("planner")
+            # Retrieval for the whole plan runs once, so chunks can be de-duplicated across queries
+            workflow.add_edge("planner", "research_retrieve")
+        else:
+            workflow.set_entry_point("research_retrieve")
+        # Map: one synthesis branch per planner query, run in parallel
+        workflow.add_conditional_edges(
+            "research_retrieve", self.researcher.fan_out, ["research_query", "research_reduce"]
+        )
+        # Reduce: branches join before the writer sees the notes
+        workflow.add_edge("research_query", "research_reduce")
+        workflow.add_edge("research_reduce", "writer")
         workflow.add_edge("writer", "verifier")
         workflow.add_edge("verifier", END)
         
         return workflow
     
     def run(self, user_query: str, output_mode: str = "executive") -> dict:
-
+        with self.obs.run_scope() as run:
+            with tracing.span("run", {"run_id": run.run_id, "output_mode": output_mode}, root=True) as root:
+                result = self._run(user_query, output_mode)
+            result["observability"]["spans"] = tracing.collect(root)
+            return result
+    
+    def _run(self, user_query: str, output_mode: str) -> dict:
+        start = time.perf_counter()
+        
+        query_vector, cached = self._check_cache(user_query, output_mode)
+        if cached:
+            self.obs.log_run_timing(time.perf_counter() - start, cache_hit=True)
+            cached["observability"] = self.obs.get_summary()
+            return cached
+        
+        final_state = self.app.invoke(
+            self._initial_state(user_query, output_mode),
+            config={"max_concurrency": self.researcher.max_concurrency}
+        )
+        
+        self.obs.log_run_timing(time.perf_counter() - start)
+        return self._finish(final_state, query_vector)
+    
+    async def arun(self, user_query: str, output_mode: str = "executive") -> dict:
+        """Async counterpart of run(), for serving many requests from one event loop
+        
+        Every LLM call is awaited, and the embedding model, Chroma and the
+        semantic cache run in worker threads, so an in-flight request holds
+        no thread while it waits on the API. Concurrent calls each need
+        their own task (e.g. asyncio.gather), since a run is scoped to the
+        task's context.
+        """
+        with self.obs.run_scope() as run:
+            with tracing.span("run", {"run_id": run.run_id, "output_mode": output_mode}, root=True) as root:
+                result = await self._arun(user_query, output_mode)
+            result["observability"]["spans"] = tracing.collect(root)
+            return result
+    
+    async def _arun(self, user_query: str, output_mode: str) -> dict:
+        start = time.perf_counter()
+        
+        query_vector, cached = await asyncio.to_thread(self._check_cache, user_query, output_mode)
+        if cached:
+            self.obs.log_run_timing(time.perf_counter() - start, cache_hit=True)
+            cached["observability"] = self.obs.get_summary()
+            return cached
+        
+        final_state = await self.async_app.ainvoke(
+            self._initial_state(user_query, output_mode),
+            config={"max_concurrency": self.researcher.max_concurrency}
+        )
+        
+        self.obs.log_run_timing(time.perf_counter() - start)
+        return await asyncio.to_thread(self._finish, final_state, query_vector)
+    
+    def run_stream(self, user_query: str, output_mode: str = "executive"):
+        """Streaming counterpart of run()
+        
+        Yields {"type": "node", "node": name} as each graph node finishes and
+        {"type": "token", "node": "writer", "text": ...} as the writer's tokens
+        arrive, then {"type": "result", "result": ...} with the same dict run()
+        returns.
+        """
+        with self.obs.run_scope() as run:
+            result = None
+            with tracing.span("run", {"run_id": run.run_id, "output_mode": output_mode}, root=True) as root:
+                for event in self._run_stream(user_query, output_mode):
+                    if event["type"] == "result":
+                        result = event["result"]
+                    else:
+                        yield event
+            result["observability"]["spans"] = tracing.collect(root)
+            yield {"type": "result", "result": result}
+    
+    def _run_stream(self, user_query: str, output_mode: str):
+        start = time.perf_counter()
+        
+        query_vector, cached = self._check_cache(user_query, output_mode)
+        if cached:
+            self.obs.log_run_timing(time.perf_counter() - start, cache_hit=True)
+            cached["observability"] = self.obs.get_summary()
+            yield {"type": "result", "result": cached}
+            return
+        
+        final_state = None
+        ttft = None
+        for mode, chunk in self.app.stream(
+            self._initial_state(user_query, output_mode),
+            config={
+                "max_concurrency": self.researcher.max_concurrency,
+                "configurable": {"stream_tokens": True}
+            },
+            stream_mode=["values", "updates", "custom"]
+        ):
+            if mode == "values":
+                final_state = chunk
+            elif mode == "updates":
+                for node in chunk:
+                    yield {"type": "node", "node": node}
+            elif mode == "custom":
+                if ttft is None and chunk.get("type") == "token":
+                    ttft = time.perf_counter() - start
+                yield chunk
+        
+        self.obs.log_run_timing(time.perf_counter() - start, ttft)
+        yield {"type": "result", "result": self._finish(final_state, query_vector)}
+    
+    async def arun_stream(self, user_query: str, output_mode: str = "executive") -> AsyncIterator[dict]:
+        """Async counterpart of run_stream(), yielding the same events"""
+        with self.obs.run_scope() as run:
+            result = None
+            with tracing.span("run", {"run_id": run.run_id, "output_mode": output_mode}, root=True) as root:
+                async for event in self._arun_stream(user_query, output_mode):
+                    if event["type"] == "result":
+                        result = event["result"]
+                    else:
+                        yield event
+            result["observability"]["spans"] = tracing.collect(root)
+            yield {"type": "result", "result": result}
+    
+    async def _arun_stream(self, user_query: str, output_mode: str):
+        start = time.perf_counter()
+        
+        query_vector, cached = await asyncio.to_thread(self._check_cache, user_query, output_mode)
+        if cached:
+            self.obs.log_run_timing(time.perf_counter() - start, cache_hit=True)
+            cached["observability"] = self.obs.get_summary()
+            yield {"type": "result", "result": cached}
+            return
+        
+        final_state = None
+        ttft = None
+        async for mode, chunk in self.async_app.astream(
+            self._initial_state(user_query, output_mode),
+            config={
+                "max_concurrency": self.researcher.max_concurrency,
+                "configurable": {"stream_tokens": True}
+            },
+            stream_mode=["values", "updates", "custom"]
+        ):
+            if mode == "values":
+                final_state = chunk
+            elif mode == "updates":
+                for node in chunk:
+                    yield {"type": "node", "node": node}
+            elif mode == "custom":
+                if ttft is None and chunk.get("type") == "token":
+                    ttft = time.perf_counter() - start
+                yield chunk
+        
+        self.obs.log_run_timing(time.perf_counter() - start, ttft)
+        yield {"type": "result", "result": await asyncio.to_thread(self._finish, final_state, query_vector)}
+    
+    def run_batch(self, queries: List[str], modes: Union[str, List[str]] = "executive",
+                  concurrency: int = None) -> Iterator[dict]:
+        """Run many requests over this system, yielding run() results in input order
+        
+        Distinct requests are worked on in groups of concurrency
+        (BATCH_CONCURRENCY, default 8); duplicate requests share the whole
+        result. Each group goes through three stages:
+        
+        1. plan: one planner call per request
+        2. search: the research queries of every plan in the group are
+           embedded and searched in one pass, then each request reranks,
+           de-duplicates and packs its own hits
+        3. the rest of the graph per request; research syntheses with the
+           same query and chunks are made once and shared across the batch
+        
+        Once a group has finished, its results (and those of any repeated
+        requests before the next group) are yielded, so early results don't
+        wait for the whole batch to be planned. A group runs as many research
+        branches as requests; LLM_MAX_CONCURRENCY caps the LLM calls in
+        flight across all of them. An exception raised by a request is
+        re-raised when its result is reached.
+        """
+        modes = [modes] * len(queries) if isinstance(modes, str) else list(modes)
+        if len(modes) != len(queries):
+            raise ValueError("run_batch needs one mode per query")
+        concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", "8"))
+        
+        requests = list(zip(queries, modes))
+        batch = ResearchBatch(max_workers=concurrency)
+        items = {}
+        for request in dict.fromkeys(requests):
+            # Every request keeps its own context for its run scope, root span and budget
+            item = _BatchItem(*request, contextvars.copy_context())
+            item.context.run(batch.activate)
+            items[request] = item
+        distinct = list(items)
+        
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        try:
+            futures = {}
+            yielded = set()
+            position = 0
+            for start in range(0, len(distinct), concurrency):
+                group = [items[request] for request in distinct[start:start + concurrency]]
+                for future in [pool.submit(item.context.run, self._batch_plan, item) for item in group]:
+                    future.result()
+                
+                self._batch_search([item for item in group if item.state is not None])
+                
+                for request in distinct[start:start + concurrency]:
+                    item = items[request]
+                    futures[request] = pool.submit(item.context.run, self._batch_finish, item)
+                
+                # Requests are grouped in order of first appearance, so everything
+                # up to the first request of the next group can be yielded now
+                while position < len(requests) and requests[position] in futures:
+                    request = requests[position]
+                    result = futures[request].result()
+                    # Duplicates get their own copy, so callers can mutate results freely
+                    yield copy.deepcopy(result) if request in yielded else result
+                    yielded.add(request)
+                    position += 1
+        finally:
+            # Requests still running finish (they use the batch's research pool);
+            # the ones not started yet are dropped
+            pool.shutdown(wait=True, cancel_futures=True)
+            for item in items.values():
+                if item.stack is not None:
+                    # A no-op for requests that finished; closes the run and root span of the rest
+                    item.context.run(item.stack.close)
+            batch.close()
+    
+    def _batch_plan(self, item: "_BatchItem"):
+        """Stage 1, in the request's context: open its run, check the cache and plan"""
+        item.stack = ExitStack()
+        try:
+            run = item.stack.enter_context(self.obs.run_scope())
+            item.root = item.stack.enter_context(tracing.span(
+                "run", {"run_id": run.run_id, "output_mode": item.output_mode, "batch": True}, root=True
+            ))
+            item.query_vector, cached = self._check_cache(item.user_query, item.output_mode)
+            if cached:
+                self.obs.log_run_timing(time.perf_counter() - item.start, cache_hit=True)
+                cached["observability"] = self.obs.get_summary()
+                item.result = cached
+                return
+            state = self._initial_state(item.user_query, item.output_mode)
+            # The initial logs are empty, so the planner's update can simply be laid over them
+            item.state = {**state, **self.planner.plan(state)}
+        except Exception as e:
+            item.error = e
+            item.state = None
+    
+    def _batch_search(self, items: list):
+        """Stage 2: one search for the research queries of every planned request in a group"""
+        queries = list(dict.fromkeys(q for item in items for q in item.state["research_queries"]))
+        if not queries:
+            return
+        try:
+            hits = dict(zip(queries, self.researcher.search(queries)))
+        except Exception as e:
+            # Each request's retrieval node searches for itself instead
+            print(f"Batched search failed, retrieving per request: {e}")
+            metrics.BATCH_SEARCH_FALLBACKS.inc()
+            return
+        for item in items:
+            item.state["retrieval_candidates"] = [hits[q] for q in item.state["research_queries"]]
+    
+    def _batch_finish(self, item: "_BatchItem") -> dict:
+        """Stage 3, in the request's context: the rest of the graph, then close the run"""
+        try:
+            if item.error is None and item.result is None:
+                final_state = self.batch_app.invoke(
+                    item.state,
+                    config={"max_concurrency": self.researcher.max_concurrency}
+                )
+                self.obs.log_run_timing(time.perf_counter() - item.start)
+                item.result = self._finish(final_state, item.query_vector)
+        except Exception as e:
+            item.error = e
+        finally:
+            item.stack.close()
+        
+        if item.error is not None:
+            raise item.error
+        item.result["observability"]["spans"] = tracing.collect(item.root)
+        return item.result
+    
+    def _check_cache(self, user_query: str, output_mode: str) -> tuple:
+        """Returns (query vector, cached result or None)"""
+        if not self.semantic_cache:
+            return None, None
+        
+        query_vector = self.semantic_cache.embed(user_query)
+        cached = self.semantic_cache.lookup(query_vector, output_mode)
+        metrics.CACHE_LOOKUPS.inc(cache="semantic", result="hit" if cached else "miss")
+        if cached:
+            print(f"Semantic cache hit ({cached['cache_similarity']}): {cached['cached_query']}")
+            cached["user_query"] = user_query
+            cached["cost_usd"] = 0.0
+        return query_vector, cached
+    
+    def _initial_state(self, user_query: str, output_mode: str) -> AgentState:
+        self.budget.start_run()
         initial_state: AgentState = {
             "user_query": user_query,
             "output_mode": output_mode,
@@ -48,6 +394,8 @@ class HealthcareMultiAgentSystem:
             "research_queries": [],
             "research_notes": [],
             "retrieved_documents": [],
+            "retrieval_results": [],
+            "retrieval_candidates": None,
             "executive_summary": "",
             "email_draft": "",
             "action_items": [],
@@ -69,8 +417,9 @@ class HealthcareMultiAgentSystem:
         print(f"Mode: {output_mode}")
         print("=" * 80)
         
-        final_state = self.app.invoke(initial_state)
-        
+        return initial_state
+    
+    def _finish(self, final_state: AgentState, query_vector) -> dict:
         obs_summary = self.obs.get_summary()
         
         output = {
@@ -90,25 +439,31 @@ class HealthcareMultiAgentSystem:
             
             "observability": obs_summary,
             
-            "errors": final_state["error_log"]
+            "errors": final_state["error_log"],
+            
+            "cost_usd": round(self.budget.spent_usd, 6),
+            "cache_hit": False
         }
         
+        if query_vector is not None and not output["errors"]:
+            self.semantic_cache.store(query_vector, output["user_query"], output["output_mode"], output)
+        
         return output
     
     def _compile_sources(self, research_notes: list) -> list:
         sources_dict = {}
         
-        for note in research_notes:
-            key = note['source']
+        for citation in (c for note in research_notes for c in note['citations']):
+            key = citation['source']
             if key not in sources_dict:
                 sources_dict[key] = {
-                    "document": note['source'],
+                    "document": citation['source'],
                     "pages": set(),
-                    "chunks": []
+                    "chunks": set()
                 }
             
-            sources_dict[key]["pages"].add(note['page'])
-            sources_dict[key]["chunks"].append(note['chunk_id'])
+            sources_dict[key]["pages"].add(citation['page'])
+            sources_dict[key]["chunks"].add(citation['chunk_id'])
         
         sources = []
         for doc, info in sources_dict.items():
@@ -121,6 +476,22 @@ class HealthcareMultiAgentSystem:
         return sources
 
 
+class _BatchItem:
+    """One distinct request of a run_batch and the state carried between its stages"""
+    
+    def __init__(self, user_query: str, output_mode: str, context: contextvars.Context):
+        self.user_query = user_query
+        self.output_mode = output_mode
+        self.context = context
+        self.start = time.perf_counter()
+        self.stack = None
+        self.root = None
+        self.query_vector = None
+        self.state = None
+        self.result = None
+        self.error = None
+
+
 def main():
     system = HealthcareMultiAgentSystem()
     
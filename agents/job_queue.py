@@ -0,0 +1,255 @@
+"""Async job queue with admission control, behind the HTTP service (app/api_server.py)
+
+Submitted questions wait in a FIFO backlog for one of SERVER_WORKERS
+workers, each running one HealthcareMultiAgentSystem.arun_stream() at a
+time on the event loop. Admission control has two limits:
+
+- SERVER_MAX_BACKLOG: a submission that would queue more jobs than this is
+  rejected, with a Retry-After estimated from recent job durations
+- SERVER_TOKEN_BUDGET: the tokens that running jobs may be expected to
+  spend at once. A job is charged the average spend of recent jobs
+  (SERVER_TOKENS_PER_JOB until there are any) and stays queued until it
+  fits, so a burst waits here rather than in the rate limiter
+
+Every job keeps the events of its run (status, node, token, then result or
+error) so clients can follow it as server-sent events. Finished jobs are
+kept for polling up to SERVER_JOB_RETENTION, oldest dropped first.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class AdmissionError(Exception):
+    """A submission that can't be accepted; status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 429, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, query: str, mode: str):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.mode = mode
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.tokens_reserved = 0
+        self.events = []
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def publish(self, event: dict):
+        self.events.append(event)
+        # Wake every follower, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """The job's events from the first, as they arrive, until it finishes"""
+        # Held for the whole follow, since a finished job's list is replaced by a compacted one
+        events = self.events
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(events):
+                yield events[index]
+                index += 1
+            if self.done:
+                return
+            await changed.wait()
+
+    def to_dict(self, position: int = None) -> dict:
+        job = {
+            "id": self.id,
+            "status": self.status,
+            "query": self.query,
+            "mode": self.mode,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if self.error is not None:
+            job["error"] = self.error
+        if self.status == SUCCEEDED:
+            job["result"] = self.result
+        return job
+
+
+class JobQueue:
+    """Runs submitted jobs on a fixed number of workers; see the module docstring for the limits"""
+
+    def __init__(self, system, workers: int = None, max_backlog: int = None,
+                 token_budget: int = None, retention: int = None):
+        self.system = system
+        self.workers = workers or int(os.getenv("SERVER_WORKERS", "8"))
+        self.max_backlog = max_backlog or int(os.getenv("SERVER_MAX_BACKLOG", "100"))
+        budget = token_budget or os.getenv("SERVER_TOKEN_BUDGET")
+        self.token_budget = int(budget) if budget else None
+        self.retention = retention or int(os.getenv("SERVER_JOB_RETENTION", "500"))
+
+        self.jobs = OrderedDict()
+        self._pending = deque()
+        self._finished = deque()
+        self._running = 0
+        self._reserved = 0
+        # Running averages over finished jobs, for reservations and Retry-After
+        self._tokens_per_job = float(os.getenv("SERVER_TOKENS_PER_JOB", "12000"))
+        self._seconds_per_job = 60.0
+        self._draining = False
+        self._wake = None
+        self._tasks = []
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        self._wake = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, query: str, mode: str) -> Job:
+        if self._draining:
+            metrics.JOBS_REJECTED.inc(reason="draining")
+            raise AdmissionError("server is shutting down", status=503)
+        if len(self._pending) >= self.max_backlog:
+            metrics.JOBS_REJECTED.inc(reason="backlog")
+            raise AdmissionError(f"backlog full ({len(self._pending)} jobs queued)",
+                                 retry_after=self._retry_after())
+
+        job = Job(query, mode)
+        self.jobs[job.id] = job
+        self._pending.append(job)
+        metrics.JOBS_QUEUED.inc()
+        job.publish({"type": "status", "status": QUEUED})
+        async with self._wake:
+            self._wake.notify_all()
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job):
+        """1-based place in the backlog, or None once the job has started"""
+        if job.status != QUEUED:
+            return None
+        return next((i for i, pending in enumerate(self._pending, 1) if pending is job), None)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "running": self._running,
+            "workers": self.workers,
+            "max_backlog": self.max_backlog,
+            "tokens_reserved": self._reserved,
+            "token_budget": self.token_budget,
+            "draining": self._draining
+        }
+
+    async def drain(self, timeout: float = None):
+        """Refuse new jobs and let the accepted ones finish; cancel what is left after timeout"""
+        timeout = timeout if timeout is not None else float(os.getenv("SERVER_DRAIN_TIMEOUT", "60"))
+        self._draining = True
+        async with self._wake:
+            self._wake.notify_all()
+
+        unfinished = []
+        if self._tasks:
+            _, unfinished = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+
+        while self._pending:
+            job = self._pending.popleft()
+            metrics.JOBS_QUEUED.dec()
+            self._finish(job, CANCELLED, "cancelled at shutdown before it started")
+
+    def _can_start(self) -> bool:
+        if not self._pending:
+            return self._draining
+        if self.token_budget is None or self._running == 0:
+            return True
+        return self._reserved + self._tokens_per_job <= self.token_budget
+
+    async def _worker(self):
+        while True:
+            async with self._wake:
+                await self._wake.wait_for(self._can_start)
+                if not self._pending:
+                    return
+                job = self._pending.popleft()
+                job.tokens_reserved = round(self._tokens_per_job)
+                self._reserved += job.tokens_reserved
+                self._running += 1
+            metrics.JOBS_QUEUED.dec()
+
+            try:
+                await self._run(job)
+            finally:
+                async with self._wake:
+                    self._reserved -= job.tokens_reserved
+                    self._running -= 1
+                    self._wake.notify_all()
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        metrics.JOB_QUEUE_WAIT.observe(job.started_at - job.created_at)
+        job.publish({"type": "status", "status": RUNNING})
+        try:
+            async for event in self.system.arun_stream(job.query, job.mode):
+                if event["type"] == "result":
+                    job.result = event["result"]
+                else:
+                    job.publish(event)
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED, "cancelled at shutdown")
+            raise
+        except Exception as e:
+            self._finish(job, FAILED, str(e) or type(e).__name__)
+            return
+        self._finish(job, SUCCEEDED)
+
+    def _finish(self, job: Job, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        metrics.JOBS.inc(status=status)
+
+        if status == SUCCEEDED:
+            tokens = job.result.get("observability", {}).get("total_tokens_used", 0)
+            if not job.result.get("cache_hit"):
+                self._tokens_per_job = 0.8 * self._tokens_per_job + 0.2 * tokens
+            self._seconds_per_job = 0.8 * self._seconds_per_job + 0.2 * (job.finished_at - job.started_at)
+            job.publish({"type": "result", "result": job.result})
+        else:
+            job.publish({"type": "error", "status": status, "error": error})
+        # Followers keep the full list; later ones only need what isn't token-by-token
+        job.events = [event for event in job.events if event["type"] != "token"]
+
+        self._finished.append(job.id)
+        while len(self._finished) > self.retention:
+            self.jobs.pop(self._finished.popleft(), None)
+
+    def _retry_after(self) -> float:
+        """Roughly how long until a worker frees up and the backlog has room again"""
+        return round(self._seconds_per_job / self.workers, 1)
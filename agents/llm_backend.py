@@ -0,0 +1,363 @@
+"""Offline LLM backends: record real responses, replay them, or fake them
+
+LLM_BACKEND picks what resources.get_llm() hands the agents:
+
+- anthropic (default): the real API
+- record: the real API, with every response, its latency and its usage
+  appended to the fixture file (LLM_FIXTURE_PATH)
+- replay: responses served from the fixture file by prompt hash, without
+  network access or API spend
+- synthetic: a fake model producing well-formed output for every agent,
+  for load tests and benchmarking the orchestration itself
+
+Replayed and synthetic calls return immediately unless a latency model is
+set (LLM_REPLAY_LATENCY / LLM_SYNTHETIC_LATENCY): "off", "fixed:SECONDS",
+"lognormal:MEDIAN,SIGMA", or for replay only "recorded" (each response's
+own latency) and "empirical" (drawn from all recorded latencies).
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+from tokens import count_tokens
+from llm_cache import LLMResponseCache
+
+BACKENDS = ("anthropic", "record", "replay", "synthetic")
+DEFAULT_FIXTURE_PATH = Path(__file__).parent.parent / 'fixtures' / 'llm_responses.jsonl'
+
+
+def backend_name() -> str:
+    name = os.getenv("LLM_BACKEND", "anthropic").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"LLM_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
+    return name
+
+
+class FixtureMissingError(LookupError):
+    pass
+
+
+class FixtureStore:
+    """Recorded responses keyed like the response cache (model, temperature, messages)
+
+    Fixtures are JSON lines, one per recorded call, so a recording session
+    only ever appends. A prompt recorded twice is replayed from its latest
+    recording.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = Path(path or os.getenv("LLM_FIXTURE_PATH", DEFAULT_FIXTURE_PATH))
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.latencies = []
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: dict):
+        self._entries[entry["key"]] = entry
+        self.latencies.append(entry["latency_seconds"])
+
+    def get(self, key: str):
+        return self._entries.get(key)
+
+    def put(self, entry: dict):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+            self._index(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LatencyModel:
+    """How long an offline call pretends to take"""
+
+    def __init__(self, kind: str = "off", median: float = 0.0, sigma: float = 0.0):
+        self.kind = kind
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec: str):
+        kind, _, args = (spec or "off").partition(":")
+        kind = kind.strip().lower()
+        if kind in ("off", "recorded", "empirical"):
+            return cls(kind)
+        if kind == "fixed":
+            return cls(kind, float(args))
+        if kind == "lognormal":
+            median, sigma = (float(v) for v in args.split(","))
+            return cls(kind, median, sigma)
+        raise ValueError(f"unknown latency model {spec!r}")
+
+    @classmethod
+    def from_env(cls, name: str):
+        return cls.parse(os.getenv(name, "off"))
+
+    def sample(self, rng: random.Random, recorded: float = None, observed: list = None) -> float:
+        """Seconds for one call; recorded is the call's own latency, observed all recorded latencies"""
+        if self.kind == "recorded":
+            return recorded or 0.0
+        if self.kind == "empirical":
+            return rng.choice(observed) if observed else 0.0
+        if self.kind == "fixed":
+            return self.median
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.median), self.sigma) if self.median > 0 else 0.0
+        return 0.0
+
+
+def _usage(input_tokens: int, output_tokens: int) -> dict:
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens}
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(count_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+
+
+class _OfflineLLM:
+    """Shared invoke()/stream() and their async forms for backends that produce a whole response locally"""
+
+    def __init__(self, model: str, temperature: float, latency: LatencyModel = None):
+        self.model = model
+        self.temperature = temperature
+        self.latency = latency or LatencyModel()
+        self._rng = random.Random()
+
+    def _respond(self, messages) -> tuple:
+        """(content, usage, recorded latency, recorded ttft)"""
+        raise NotImplementedError
+
+    def _delay(self, recorded: float) -> float:
+        return self.latency.sample(self._rng, recorded)
+
+    def _message(self, messages) -> tuple:
+        """(AIMessage, seconds to wait before returning it)"""
+        content, usage, latency, _ = self._respond(messages)
+        message = AIMessage(
+            content=content,
+            response_metadata={"model": self.model, "stop_reason": "end_turn",
+                               "usage": {"input_tokens": usage["input_tokens"],
+                                         "output_tokens": usage["output_tokens"]}},
+            usage_metadata=_usage(usage["input_tokens"], usage["output_tokens"])
+        )
+        return message, self._delay(latency)
+
+    def _chunks(self, messages):
+        """(seconds to wait, chunk) pairs: word-sized chunks with input usage on the
+        first and output usage on the last, like the API"""
+        content, usage, latency, ttft = self._respond(messages)
+        delay = self._delay(latency)
+        first_delay = (ttft if self.latency.kind == "recorded" and ttft is not None else delay * 0.3) if delay else 0.0
+        words = content.split(" ")
+        gap = (delay - first_delay) / max(len(words) - 1, 1) if delay else 0.0
+
+        for i, word in enumerate(words):
+            text = word if i == len(words) - 1 else word + " "
+            chunk_usage = None
+            if i == 0:
+                chunk_usage = _usage(usage["input_tokens"], 0)
+            if i == len(words) - 1:
+                chunk_usage = _usage(0 if i else usage["input_tokens"], usage["output_tokens"])
+            yield (gap if i else first_delay), AIMessageChunk(
+                content=text, usage_metadata=chunk_usage,
+                response_metadata={"model": self.model} if i == 0 else {}
+            )
+
+    def invoke(self, messages, **kwargs):
+        message, delay = self._message(messages)
+        if delay:
+            time.sleep(delay)
+        return message
+
+    async def ainvoke(self, messages, **kwargs):
+        message, delay = self._message(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return message
+
+    def stream(self, messages, **kwargs):
+        for delay, chunk in self._chunks(messages):
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def astream(self, messages, **kwargs):
+        for delay, chunk in self._chunks(messages):
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class ReplayLLM(_OfflineLLM):
+    """Serves recorded responses; an unrecorded prompt raises FixtureMissingError"""
+
+    def __init__(self, store: FixtureStore, model: str, temperature: float,
+                 latency: LatencyModel = None, fallback=None):
+        super().__init__(model, temperature, latency)
+        self.store = store
+        self.fallback = fallback
+
+    def _delay(self, recorded: float) -> float:
+        return self.latency.sample(self._rng, recorded, self.store.latencies)
+
+    def _respond(self, messages) -> tuple:
+        key = LLMResponseCache.make_key(self.model, self.temperature, messages)
+        entry = self.store.get(key)
+        if entry is None:
+            if self.fallback is not None:
+                return self.fallback._respond(messages)
+            raise FixtureMissingError(
+                f"no recorded response for prompt {key[:12]} in {self.store.path}; record it with LLM_BACKEND=record"
+            )
+        return entry["content"], entry["usage"], entry["latency_seconds"], entry.get("ttft_seconds")
+
+
+class SyntheticLLM(_OfflineLLM):
+    """A fake model that answers each agent's prompt in the format that agent parses
+
+    Responses are deterministic for a given prompt, so identical requests
+    produce identical plans. Output lengths are in the range the real model
+    produces, which keeps token counts and prompt packing realistic.
+    """
+
+    def _respond(self, messages) -> tuple:
+        prompt = "\n".join(m.content if isinstance(m.content, str) else str(m.content) for m in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        subject = self._subject(messages[-1].content if messages else "")
+
+        if "RESEARCH_QUERIES:" in prompt:
+            content = self._plan(subject, rng)
+        elif "VERIFIED: All claims supported" in prompt:
+            content = "VERIFIED: All claims supported."
+        elif "CLIENT-READY EMAIL" in prompt:
+            content = self._deliverables(subject, rng)
+        else:
+            content = self._finding(subject, rng)
+
+        return content, {"input_tokens": _prompt_tokens(messages), "output_tokens": count_tokens(content)}, None, None
+
+    @staticmethod
+    def _subject(text: str) -> str:
+        for line in str(text).splitlines():
+            for prefix in ("User Request:", "Research Query:"):
+                if line.startswith(prefix):
+                    return line[len(prefix):].strip()
+        return str(text).strip().splitlines()[0][:120] if str(text).strip() else "the request"
+
+    def _sentences(self, subject: str, rng: random.Random, count: int) -> str:
+        openers = ["Evidence indicates", "Guidance recommends", "Studies report", "Facilities found",
+                   "Surveillance data show", "Implementation reviews note"]
+        claims = ["consistent protocols reduce adverse events", "staff education improves compliance",
+                  "audit and feedback sustain gains", "bundled interventions outperform single measures",
+                  "leadership support is a key success factor", "outcomes improve within six to twelve months"]
+        return " ".join(
+            f"{rng.choice(openers)} that for {subject.lower().rstrip('?')}, {rng.choice(claims)}."
+            for _ in range(count)
+        )
+
+    def _plan(self, subject: str, rng: random.Random) -> str:
+        angles = ["current guidelines for", "measured outcomes of", "implementation barriers to",
+                  "cost impact of", "monitoring approaches for"]
+        queries = [f"{angle} {subject.rstrip('?')}" for angle in rng.sample(angles, 3)]
+        return (
+            "EXECUTION_PLAN:\n1. Review the evidence base\n2. Compare interventions\n3. Summarise recommendations\n\n"
+            "RESEARCH_QUERIES:\n" + "\n".join(f"{i}. {q}" for i, q in enumerate(queries, 1))
+        )
+
+    def _finding(self, subject: str, rng: random.Random) -> str:
+        return self._sentences(subject, rng, 6) + " [Source: synthetic, Page 1]"
+
+    def _deliverables(self, subject: str, rng: random.Random) -> str:
+        due = datetime.now().strftime("%Y-%m-%d")
+        actions = [
+            {"task": f"Review {subject.rstrip('?')[:60]} protocols", "owner": "Quality Team",
+             "due_date": due, "confidence": "High"},
+            {"task": "Launch staff training", "owner": "Nursing Leadership", "due_date": due, "confidence": "Medium"},
+            {"task": "Set up compliance audits", "owner": "Infection Control", "due_date": due, "confidence": "Medium"}
+        ]
+        return (
+            f"1. EXECUTIVE SUMMARY\n{self._sentences(subject, rng, 5)}\n\n"
+            f"2. CLIENT-READY EMAIL\nSubject: Findings on {subject}\n\n{self._sentences(subject, rng, 6)}\n\n"
+            f"3. ACTION ITEMS\n{json.dumps(actions)}"
+        )
+
+
+class RecordingLLM:
+    """Passes calls through to the real model and appends each response to a FixtureStore"""
+
+    def __init__(self, llm, store: FixtureStore):
+        self.llm = llm
+        self.store = store
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _record(self, messages, content: str, usage: dict, metadata: dict, latency: float, ttft: float = None):
+        self.store.put({
+            "key": LLMResponseCache.make_key(getattr(self.llm, "model", ""),
+                                             getattr(self.llm, "temperature", None), messages),
+            "model": getattr(self.llm, "model", ""),
+            "content": content,
+            "usage": {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)},
+            "response_metadata": metadata,
+            "latency_seconds": round(latency, 4),
+            "ttft_seconds": round(ttft, 4) if ttft is not None else None,
+            "recorded_at": datetime.now().isoformat()
+        })
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = self.llm.invoke(messages, **kwargs)
+        usage = response.usage_metadata or response.response_metadata.get("usage", {})
+        self._record(messages, response.content, usage, response.response_metadata, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        usage = response.usage_metadata or response.response_metadata.get("usage", {})
+        self._record(messages, response.content, usage, response.response_metadata, time.perf_counter() - start)
+        return response
+
+    def stream(self, messages, **kwargs):
+        start = time.perf_counter()
+        ttft = None
+        full = None
+        for chunk in self.llm.stream(messages, **kwargs):
+            if ttft is None and chunk.content:
+                ttft = time.perf_counter() - start
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            self._record(messages, full.content, full.usage_metadata or {}, full.response_metadata,
+                         time.perf_counter() - start, ttft)
+
+    async def astream(self, messages, **kwargs):
+        start = time.perf_counter()
+        ttft = None
+        full = None
+        async for chunk in self.llm.astream(messages, **kwargs):
+            if ttft is None and chunk.content:
+                ttft = time.perf_counter() - start
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            self._record(messages, full.content, full.usage_metadata or {}, full.response_metadata,
+                         time.perf_counter() - start, ttft)
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from langchain_core.messages import AIMessage, AIMessageChunk
+from observability import AgentObservability
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / '.cache' / 'llm_cache.sqlite'
+
+
+class LLMResponseCache:
+    """On-disk LLM response cache shared by all agents
+
+    Entries are keyed by model, temperature and the fully rendered prompt
+    messages. Expired entries are dropped on read, and once the stored
+    responses exceed max_bytes the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = None, ttl_seconds: float = None, max_bytes: int = None):
+        self.path = Path(path or os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT,
+                metadata TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache unless LLM_CACHE is switched off"""
+        if os.getenv("LLM_CACHE", "on").lower() in ("off", "false", "0"):
+            return None
+        return cls()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: list) -> str:
+        rendered = [{"type": m.type, "content": m.content} for m in messages]
+        payload = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "messages": rendered
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            content, metadata, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        return {"content": content, "metadata": json.loads(metadata)}
+
+    def put(self, key: str, model: str, content: str, metadata: dict):
+        now = time.time()
+        metadata_json = json.dumps(metadata, default=str)
+        size = len(content.encode("utf-8")) + len(metadata_json)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, content, metadata_json, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Walk from least recently used until we are back under budget
+        to_delete = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": size}
+
+
+class CachedLLM:
+    """Wraps a chat model so invoke() is served from LLMResponseCache when possible
+
+    Cache hits report zero token usage since no API call was made. The async
+    forms do their SQLite reads and writes in a worker thread.
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache, observability: AgentObservability, agent_name: str):
+        self.llm = llm
+        self.cache = cache
+        self.obs = observability
+        self.agent_name = agent_name
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _key(self, messages) -> tuple:
+        model = getattr(self.llm, "model", "")
+        return model, self.cache.make_key(model, getattr(self.llm, "temperature", None), messages)
+
+    def _hit_metadata(self, cached):
+        """Metadata for a cache hit, or None (after logging the miss) when cached is None"""
+        self.obs.log_cache_lookup(self.agent_name, hit=cached is not None)
+        if cached is None:
+            return None
+        metadata = dict(cached["metadata"])
+        metadata["usage"] = {"input_tokens": 0, "output_tokens": 0}
+        metadata["cache_hit"] = True
+        return metadata
+
+    @staticmethod
+    def _stream_metadata(full) -> dict:
+        metadata = dict(full.response_metadata)
+        # Streamed usage arrives as usage_metadata; store it where invoke() callers look
+        metadata["usage"] = {
+            "input_tokens": (full.usage_metadata or {}).get("input_tokens", 0),
+            "output_tokens": (full.usage_metadata or {}).get("output_tokens", 0)
+        }
+        return metadata
+
+    def invoke(self, messages, **kwargs):
+        model, key = self._key(messages)
+        cached = self.cache.get(key)
+        metadata = self._hit_metadata(cached)
+        if metadata is not None:
+            return AIMessage(content=cached["content"], response_metadata=metadata)
+
+        response = self.llm.invoke(messages, **kwargs)
+        self.cache.put(key, model, response.content, response.response_metadata)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        model, key = self._key(messages)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        metadata = self._hit_metadata(cached)
+        if metadata is not None:
+            return AIMessage(content=cached["content"], response_metadata=metadata)
+
+        response = await self.llm.ainvoke(messages, **kwargs)
+        await asyncio.to_thread(self.cache.put, key, model, response.content, response.response_metadata)
+        return response
+    
+    def stream(self, messages, **kwargs):
+        """Streaming counterpart of invoke(); a cache hit arrives as a single chunk"""
+        model, key = self._key(messages)
+        cached = self.cache.get(key)
+        metadata = self._hit_metadata(cached)
+        if metadata is not None:
+            yield AIMessageChunk(content=cached["content"], response_metadata=metadata)
+            return
+        
+        full = None
+        for chunk in self.llm.stream(messages, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        
+        if full is not None:
+            self.cache.put(key, model, full.content, self._stream_metadata(full))
+
+    async def astream(self, messages, **kwargs):
+        model, key = self._key(messages)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        metadata = self._hit_metadata(cached)
+        if metadata is not None:
+            yield AIMessageChunk(content=cached["content"], response_metadata=metadata)
+            return
+        
+        full = None
+        async for chunk in self.llm.astream(messages, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        
+        if full is not None:
+            await asyncio.to_thread(self.cache.put, key, model, full.content, self._stream_metadata(full))
+
+
+def with_cache(llm, cache: LLMResponseCache, observability: AgentObservability, agent_name: str):
+    """Return llm wrapped with the response cache, or unchanged if caching is off"""
+    if cache is None:
+        return llm
+    return CachedLLM(llm, cache, observability, agent_name)
@@ -0,0 +1,329 @@
+"""Process-wide counters and fixed-bucket histograms in the Prometheus text format
+
+Every thread writes to its own shard of each metric, so concurrent runs
+never contend on a lock while recording; shards are only summed when the
+metrics are read. serve() exposes them on /metrics for a Prometheus scraper.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+import bisect
+import os
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        # Shards of threads that have exited, folded together on read
+        self._retired = {}
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            # The only lock taken: once per thread, when its shard is created
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _labels(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _snapshot(self) -> List[dict]:
+        with self._shards_lock:
+            # Worker pools come and go, so dead threads' shards are merged to keep the list short
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._fold(self._retired, shard)
+            self._shards = live
+            retired = self._copy(self._retired)
+        # Copy before reading; the owning thread may be writing concurrently
+        return [retired] + [self._copy(shard) for _, shard in live]
+
+    def _fold(self, into: dict, shard: dict):
+        raise NotImplementedError
+
+    def _copy(self, shard: dict) -> dict:
+        return dict(shard)
+
+    def _format_labels(self, key: tuple, extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shard()
+        key = self._labels(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _fold(self, into: dict, shard: dict):
+        for key, value in shard.items():
+            into[key] = into.get(key, 0) + value
+
+    def values(self) -> Dict[tuple, float]:
+        totals = {}
+        for shard in self._snapshot():
+            self._fold(totals, shard)
+        return totals
+
+    def value(self, **labels) -> float:
+        return self.values().get(self._labels(labels), 0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{self._format_labels(key)} {_number(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+class Gauge(Counter):
+    """A counter that can also go down; the shards still sum to the current value"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._labels(labels)
+        state = shard.get(key)
+        if state is None:
+            # Per-bucket counts (last slot is +Inf), then sum and count
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            shard[key] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _fold(self, into: dict, shard: dict):
+        for key, (counts, total, count) in shard.items():
+            merged = into.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    def _copy(self, shard: dict) -> dict:
+        return {key: [list(counts), total, count] for key, (counts, total, count) in list(shard.items())}
+
+    def merged(self) -> Dict[tuple, list]:
+        totals = {}
+        for shard in self._snapshot():
+            self._fold(totals, shard)
+        return totals
+
+    def quantile(self, q: float, **labels):
+        """Estimate a quantile by linear interpolation within buckets, like histogram_quantile()
+
+        With no labels, every label set is combined. Returns None with no observations.
+        """
+        merged = self.merged()
+        if labels:
+            selected = [merged[self._labels(labels)]] if self._labels(labels) in merged else []
+        else:
+            selected = list(merged.values())
+
+        counts = [0] * (len(self.buckets) + 1)
+        for bucket_counts, _, _ in selected:
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    # Beyond the last bound there is nothing to interpolate against
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.merged().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        # Derived from the lookup counter rather than tracked separately
+        lines.append("# HELP multiagent_cache_hit_ratio Share of cache lookups that were hits")
+        lines.append("# TYPE multiagent_cache_hit_ratio gauge")
+        for cache, ratio in sorted(cache_hit_ratios().items()):
+            lines.append(f'multiagent_cache_hit_ratio{{cache="{_escape(cache)}"}} {_number(ratio)}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+RUNS = REGISTRY.counter(
+    "multiagent_runs_total", "Completed runs", ("cache_hit",)
+)
+RUNS_IN_FLIGHT = REGISTRY.gauge(
+    "multiagent_runs_in_flight", "Runs started and not yet finished"
+)
+RUN_LATENCY = REGISTRY.histogram(
+    "multiagent_run_latency_seconds", "End-to-end run latency"
+)
+AGENT_LATENCY = REGISTRY.histogram(
+    "multiagent_agent_latency_seconds", "Latency of each agent step", ("agent",)
+)
+AGENT_ERRORS = REGISTRY.counter(
+    "multiagent_agent_errors_total", "Failed agent steps", ("agent",)
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "multiagent_llm_latency_seconds", "Latency of each LLM call", ("agent",)
+)
+LLM_TOKENS = REGISTRY.histogram(
+    "multiagent_llm_tokens", "Tokens per LLM call", ("agent", "direction"), buckets=TOKEN_BUCKETS
+)
+RETRIEVAL_LATENCY = REGISTRY.histogram(
+    "multiagent_retrieval_latency_seconds", "Latency of batched retrieval, rerank and dedup"
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "multiagent_cache_lookups_total", "Cache lookups", ("cache", "result")
+)
+LLM_RETRIES = REGISTRY.counter(
+    "multiagent_llm_retries_total", "LLM calls retried after a transient failure", ("reason",)
+)
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "multiagent_rate_limit_wait_seconds", "Time LLM calls waited for rate-limit capacity"
+)
+BATCH_SEARCH_FALLBACKS = REGISTRY.counter(
+    "multiagent_batch_search_fallbacks_total", "run_batch groups whose pooled search failed and retrieved per request"
+)
+JOBS = REGISTRY.counter(
+    "multiagent_jobs_total", "Jobs finished by the HTTP service", ("status",)
+)
+JOBS_QUEUED = REGISTRY.gauge(
+    "multiagent_jobs_queued", "Jobs accepted by the HTTP service and waiting for a worker"
+)
+JOBS_REJECTED = REGISTRY.counter(
+    "multiagent_jobs_rejected_total", "Submissions refused by admission control", ("reason",)
+)
+JOB_QUEUE_WAIT = REGISTRY.histogram(
+    "multiagent_job_queue_wait_seconds", "Time jobs waited in the backlog before starting"
+)
+
+
+def cache_hit_ratios() -> Dict[str, float]:
+    totals = {}
+    for (cache, result), value in CACHE_LOOKUPS.values().items():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if result == "hit" else 0), lookups + value)
+    return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port: int = None, host: str = "0.0.0.0"):
+    """Start the /metrics endpoint on a daemon thread (once per process)"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            port = port if port is not None else int(os.getenv("METRICS_PORT", "9464"))
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def stop_serving():
+    """Shut down the /metrics endpoint started by serve(), if any"""
+    global _server
+    with _server_lock:
+        server, _server = _server, None
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -1,12 +1,161 @@
+import json
+import os
+import threading
 import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Dict, Any
 
-class AgentObservability:
-    
-    def __init__(self):
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+import tracing
+import metrics
+
+# The run the current request belongs to. Context variables follow each request
+# through LangGraph's worker threads, so concurrent runs never share a trace.
+_current_run = ContextVar("observability_run", default=None)
+
+
+class RunTrace:
+    """Traces and running totals for a single run"""
+
+    def __init__(self, owner, run_id: str):
+        self.owner = owner
+        self.run_id = run_id
+        self.started_at = datetime.now().isoformat()
+        self._lock = threading.Lock()
+
         self.traces = []
+        self.agents_executed = 0
+        self.total_latency = 0.0
+        self.total_tokens = 0
+        self.errors = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rerank = {
+            "queries": 0,
+            "latency_seconds": 0.0,
+            "tokens_packed": 0,
+            "tokens_dropped": 0,
+            "tokens_saved": 0
+        }
+        self.near_duplicates_suppressed = 0
+        self.prompt_packing = {}
+        self.timing = {"duration_seconds": None, "ttft_seconds": None}
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "total_agents_executed": self.agents_executed,
+                "total_latency_seconds": round(self.total_latency, 2),
+                "total_tokens_used": self.total_tokens,
+                "error_count": len(self.errors),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "near_duplicates_suppressed": self.near_duplicates_suppressed,
+                "timing": dict(self.timing),
+                "prompt_packing": {name: dict(totals) for name, totals in self.prompt_packing.items()},
+                "rerank": {**self.rerank, "latency_seconds": round(self.rerank["latency_seconds"], 3)},
+                "errors": list(self.errors),
+                "detailed_trace": list(self.traces)
+            }
+
+
+class LLMCall:
+    """Handle for one LLM call inside AgentObservability.llm_call()"""
+
+    def __init__(self, agent_name: str, span):
+        self.agent_name = agent_name
+        self.span = span
+
+    def set_attribute(self, key: str, value):
+        self.span.set_attribute(key, value)
+
+    def record(self, response):
+        attributes = tracing.llm_attributes(response)
+        self.span.set_attributes(attributes)
+        metrics.LLM_TOKENS.observe(attributes["llm.input_tokens"], agent=self.agent_name, direction="input")
+        metrics.LLM_TOKENS.observe(attributes["llm.output_tokens"], agent=self.agent_name, direction="output")
+
+
+class AgentObservability:
+    """Per-run agent traces
+
+    Each run() opens its own RunTrace via run_scope(); every log_* call goes to
+    the run active in the caller's context. Totals are kept as running
+    aggregates, so get_summary() doesn't rescan traces. Finished runs are kept
+    in a ring buffer of OBS_MAX_RUNS summaries and, if OBS_SINK_PATH is set,
+    appended to that file as JSON lines. Calls made outside any run (e.g. from
+    the test scripts) go to a standing ad-hoc run, which is archived and
+    replaced once it holds OBS_ADHOC_MAX_TRACES traces.
+    """
+
+    def __init__(self, max_runs: int = None, sink_path: str = None, max_adhoc_traces: int = None):
+        self.completed = deque(maxlen=max_runs or int(os.getenv("OBS_MAX_RUNS", "50")))
+        self.sink_path = sink_path or os.getenv("OBS_SINK_PATH")
+        self.max_adhoc_traces = max_adhoc_traces or int(os.getenv("OBS_ADHOC_MAX_TRACES", "1000"))
+        self._sink_lock = threading.Lock()
+        self._adhoc_lock = threading.Lock()
+        self._adhoc = RunTrace(self, "adhoc")
+
+    @contextmanager
+    def run_scope(self, run_id: str = None):
+        """Open a run for the current context and archive it on exit"""
+        run = RunTrace(self, run_id or uuid.uuid4().hex)
+        token = _current_run.set(run)
+        metrics.RUNS_IN_FLIGHT.inc()
+        try:
+            yield run
+        finally:
+            metrics.RUNS_IN_FLIGHT.dec()
+            try:
+                _current_run.reset(token)
+            except ValueError:
+                # A streaming generator closed from another context
+                pass
+            self._archive(run)
+
+    @contextmanager
+    def llm_call(self, agent_name: str, **attributes):
+        """Span plus latency/token metrics around one LLM call; report it with record(response)"""
+        start = time.perf_counter()
+        try:
+            with tracing.span("llm.call", {"agent": agent_name, **attributes}) as span:
+                yield LLMCall(agent_name, span)
+        finally:
+            metrics.LLM_LATENCY.observe(time.perf_counter() - start, agent=agent_name)
     
+    @property
+    def current(self) -> RunTrace:
+        run = _current_run.get()
+        if run is not None and run.owner is self:
+            return run
+        
+        adhoc = self._adhoc
+        if len(adhoc.traces) < self.max_adhoc_traces:
+            return adhoc
+        # Nothing outside a run_scope is ever archived on exit, so a
+        # long-lived process rolls the ad-hoc run over instead
+        with self._adhoc_lock:
+            full = self._adhoc is adhoc
+            if full:
+                self._adhoc = RunTrace(self, "adhoc")
+        if full:
+            self._archive(adhoc)
+        return self._adhoc
+
+    @property
+    def traces(self) -> list:
+        return self.current.traces
+
+    def recent_runs(self) -> list:
+        """Summaries of finished runs, oldest first"""
+        return list(self.completed)
+
     def log_agent_start(self, agent_name: str, input_data: Dict[str, Any]) -> float:
         start_time = time.time()
         trace = {
@@ -16,10 +165,14 @@ class AgentObservability:
             "input_preview": str(input_data)[:100],
             "start_time": start_time
         }
-        self.traces.append(trace)
+        run = self.current
+        with run._lock:
+            run.traces.append(trace)
+            run.agents_executed += 1
+        tracing.start_span(f"agent.{agent_name.lower()}", {"agent": agent_name})
         return start_time
-    
-    def log_agent_end(self, agent_name: str, start_time: float, 
+
+    def log_agent_end(self, agent_name: str, start_time: float,
                       output_data: Dict[str, Any], tokens: int = 0, error: str = None):
         latency = time.time() - start_time
         trace = {
@@ -31,19 +184,68 @@ class AgentObservability:
             "output_preview": str(output_data)[:100] if output_data else None,
             "error": error
         }
-        self.traces.append(trace)
+        run = self.current
+        with run._lock:
+            run.traces.append(trace)
+            run.total_latency += trace["latency_seconds"]
+            run.total_tokens += tokens
+            if error:
+                run.errors.append(trace)
+        metrics.AGENT_LATENCY.observe(latency, agent=agent_name)
+        if error:
+            metrics.AGENT_ERRORS.inc(agent=agent_name)
+        tracing.end_span(f"agent.{agent_name.lower()}", {"tokens": tokens}, error=error)
         return trace
-    
+
+    def log_cache_lookup(self, agent_name: str, hit: bool):
+        metrics.CACHE_LOOKUPS.inc(cache="llm", result="hit" if hit else "miss")
+        run = self.current
+        with run._lock:
+            if hit:
+                run.cache_hits += 1
+            else:
+                run.cache_misses += 1
+
+    def log_rerank(self, queries: int, latency: float, tokens_packed: int,
+                   tokens_dropped: int, baseline_tokens: int):
+        """baseline_tokens is what the old fixed top-4 would have sent for the same queries"""
+        run = self.current
+        with run._lock:
+            run.rerank["queries"] += queries
+            run.rerank["latency_seconds"] += latency
+            run.rerank["tokens_packed"] += tokens_packed
+            run.rerank["tokens_dropped"] += tokens_dropped
+            run.rerank["tokens_saved"] += baseline_tokens - tokens_packed
+
+    def log_dedup(self, suppressed: int):
+        run = self.current
+        with run._lock:
+            run.near_duplicates_suppressed += suppressed
+
+    def log_prompt_pack(self, agent_name: str, tokens_packed: int, tokens_dropped: int):
+        run = self.current
+        with run._lock:
+            totals = run.prompt_packing.setdefault(agent_name, {"tokens_packed": 0, "tokens_dropped": 0})
+            totals["tokens_packed"] += tokens_packed
+            totals["tokens_dropped"] += tokens_dropped
+
+    def log_run_timing(self, duration: float, ttft: float = None, cache_hit: bool = False):
+        """ttft is the time from the request to the writer's first streamed token"""
+        metrics.RUNS.inc(cache_hit=str(cache_hit).lower())
+        metrics.RUN_LATENCY.observe(duration)
+        run = self.current
+        with run._lock:
+            run.timing = {
+                "duration_seconds": round(duration, 3),
+                "ttft_seconds": round(ttft, 3) if ttft is not None else None
+            }
+
     def get_summary(self):
-        total_latency = sum(t.get('latency_seconds', 0) for t in self.traces)
-        total_tokens = sum(t.get('tokens_used', 0) for t in self.traces)
-        errors = [t for t in self.traces if t.get('error')]
-        
-        return {
-            "total_agents_executed": len([t for t in self.traces if t['status'] == 'started']),
-            "total_latency_seconds": round(total_latency, 2),
-            "total_tokens_used": total_tokens,
-            "error_count": len(errors),
-            "errors": errors,
-            "detailed_trace": self.traces
-        }
\ No newline at end of file
+        return self.current.summary()
+
+    def _archive(self, run: RunTrace):
+        summary = run.summary()
+        self.completed.append(summary)
+        if self.sink_path:
+            with self._sink_lock, open(self.sink_path, "a") as f:
+                f.write(json.dumps(summary, default=str) + "\n")
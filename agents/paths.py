@@ -0,0 +1,13 @@
+"""Puts retrieval/ on sys.path, for the agents' bare-name imports of its modules
+
+The agents are run as scripts from agents/, so they import vector_store,
+tracing, tokens and the rest by module name. Importing this is the one
+place that path is set up, and it adds nothing else to the import.
+"""
+import os
+import sys
+
+RETRIEVAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'retrieval')
+
+if RETRIEVAL_DIR not in sys.path:
+    sys.path.append(RETRIEVAL_DIR)
@@ -1,8 +1,9 @@
-from langchain_anthropic import ChatAnthropic
 from langchain.prompts import ChatPromptTemplate
 from state import AgentState
 from observability import AgentObservability
-import os
+from llm_cache import LLMResponseCache, with_cache
+from budget import RunBudget, with_budget
+import resources
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -11,11 +12,10 @@ load_dotenv(dotenv_path=env_path)
 
 class PlannerAgent:
     
-    def __init__(self, observability: AgentObservability):
-        self.llm = ChatAnthropic(
-            model=os.getenv("MODEL_NAME", "claude-sonnet-4-20250514"),
-            temperature=0.2,
-            api_key=os.getenv("ANTHROPIC_API_KEY")
+    def __init__(self, observability: AgentObservability, cache: LLMResponseCache = None,
+                 budget: RunBudget = None):
+        self.llm = with_cache(
+            with_budget(resources.get_llm(temperature=0.2), budget), cache, observability, "Planner"
         )
         self.obs = observability
         
@@ -44,54 +44,78 @@ RESEARCH_QUERIES:
             ("human", "User Request: {query}\nOutput Mode: {mode}")
         ])
     
-    def plan(self, state: AgentState) -> AgentState:
-        start_time = self.obs.log_agent_start("Planner", {
-            "query": state["user_query"],
-            "mode": state["output_mode"]
-        })
+    def plan(self, state: AgentState) -> dict:
+        start_time = self._start(state)
         
         try:
-            response = self.llm.invoke(
-                self.prompt.format_messages(
-                    query=state["user_query"],
-                    mode=state["output_mode"]
-                )
-            )
-            
-            content = response.content
-            
-            if "RESEARCH_QUERIES:" in content:
-                plan_section = content.split("RESEARCH_QUERIES:")[0].replace("EXECUTION_PLAN:", "").strip()
-                queries_section = content.split("RESEARCH_QUERIES:")[1].strip()
-            else:
-                plan_section = content
-                queries_section = ""
-            
-            queries = []
-            for line in queries_section.split("\n"):
-                line = line.strip()
-                if line and len(line) > 0 and line[0].isdigit():
-                    if ". " in line:
-                        query = line.split(". ", 1)[1]
-                    else:
-                        query = line
-                    queries.append(query.strip())
-            
-            state["execution_plan"] = plan_section
-            state["research_queries"] = queries
-            state["current_agent"] = "Planner"
+            with self.obs.llm_call("Planner") as call:
+                response = self.llm.invoke(self._messages(state))
+                call.record(response)
+            return self._apply(state, response, start_time)
             
-            usage = response.response_metadata.get('usage', {})
-            tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
-            
-            self.obs.log_agent_end("Planner", start_time, {
-                "plan_length": len(plan_section),
-                "query_count": len(queries)
-            }, tokens=tokens)
-            
-            return state
+        except Exception as e:
+            return self._fail(state, start_time, e)
+    
+    async def aplan(self, state: AgentState) -> dict:
+        """Async counterpart of plan(), for arun()"""
+        start_time = self._start(state)
+        
+        try:
+            with self.obs.llm_call("Planner") as call:
+                response = await self.llm.ainvoke(self._messages(state))
+                call.record(response)
+            return self._apply(state, response, start_time)
             
         except Exception as e:
-            self.obs.log_agent_end("Planner", start_time, None, error=str(e))
-            state["error_log"].append(f"Planner error: {str(e)}")
-            return state
\ No newline at end of file
+            return self._fail(state, start_time, e)
+    
+    def _start(self, state: AgentState) -> float:
+        return self.obs.log_agent_start("Planner", {
+            "query": state["user_query"],
+            "mode": state["output_mode"]
+        })
+    
+    def _messages(self, state: AgentState) -> list:
+        return self.prompt.format_messages(
+            query=state["user_query"],
+            mode=state["output_mode"]
+        )
+    
+    def _apply(self, state: AgentState, response, start_time: float) -> dict:
+        """Parse the plan and research queries out of the response, as the node's state update"""
+        content = response.content
+        
+        if "RESEARCH_QUERIES:" in content:
+            plan_section = content.split("RESEARCH_QUERIES:")[0].replace("EXECUTION_PLAN:", "").strip()
+            queries_section = content.split("RESEARCH_QUERIES:")[1].strip()
+        else:
+            plan_section = content
+            queries_section = ""
+        
+        queries = []
+        for line in queries_section.split("\n"):
+            line = line.strip()
+            if line and len(line) > 0 and line[0].isdigit():
+                if ". " in line:
+                    query = line.split(". ", 1)[1]
+                else:
+                    query = line
+                queries.append(query.strip())
+        
+        usage = response.response_metadata.get('usage', {})
+        tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        
+        self.obs.log_agent_end("Planner", start_time, {
+            "plan_length": len(plan_section),
+            "query_count": len(queries)
+        }, tokens=tokens)
+        
+        return {
+            "execution_plan": plan_section,
+            "research_queries": queries,
+            "current_agent": "Planner"
+        }
+    
+    def _fail(self, state: AgentState, start_time: float, e: Exception) -> dict:
+        self.obs.log_agent_end("Planner", start_time, None, error=str(e))
+        return {"error_log": [f"Planner error: {str(e)}"]}
\ No newline at end of file
@@ -0,0 +1,120 @@
+from typing import Callable, Dict, List
+from state import ResearchNote
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+from tokens import count_tokens, truncate_to_tokens
+
+# Room left for the model's answer when a run cost ceiling caps the prompt
+OUTPUT_RESERVE_TOKENS = 1024
+
+
+class PromptPacker:
+    """Fits the variable parts of a prompt into a token budget
+
+    The budget is split across named sections by share. A section that needs
+    less than its share hands the slack to the others. Research notes are
+    packed for coverage first: every note gets an equal slice before the
+    leftover goes to the highest-confidence notes. Notes are dropped outright
+    only when even their headers and citations don't fit.
+    """
+
+    def __init__(self, budget_tokens: int, shares: Dict[str, float]):
+        self.budget_tokens = budget_tokens
+        self.shares = shares
+
+    def pack(self, sections: Dict[str, object], render_note: Callable = None, limit: int = None) -> dict:
+        """Pack sections (name -> text, or list of notes for "notes") into the budget
+
+        limit caps the budget further, e.g. with the tokens left under a run
+        cost ceiling. Returns the packed text per section plus token counts.
+        """
+        budget = self.budget_tokens
+        if limit is not None:
+            budget = min(budget, limit - OUTPUT_RESERVE_TOKENS)
+        budget = max(budget, 0)
+
+        sizes = {}
+        for name, value in sections.items():
+            if name == "notes":
+                sizes[name] = sum(count_tokens(render_note(i, note, note["content"])) for i, note in enumerate(value))
+            else:
+                sizes[name] = count_tokens(value)
+
+        allocation = self._allocate(sizes, budget)
+
+        packed = {}
+        used = 0
+        for name, value in sections.items():
+            if name == "notes":
+                text, section_used = self._pack_notes(value, allocation[name], render_note)
+            else:
+                text = truncate_to_tokens(value, allocation[name])
+                section_used = min(sizes[name], allocation[name])
+            packed[name] = text
+            used += section_used
+
+        total = sum(sizes.values())
+        return {
+            "sections": packed,
+            "budget": budget,
+            "tokens_packed": used,
+            "tokens_dropped": max(total - used, 0)
+        }
+
+    def _allocate(self, sizes: Dict[str, int], budget: int) -> Dict[str, int]:
+        allocation = {name: 0 for name in sizes}
+        pending = dict(sizes)
+        remaining = budget
+
+        # Repeatedly satisfy sections smaller than their share, then split what's left
+        while pending and remaining > 0:
+            total_share = sum(self.shares.get(name, 0) for name in pending) or 1
+            fair = {name: int(remaining * self.shares.get(name, 0) / total_share) for name in pending}
+            satisfied = [name for name in pending if pending[name] <= fair[name]]
+            if not satisfied:
+                for name in pending:
+                    allocation[name] = fair[name]
+                break
+            for name in satisfied:
+                allocation[name] = pending.pop(name)
+                remaining -= allocation[name]
+
+        return allocation
+
+    def _pack_notes(self, notes: List[ResearchNote], budget: int, render_note: Callable) -> tuple:
+        if not notes:
+            return "", 0
+
+        # Highest-confidence notes are kept first when space runs out
+        priority = sorted(
+            range(len(notes)),
+            key=lambda i: (-max((c["score"] for c in notes[i]["citations"]), default=0.0), notes[i]["query_index"])
+        )
+
+        overhead = {i: count_tokens(render_note(i, notes[i], "")) for i in priority}
+        kept = []
+        for i in priority:
+            if sum(overhead[j] for j in kept) + overhead[i] <= budget:
+                kept.append(i)
+
+        remaining = budget - sum(overhead[i] for i in kept)
+        content_size = {i: count_tokens(notes[i]["content"]) for i in kept}
+
+        # Coverage: an equal slice per note, then leftover in confidence order
+        share = remaining // len(kept) if kept else 0
+        allowance = {i: min(content_size[i], share) for i in kept}
+        leftover = remaining - sum(allowance.values())
+        for i in kept:
+            extra = min(content_size[i] - allowance[i], leftover)
+            allowance[i] += extra
+            leftover -= extra
+
+        rendered = []
+        used = 0
+        for position, i in enumerate(sorted(kept, key=lambda i: notes[i]["query_index"])):
+            content = notes[i]["content"]
+            if allowance[i] < content_size[i]:
+                content = truncate_to_tokens(content, allowance[i]) + "..."
+            rendered.append(render_note(position, notes[i], content))
+            used += overhead[i] + allowance[i]
+
+        return "\n\n".join(rendered), used
@@ -0,0 +1,395 @@
+"""Client-side rate limiting and retries for Anthropic calls
+
+Anthropic limits each API key by requests and tokens per minute. Every
+HealthcareMultiAgentSystem in the process shares one RateLimiter, so
+concurrent runs (e.g. the eval harness or run_batch) queue for capacity
+here instead of tripping 429s; LLM_MAX_CONCURRENCY additionally caps the
+calls in flight at once. Calls that still fail with 429, 529 or another
+5xx are retried with jittered exponential backoff.
+
+Async callers (ainvoke/astream) wait with asyncio.sleep, or on a future
+for a free slot, so queueing for capacity never blocks the event loop.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import anthropic
+
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+from tokens import count_tokens
+import metrics
+
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class TokenBucket:
+    """Refills at rate_per_minute / 60 per second up to one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, amount: float) -> float:
+        """Take amount if it is available; otherwise the seconds to wait before trying again"""
+        with self._lock:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return min((amount - self.level) / self.rate, 1.0)
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until amount is available and take it; returns the seconds waited
+
+        A request larger than the whole bucket waits for a full bucket rather
+        than forever.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def aacquire(self, amount: float = 1) -> float:
+        """acquire() for coroutines"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float):
+        """Take (or with a negative amount, give back) capacity without waiting
+
+        The level may go negative, which holds back later callers until the
+        debt is refilled.
+        """
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class ConcurrencySlots:
+    """A counting semaphore that threads and coroutines, on any event loop, wait on together
+
+    A freed slot is handed straight to the longest waiter: a thread through
+    its Event, a coroutine by resolving its future on its own loop. Nobody
+    polls, and the slot can't be taken by a newcomer in between.
+    """
+
+    def __init__(self, count: int):
+        self._free = count
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take(self, waiter) -> bool:
+        """Take a free slot, or queue waiter for the next one; True when a slot was taken"""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def acquire(self):
+        event = threading.Event()
+        if not self._take(event):
+            event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._take((loop, future)):
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = (loop, future) in self._waiters
+                if queued:
+                    self._waiters.remove((loop, future))
+            if not queued:
+                # release() had already handed us the slot; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._free += 1
+                    return
+                waiter = self._waiters.popleft()
+            if isinstance(waiter, threading.Event):
+                waiter.set()
+                return
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+                return
+            except RuntimeError:
+                # Its loop has closed; try the next waiter
+                continue
+
+
+def _resolve(future: asyncio.Future):
+    # A waiter cancelled meanwhile hands the slot on itself (see aacquire)
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one API key,
+    plus an optional cap on calls in flight
+
+    Token usage isn't known until a call returns, so each call reserves an
+    estimate (prompt tokens plus max_tokens) up front and settles the
+    difference once the real usage is reported.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 max_concurrency: int = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.slots = ConcurrencySlots(max_concurrency) if max_concurrency else None
+
+    @classmethod
+    def from_env(cls):
+        """Limits from ANTHROPIC_RPM / ANTHROPIC_TPM / LLM_MAX_CONCURRENCY; None when none is set"""
+        rpm = os.getenv("ANTHROPIC_RPM")
+        tpm = os.getenv("ANTHROPIC_TPM")
+        concurrency = os.getenv("LLM_MAX_CONCURRENCY")
+        if not rpm and not tpm and not concurrency:
+            return None
+        return cls(float(rpm) if rpm else None, float(tpm) if tpm else None,
+                   int(concurrency) if concurrency else None)
+
+    def acquire(self, estimated_tokens: int):
+        """Wait for request and token capacity, then for a free slot; pair with release()"""
+        start = time.monotonic()
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(estimated_tokens)
+        if self.slots:
+            self.slots.acquire()
+        self._observe(time.monotonic() - start)
+
+    async def aacquire(self, estimated_tokens: int):
+        """acquire() for coroutines; a free slot is awaited, not blocked on"""
+        start = time.monotonic()
+        if self.requests:
+            await self.requests.aacquire(1)
+        if self.tokens:
+            await self.tokens.aacquire(estimated_tokens)
+        if self.slots:
+            await self.slots.aacquire()
+        self._observe(time.monotonic() - start)
+
+    @staticmethod
+    def _observe(waited: float):
+        if waited > 0.001:
+            metrics.RATE_LIMIT_WAIT.observe(waited)
+
+    def release(self, estimated_tokens: int, actual_tokens: int):
+        """Free the call's slot and settle its token reservation against actual usage"""
+        if self.slots:
+            self.slots.release()
+        if self.tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring retry-after when the API sends it"""
+
+    def __init__(self, max_retries: int = None, base_delay: float = None, max_delay: float = None):
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "4"))
+        self.base_delay = base_delay or float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+        self.max_delay = max_delay or float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+
+    @staticmethod
+    def retry_reason(error: Exception):
+        """"rate_limit", "overloaded", "server_error" or "connection" for retryable errors, else None"""
+        if isinstance(error, anthropic.APIConnectionError):
+            return "connection"
+        status = getattr(error, "status_code", None)
+        if status is None:
+            return None
+        if status == 429:
+            return "rate_limit"
+        if status == 529:
+            return "overloaded"
+        if status >= 500 or status in RETRYABLE_STATUS:
+            return "server_error"
+        return None
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class RateLimitedLLM:
+    """Wraps a chat model so every request waits for rate-limit capacity and retries transient failures"""
+
+    def __init__(self, llm, limiter: RateLimiter = None, retry: RetryPolicy = None):
+        self.llm = llm
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy()
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _estimate(self, messages) -> int:
+        prompt = sum(count_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+        return prompt + (getattr(self.llm, "max_tokens", None) or 1024)
+
+    def _acquire(self, messages) -> int:
+        estimate = self._estimate(messages) if self.limiter else 0
+        if self.limiter:
+            self.limiter.acquire(estimate)
+        return estimate
+
+    async def _aacquire(self, messages) -> int:
+        estimate = self._estimate(messages) if self.limiter else 0
+        if self.limiter:
+            await self.limiter.aacquire(estimate)
+        return estimate
+
+    def _release(self, estimate: int, usage: dict):
+        if self.limiter:
+            self.limiter.release(estimate, usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+
+    def _retry_delay(self, attempt: int, error: Exception):
+        """Seconds to wait before the next attempt, or None when error isn't worth retrying"""
+        reason = self.retry.retry_reason(error)
+        if reason is None or attempt >= self.retry.max_retries:
+            return None
+        delay = self.retry.delay(attempt, error)
+        metrics.LLM_RETRIES.inc(reason=reason)
+        print(f"LLM call failed ({reason}), retrying in {delay:.1f}s: {str(error)[:100]}")
+        return delay
+
+    def _backoff(self, attempt: int, error: Exception) -> bool:
+        """Sleep before the next attempt; False when error isn't worth retrying"""
+        delay = self._retry_delay(attempt, error)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    async def _abackoff(self, attempt: int, error: Exception) -> bool:
+        delay = self._retry_delay(attempt, error)
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    def invoke(self, messages, **kwargs):
+        attempt = 0
+        while True:
+            estimate = self._acquire(messages)
+            try:
+                response = self.llm.invoke(messages, **kwargs)
+            except Exception as e:
+                # The token reservation is returned; the request itself still counts
+                self._release(estimate, {})
+                if not self._backoff(attempt, e):
+                    raise
+                attempt += 1
+                continue
+            self._release(estimate, response.response_metadata.get("usage", {}))
+            return response
+
+    async def ainvoke(self, messages, **kwargs):
+        attempt = 0
+        while True:
+            estimate = await self._aacquire(messages)
+            try:
+                response = await self.llm.ainvoke(messages, **kwargs)
+            except Exception as e:
+                self._release(estimate, {})
+                if not await self._abackoff(attempt, e):
+                    raise
+                attempt += 1
+                continue
+            self._release(estimate, response.response_metadata.get("usage", {}))
+            return response
+
+    def stream(self, messages, **kwargs):
+        """Only failures before the first chunk are retried; later ones would duplicate output"""
+        attempt = 0
+        while True:
+            estimate = self._acquire(messages)
+            usage = {"input_tokens": 0, "output_tokens": 0}
+            started = False
+            failed = None
+            try:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    started = True
+                    for key, value in (chunk.usage_metadata or {}).items():
+                        if key in usage:
+                            usage[key] += value
+                    yield chunk
+            except Exception as e:
+                failed = e
+            finally:
+                # Also reached when the consumer abandons the stream
+                self._release(estimate, usage)
+            if failed is None:
+                return
+            if started or not self._backoff(attempt, failed):
+                raise failed
+            attempt += 1
+
+    async def astream(self, messages, **kwargs):
+        attempt = 0
+        while True:
+            estimate = await self._aacquire(messages)
+            usage = {"input_tokens": 0, "output_tokens": 0}
+            started = False
+            failed = None
+            try:
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    started = True
+                    for key, value in (chunk.usage_metadata or {}).items():
+                        if key in usage:
+                            usage[key] += value
+                    yield chunk
+            except Exception as e:
+                failed = e
+            finally:
+                self._release(estimate, usage)
+            if failed is None:
+                return
+            if started or not await self._abackoff(attempt, failed):
+                raise failed
+            attempt += 1
+
+
+def with_rate_limit(llm, limiter: RateLimiter = None, retry: RetryPolicy = None):
+    """Return llm behind the shared limiter and retry policy"""
+    return RateLimitedLLM(llm, limiter, retry)
@@ -1,29 +1,89 @@
-from langchain_anthropic import ChatAnthropic
 from langchain.prompts import ChatPromptTemplate
-from state import AgentState, ResearchNote
+from langgraph.constants import Send
+from state import AgentState, ResearchNote, ResearchTask, Citation
 from observability import AgentObservability
-import sys
+from llm_cache import LLMResponseCache, with_cache
+from budget import RunBudget, with_budget
+import resources
+import tracing
+import metrics
+from reranker import pack_by_tokens
+from dedup import ChunkDeduplicator
+from tokens import count_tokens
+from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+import asyncio
+import contextvars
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from retrieval.vector_store import HealthcareVectorStore
+# The run_batch the current request belongs to; unset outside a batch
+_current_batch = ContextVar("research_batch", default=None)
+
+
+class ResearchBatch:
+    """Research state shared by the requests of one run_batch
+    
+    Syntheses with the same query and chunks are made once for the whole
+    batch. Branches run on the batch's own pool, so research keeps up with
+    the batch's concurrency instead of queueing for RESEARCH_MAX_CONCURRENCY.
+    """
+    
+    def __init__(self, max_workers: int):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-research")
+        self._syntheses = {}
+        self._lock = threading.Lock()
+    
+    def claim(self, key) -> tuple:
+        """(future, True) for the first caller with key, who must resolve it; (future, False) after"""
+        with self._lock:
+            if key in self._syntheses:
+                return self._syntheses[key], False
+            future = self._syntheses[key] = Future()
+            return future, True
+    
+    def activate(self):
+        """Make this the batch of the caller's context and every context copied from it"""
+        _current_batch.set(self)
+    
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
 
 class ResearchAgent:
     
-    def __init__(self, observability: AgentObservability):
-        self.llm = ChatAnthropic(
-            model=os.getenv("MODEL_NAME", "claude-sonnet-4-20250514"),
-            temperature=0.1,
-            api_key=os.getenv("ANTHROPIC_API_KEY")
+    def __init__(self, observability: AgentObservability, cache: LLMResponseCache = None,
+                 max_concurrency: int = None, query_timeout: float = None, budget: RunBudget = None):
+        self.llm = with_cache(
+            with_budget(resources.get_llm(temperature=0.1), budget), cache, observability, "Research"
         )
         self.obs = observability
-        self.vector_store = HealthcareVectorStore(persist_directory="../chroma_db")
-        self.vector_store.load_vectorstore()
+        self.vector_store = resources.get_vector_store("../chroma_db")
+        self.retriever = resources.get_retriever("../chroma_db")
+        self.reranker = resources.get_reranker()
+        # With a reranker: over-fetch candidates, rerank, then pack up to the token budget
+        self.candidates = int(os.getenv("RERANK_CANDIDATES", "30"))
+        self.token_budget = int(os.getenv("RESEARCH_TOKEN_BUDGET", "1000"))
+        self.dedup = None
+        if os.getenv("DEDUP", "on").lower() not in ("off", "false", "0"):
+            self.dedup = ChunkDeduplicator(
+                self.vector_store,
+                lambda_mult=float(os.getenv("MMR_LAMBDA", "0.7")),
+                max_hamming=int(os.getenv("DEDUP_MAX_HAMMING", "8"))
+            )
+        
+        # Caps in-flight research queries across all branches and runs;
+        # max_concurrency=1 keeps the original one-query-at-a-time behaviour
+        self.max_concurrency = max_concurrency or int(os.getenv("RESEARCH_MAX_CONCURRENCY", "4"))
+        self.query_timeout = query_timeout or float(os.getenv("RESEARCH_QUERY_TIMEOUT", "60"))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency)
         
         self.synthesis_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a research synthesis agent.
@@ -41,57 +101,320 @@ Retrieved Documents:
 Extract 2-3 key findings with sources.""")
         ])
     
+    def retrieve(self, state: AgentState) -> dict:
+        """Graph node: retrieve for the whole plan at once, before the fan-out
+        
+        Doing this in one place lets near-duplicate chunks be suppressed across
+        planner queries, not just within one. If it fails, the branches fall
+        back to retrieving their own query.
+        """
+        try:
+            # run_batch searches for all of its requests at once and leaves the candidates in state
+            candidates = state.get("retrieval_candidates")
+            return {"retrieval_results": self._retrieve_batch(state["research_queries"], candidates)}
+        except Exception as e:
+            return {
+                "retrieval_results": [],
+                "error_log": [f"Research error (batch retrieval, retrying per query): {str(e)}"]
+            }
+    
+    def fan_out(self, state: AgentState) -> list:
+        """Route each planner query to its own research branch"""
+        queries = state["research_queries"]
+        if not queries:
+            return ["research_reduce"]
+        
+        retrieved = state.get("retrieval_results") or []
+        if len(retrieved) != len(queries):
+            retrieved = [None] * len(queries)
+        
+        return [
+            Send("research_query", {"query": query, "query_index": i, "hits": hits})
+            for i, (query, hits) in enumerate(zip(queries, retrieved))
+        ]
+    
+    def research_query(self, task: ResearchTask) -> dict:
+        """Graph node for a single research branch
+        
+        Failures stay inside the branch: the other queries' notes still reach
+        the writer and the error is recorded in the shared error log.
+        """
+        start_time = self._start_branch(task)
+        
+        try:
+            if task.get("hits") is not None:
+                notes, tokens = self._run_with_timeout(
+                    self._synthesize, task["query"], task["query_index"], task["hits"]
+                )
+            else:
+                notes, tokens = self._run_with_timeout(
+                    self._research_query, task["query"], task["query_index"]
+                )
+            return self._end_branch(task, start_time, notes, tokens)
+            
+        except Exception as e:
+            return self._fail_branch(task, start_time, e)
+    
+    async def aretrieve(self, state: AgentState) -> dict:
+        """Async counterpart of retrieve(); the embedding model and Chroma run in a worker thread"""
+        return await asyncio.to_thread(self.retrieve, state)
+    
+    async def aresearch_query(self, task: ResearchTask) -> dict:
+        """Async counterpart of research_query(), for arun()
+        
+        The synthesis call is awaited on the event loop instead of going
+        through the research pool; the graph's max_concurrency bounds one
+        run's branches and LLM_MAX_CONCURRENCY the calls across runs.
+        """
+        start_time = self._start_branch(task)
+        
+        try:
+            try:
+                notes, tokens = await asyncio.wait_for(self._aresearch(task), self.query_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"timed out after {self.query_timeout}s")
+            return self._end_branch(task, start_time, notes, tokens)
+            
+        except Exception as e:
+            return self._fail_branch(task, start_time, e)
+    
+    def _start_branch(self, task: ResearchTask) -> float:
+        return self.obs.log_agent_start("Research", {
+            "query": task["query"],
+            "query_index": task["query_index"]
+        })
+    
+    def _end_branch(self, task: ResearchTask, start_time: float, notes: list, tokens: int) -> dict:
+        self.obs.log_agent_end("Research", start_time, {
+            "query_index": task["query_index"],
+            "citations": sum(len(n["citations"]) for n in notes)
+        }, tokens=tokens)
+        
+        return {"research_notes": notes}
+    
+    def _fail_branch(self, task: ResearchTask, start_time: float, e: Exception) -> dict:
+        error = str(e) or type(e).__name__
+        self.obs.log_agent_end("Research", start_time, None, error=error)
+        return {"error_log": [f"Research error ('{task['query']}'): {error}"]}
+    
+    def research_reduce(self, state: AgentState) -> dict:
+        """Join point for the research branches before the writer runs"""
+        return {"current_agent": "Research"}
+    
+    async def aresearch_reduce(self, state: AgentState) -> dict:
+        # Async so the join doesn't take a trip through the default executor
+        return self.research_reduce(state)
+    
     def research(self, state: AgentState) -> AgentState:
+        """Run every planner query outside the graph, e.g. from test scripts"""
         start_time = self.obs.log_agent_start("Research", {
             "queries": state["research_queries"]
         })
         
+        all_notes = []
+        total_tokens = 0
+        queries = state["research_queries"]
+        
+        # Retrieve the whole plan in one embedding pass and one Chroma query
         try:
-            all_notes = []
-            total_tokens = 0
-            
-            for query in state["research_queries"]:
-                results = self.vector_store.similarity_search(query, k=4)
-                
-                doc_text = "\n\n---\n\n".join([
-                    f"Document: {doc.metadata['doc_name']}\n"
-                    f"Page: {doc.metadata.get('page', 'N/A')}\n"
-                    f"Chunk ID: {doc.metadata['chunk_id']}\n"
-                    f"Content: {doc.page_content}"
-                    for doc, score in results
-                ])
-                
-                response = self.llm.invoke(
-                    self.synthesis_prompt.format_messages(
-                        query=query,
-                        documents=doc_text
-                    )
-                )
-                
-                usage = response.response_metadata.get('usage', {})
-                tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
-                total_tokens += tokens
-                
-                for doc, score in results:
-                    note: ResearchNote = {
-                        "content": response.content[:500],
-                        "source": doc.metadata['doc_name'],
-                        "chunk_id": doc.metadata['chunk_id'],
-                        "page": doc.metadata.get('page', 0),
-                        "confidence": 1.0 - min(score / 2.0, 1.0)
-                    }
-                    all_notes.append(note)
-            
-            state["research_notes"] = all_notes
-            state["current_agent"] = "Research"
-            
-            self.obs.log_agent_end("Research", start_time, {
-                "notes_created": len(all_notes)
-            }, tokens=total_tokens)
-            
-            return state
-            
+            retrieved = self._retrieve_batch(queries)
         except Exception as e:
             self.obs.log_agent_end("Research", start_time, None, error=str(e))
             state["error_log"].append(f"Research error: {str(e)}")
-            return state
\ No newline at end of file
+            return state
+        
+        # Submit every synthesis first, then collect in planner order
+        futures = [
+            self._submit(self._synthesize, query, i, results)
+            for i, (query, results) in enumerate(zip(queries, retrieved))
+        ]
+        
+        # One deadline for the whole plan, so waiting on each in turn can't add up
+        deadline = time.monotonic() + self.query_timeout
+        for query, future in zip(state["research_queries"], futures):
+            try:
+                notes, tokens = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                all_notes.extend(notes)
+                total_tokens += tokens
+            except FutureTimeoutError:
+                future.cancel()
+                state["error_log"].append(
+                    f"Research error ('{query}'): timed out after {self.query_timeout}s"
+                )
+            except Exception as e:
+                state["error_log"].append(f"Research error ('{query}'): {str(e)}")
+        
+        state["research_notes"] = all_notes
+        state["current_agent"] = "Research"
+        
+        self.obs.log_agent_end("Research", start_time, {
+            "notes_created": len(all_notes),
+            "citations": sum(len(n["citations"]) for n in all_notes)
+        }, tokens=total_tokens)
+        
+        return state
+    
+    def _submit(self, fn, *args):
+        # Carry the caller's context so pool threads log to the caller's run
+        batch = _current_batch.get()
+        pool = batch.pool if batch is not None else self._pool
+        return pool.submit(contextvars.copy_context().run, fn, *args)
+    
+    def _run_with_timeout(self, fn, *args) -> tuple:
+        """fn(*args) on the research pool, waiting at most query_timeout for it
+        
+        A timeout only stops the wait. cancel() drops the call if it is still
+        queued, but one already running keeps its pool thread, and its LLM
+        call, until it returns.
+        """
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.query_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"timed out after {self.query_timeout}s")
+    
+    def _research_query(self, query: str, query_index: int = 0) -> tuple:
+        """Retrieve and synthesise a single planner query"""
+        results = self._retrieve_batch([query])[0]
+        return self._synthesize(query, query_index, results)
+    
+    async def _aresearch(self, task: ResearchTask) -> tuple:
+        results = task.get("hits")
+        if results is None:
+            results = (await asyncio.to_thread(self._retrieve_batch, [task["query"]]))[0]
+        if not results:
+            return [], 0
+        
+        with self.obs.llm_call("Research", query_index=task["query_index"]) as call:
+            response = await self.llm.ainvoke(self._synthesis_messages(task["query"], results))
+            call.record(response)
+        return self._note(task["query"], task["query_index"], results, response)
+    
+    def search(self, queries: list) -> list:
+        """Candidate hits per query from one embedding pass and one search
+        
+        This is the part of retrieval that doesn't depend on the run, so
+        run_batch calls it once for the queries of every request.
+        """
+        if self.reranker is None and self.dedup is None:
+            return self.retriever.similarity_search_batch(queries, k=4)
+        # Over-fetch so there is something left after reranking / dedup
+        return self.retriever.similarity_search_batch(queries, k=self.candidates if self.reranker else 8)
+    
+    def _retrieve_batch(self, queries: list, candidates: list = None) -> list:
+        """Retrieve, rerank, de-duplicate and pack chunks for a list of queries
+        
+        candidates are search() results already fetched for these queries.
+        """
+        start = time.perf_counter()
+        try:
+            with tracing.span("retrieval", {"queries": len(queries), "pooled": candidates is not None}):
+                if candidates is None:
+                    candidates = self.search(queries)
+                return self._rerank_and_pack(queries, candidates)
+        finally:
+            metrics.RETRIEVAL_LATENCY.observe(time.perf_counter() - start)
+    
+    def _rerank_and_pack(self, queries: list, candidates: list) -> list:
+        if self.reranker is None and self.dedup is None:
+            return candidates
+        
+        ranked = candidates
+        if self.reranker is not None:
+            start = time.perf_counter()
+            with tracing.span("rerank", {"candidates": sum(len(c) for c in candidates)}):
+                ranked = self.reranker.rerank_batch(queries, candidates)
+            rerank_latency = time.perf_counter() - start
+        
+        # Queries are handled in planner order, so dedup across them is deterministic
+        seen = []
+        vectors = self.dedup.vectors(ranked) if self.dedup is not None else None
+        suppressed = 0
+        packed_results = []
+        tokens_packed = tokens_dropped = baseline_tokens = 0
+        for i, (hits, original) in enumerate(zip(ranked, candidates)):
+            if self.dedup is not None:
+                with tracing.span("dedup", {"query_index": i}) as span:
+                    hits, dropped_dups = self.dedup.suppress(hits, seen)
+                    suppressed += dropped_dups
+                    hits = self.dedup.mmr(hits, vectors)
+                    span.set_attribute("suppressed", dropped_dups)
+            
+            if self.reranker is not None:
+                packed, used, dropped = pack_by_tokens(hits, self.token_budget)
+                tokens_packed += used
+                tokens_dropped += dropped
+                baseline_tokens += sum(count_tokens(doc.page_content) for doc, _ in original[:4])
+            else:
+                packed = hits[:4]
+            
+            if self.dedup is not None:
+                seen.extend(self.dedup.fingerprint(doc) for doc, _ in packed)
+            packed_results.append(packed)
+        
+        if self.reranker is not None:
+            self.obs.log_rerank(len(queries), rerank_latency, tokens_packed, tokens_dropped, baseline_tokens)
+        if self.dedup is not None:
+            self.obs.log_dedup(suppressed)
+        return packed_results
+    
+    def _synthesize(self, query: str, query_index: int, results: list) -> tuple:
+        if not results:
+            return [], 0
+        
+        batch = _current_batch.get()
+        if batch is None:
+            return self._synthesize_note(query, query_index, results)
+        
+        key = (query, tuple(doc.metadata['chunk_id'] for doc, _ in results))
+        future, owner = batch.claim(key)
+        if owner:
+            try:
+                future.set_result(self._synthesize_note(query, query_index, results))
+            except Exception as e:
+                future.set_exception(e)
+            return future.result()
+        
+        # Another request in the batch made this exact call; its tokens were charged there
+        notes, _ = future.result(timeout=self.query_timeout)
+        return [{**note, "query_index": query_index} for note in notes], 0
+    
+    def _synthesize_note(self, query: str, query_index: int, results: list) -> tuple:
+        with self.obs.llm_call("Research", query_index=query_index) as call:
+            response = self.llm.invoke(self._synthesis_messages(query, results))
+            call.record(response)
+        return self._note(query, query_index, results, response)
+    
+    def _synthesis_messages(self, query: str, results: list) -> list:
+        doc_text = "\n\n---\n\n".join([
+            f"Document: {doc.metadata['doc_name']}\n"
+            f"Page: {doc.metadata.get('page', 'N/A')}\n"
+            f"Chunk ID: {doc.metadata['chunk_id']}\n"
+            f"Content: {doc.page_content}"
+            for doc, score in results
+        ])
+        return self.synthesis_prompt.format_messages(query=query, documents=doc_text)
+    
+    def _note(self, query: str, query_index: int, results: list, response) -> tuple:
+        """(notes, tokens) for one synthesis response"""
+        usage = response.response_metadata.get('usage', {})
+        tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        
+        citations: List[Citation] = [
+            {
+                "source": doc.metadata['doc_name'],
+                "page": doc.metadata.get('page', 0),
+                "chunk_id": doc.metadata['chunk_id'],
+                "score": 1.0 - min(score / 2.0, 1.0)
+            }
+            for doc, score in results
+        ]
+        note: ResearchNote = {
+            "query_index": query_index,
+            "query": query,
+            "content": response.content,
+            "citations": citations
+        }
+        
+        return [note], tokens
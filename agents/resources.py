@@ -0,0 +1,170 @@
+"""Process-wide shared resources
+
+Loading the MiniLM weights, opening the Chroma client and building the
+Anthropic clients are the expensive parts of starting the system. Everything
+in here is created once per process on first use and handed out to every
+HealthcareMultiAgentSystem, so the eval harness, the Streamlit app and the
+test scripts all share the same instances.
+"""
+from langchain_anthropic import ChatAnthropic
+from langchain_community.embeddings import HuggingFaceEmbeddings
+import threading
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+import paths  # noqa: F401 - puts retrieval/ on sys.path
+from vector_store import HealthcareVectorStore, EMBEDDING_MODEL
+from embedding_service import EmbeddingService
+from hybrid_retriever import HybridRetriever
+from reranker import CrossEncoderReranker, RERANK_MODEL
+
+from llm_cache import LLMResponseCache
+from rate_limit import RateLimiter, with_rate_limit
+from llm_backend import backend_name, FixtureStore, LatencyModel, RecordingLLM, ReplayLLM, SyntheticLLM
+import metrics
+
+_lock = threading.RLock()
+_resources = {}
+
+
+def _get_or_create(key, factory):
+    if key in _resources:
+        return _resources[key]
+
+    with _lock:
+        if key not in _resources:
+            _resources[key] = factory()
+        return _resources[key]
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL) -> EmbeddingService:
+    return _get_or_create(
+        ("embeddings", model_name),
+        lambda: EmbeddingService(HuggingFaceEmbeddings(model_name=model_name), model_name)
+    )
+
+
+def get_vector_store(persist_directory: str = "../chroma_db") -> HealthcareVectorStore:
+    """Loaded vector store for persist_directory, shared across agents and runs"""
+    # Absolute, since Chroma opens a connection per thread and would resolve
+    # a relative path against whatever the working directory is by then
+    persist_directory = os.path.abspath(persist_directory)
+    
+    def build():
+        store = HealthcareVectorStore(persist_directory=persist_directory, embeddings=get_embeddings())
+        store.load_vectorstore()
+        return store
+
+    return _get_or_create(("vector_store", persist_directory), build)
+
+
+def get_retriever(persist_directory: str = "../chroma_db"):
+    """Hybrid BM25 + dense retriever, which searches densely until a lexical index is built
+    
+    Set RETRIEVAL_MODE=dense to skip the lexical index.
+    """
+    def build():
+        store = get_vector_store(persist_directory)
+        if os.getenv("RETRIEVAL_MODE", "hybrid") == "dense":
+            return store
+        return HybridRetriever(store, candidates=int(os.getenv("HYBRID_CANDIDATES", "20")))
+    
+    return _get_or_create(("retriever", os.path.abspath(persist_directory)), build)
+
+
+def get_reranker(model_name: str = RERANK_MODEL):
+    """Shared cross-encoder, or None when RERANK=off or the model can't be loaded"""
+    def build():
+        if os.getenv("RERANK", "on").lower() in ("off", "false", "0"):
+            return None
+        try:
+            return CrossEncoderReranker(model_name)
+        except Exception as e:
+            print(f"Reranker unavailable, using plain top-k retrieval: {e}")
+            return None
+    
+    return _get_or_create(("reranker", model_name), build)
+
+
+def get_rate_limiter():
+    """Process-wide limiter for the Anthropic key, or None without ANTHROPIC_RPM/ANTHROPIC_TPM"""
+    return _get_or_create(("rate_limiter",), RateLimiter.from_env)
+
+
+def get_fixture_store() -> FixtureStore:
+    return _get_or_create(("fixtures",), FixtureStore)
+
+
+def get_llm(temperature: float):
+    """Shared chat model for the configured LLM_BACKEND (see llm_backend.py)
+    
+    Every backend sits behind the rate limiter, so LLM_MAX_CONCURRENCY holds
+    for replayed and synthetic calls too. Retries are ours, not the SDK's.
+    """
+    model = os.getenv("MODEL_NAME", "claude-sonnet-4-20250514")
+    backend = backend_name()
+    
+    def build():
+        if backend == "synthetic":
+            llm = SyntheticLLM(model, temperature, LatencyModel.from_env("LLM_SYNTHETIC_LATENCY"))
+        elif backend == "replay":
+            fallback = None
+            if os.getenv("LLM_REPLAY_MISSING", "error").lower() == "synthetic":
+                fallback = SyntheticLLM(model, temperature)
+            llm = ReplayLLM(get_fixture_store(), model, temperature,
+                            LatencyModel.from_env("LLM_REPLAY_LATENCY"), fallback)
+        else:
+            llm = ChatAnthropic(
+                model=model,
+                temperature=temperature,
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                max_retries=0
+            )
+            if backend == "record":
+                # Inside the limiter, so recorded latencies leave out time spent queueing
+                llm = RecordingLLM(llm, get_fixture_store())
+        
+        return with_rate_limit(llm, get_rate_limiter())
+    
+    return _get_or_create(("llm", backend, model, temperature), build)
+
+
+def get_llm_cache():
+    """Shared response cache; off for every backend but the real API
+    
+    A cache hit while recording would leave a gap in the fixtures, and with
+    replayed or synthetic responses it would only hide the calls being measured.
+    """
+    if backend_name() != "anthropic":
+        return None
+    return _get_or_create(("llm_cache",), LLMResponseCache.from_env)
+
+
+def warm_up(persist_directory: str = "../chroma_db"):
+    """Load the embedding model and open the vector store ahead of the first request"""
+    store = get_vector_store(persist_directory)
+    store.embeddings.embed_query("warm up")
+    get_retriever(persist_directory)
+    get_reranker()
+    get_llm_cache()
+    if os.getenv("METRICS_PORT"):
+        metrics.serve(int(os.getenv("METRICS_PORT")))
+    return store
+
+
+def shutdown():
+    """Close and drop every shared resource; the next get_* call rebuilds it
+    
+    Also stops the metrics endpoint warm_up() started.
+    """
+    with _lock:
+        for key, resource in _resources.items():
+            # The SQLite caches and the embedding service's batching worker
+            if key[0] in ("llm_cache", "embeddings") and resource is not None:
+                resource.close()
+        _resources.clear()
+    metrics.stop_serving()
@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / '.cache' / 'semantic_cache.sqlite'
+
+
+class SemanticQueryCache:
+    """Serves completed results for paraphrased queries
+
+    Queries are embedded with the retrieval embedding model and compared by
+    cosine similarity against earlier completed runs in the same output
+    mode. Entries built against a different corpus version are dropped, and
+    the index is capped at max_entries with least recently used eviction.
+    """
+
+    def __init__(self, embeddings, corpus_version, path: str = None,
+                 threshold: float = None, max_entries: int = None):
+        self.embeddings = embeddings
+        self.corpus_version = corpus_version
+        self.path = Path(path or os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_query TEXT,
+                output_mode TEXT,
+                corpus_version TEXT,
+                embedding BLOB,
+                result TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls, vector_store):
+        """Build the cache on top of the vector store unless SEMANTIC_CACHE is off"""
+        if os.getenv("SEMANTIC_CACHE", "on").lower() in ("off", "false", "0"):
+            return None
+        return cls(vector_store.embeddings, vector_store.corpus_version)
+
+    def embed(self, user_query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(user_query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector: np.ndarray, output_mode: str):
+        """Return the stored output of the closest match above threshold, or None"""
+        version = self.corpus_version()
+
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE corpus_version != ?", (version,))
+            rows = self._conn.execute(
+                "SELECT id, user_query, embedding FROM results WHERE output_mode = ?",
+                (output_mode,)
+            ).fetchall()
+
+            if not rows:
+                self._conn.commit()
+                return None
+
+            matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            scores = matrix @ query_vector
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self._conn.commit()
+                return None
+
+            entry_id, cached_query = rows[best][0], rows[best][1]
+            self._conn.execute("UPDATE results SET last_access = ? WHERE id = ?", (time.time(), entry_id))
+            result = json.loads(self._conn.execute(
+                "SELECT result FROM results WHERE id = ?", (entry_id,)
+            ).fetchone()[0])
+            self._conn.commit()
+
+        result["cache_hit"] = True
+        result["cached_query"] = cached_query
+        result["cache_similarity"] = round(float(scores[best]), 4)
+        return result
+
+    def store(self, query_vector: np.ndarray, user_query: str, output_mode: str, result: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO results (user_query, output_mode, corpus_version, embedding, result, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_query, output_mode, self.corpus_version(),
+                 query_vector.astype(np.float32).tobytes(),
+                 json.dumps(result, default=str), now, now)
+            )
+            self._conn.execute("""
+                DELETE FROM results WHERE id NOT IN (
+                    SELECT id FROM results ORDER BY last_access DESC LIMIT ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
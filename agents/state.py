@@ -1,14 +1,44 @@
-from typing import TypedDict, List, Annotated, Literal
+from typing import TypedDict, List, Annotated, Literal, Optional
 from langchain.schema import Document
 from datetime import datetime
-import operator
 
-class ResearchNote(TypedDict):
-    content: str
+class Citation(TypedDict):
     source: str
-    chunk_id: str
     page: int
-    confidence: float
+    chunk_id: str
+    score: float
+
+class ResearchNote(TypedDict):
+    """One synthesized finding per planner query, stored once with the chunks it cites"""
+    query_index: int
+    query: str
+    content: str
+    citations: List[Citation]
+
+class ResearchTask(TypedDict):
+    query: str
+    query_index: int
+    # (Document, distance) pairs retrieved up front; None means retrieve in the branch
+    hits: Optional[list]
+
+def merge_research_notes(existing: List[ResearchNote], new: List[ResearchNote]) -> List[ResearchNote]:
+    """Reducer for research_notes
+    
+    Parallel research branches finish in any order, so notes are kept sorted
+    by planner query. There is one note per query; a later note for a query
+    replaces the one already in state.
+    """
+    by_index = {n["query_index"]: n for n in existing}
+    for note in new:
+        by_index[note["query_index"]] = note
+    return [by_index[i] for i in sorted(by_index)]
+
+def format_citation(citation: Citation) -> str:
+    return f"[Source: {citation['source']}, Page {citation['page']}, {citation['chunk_id']}]"
+
+def append_log(existing: list, new: list) -> list:
+    """Reducer for append-only logs; nodes return only their new entries"""
+    return existing + new
 
 class ActionItem(TypedDict):
     task: str
@@ -23,8 +53,11 @@ class AgentState(TypedDict):
     execution_plan: str
     research_queries: List[str]
     
-    research_notes: Annotated[List[ResearchNote], operator.add]
+    research_notes: Annotated[List[ResearchNote], merge_research_notes]
     retrieved_documents: List[Document]
+    retrieval_results: List[list]
+    # Search hits per research query, fetched ahead of the graph by run_batch
+    retrieval_candidates: Optional[List[list]]
     
     executive_summary: str
     email_draft: str
@@ -34,9 +67,9 @@ class AgentState(TypedDict):
     hallucination_flags: List[str]
     missing_evidence: List[str]
 
-    agent_trace: Annotated[List[dict], operator.add]
+    agent_trace: Annotated[List[dict], append_log]
     current_agent: str
-    error_log: Annotated[List[str], operator.add]
+    error_log: Annotated[List[str], append_log]
     
     timestamp: str
     total_tokens: int
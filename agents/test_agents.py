@@ -4,11 +4,14 @@ from planner_agent import PlannerAgent
 from research_agent import ResearchAgent
 from writer_agent import WriterAgent
 from verifier_agent import VerifierAgent
+import resources
 
 print("=" * 80)
 print("TESTING ALL 4 AGENTS")
 print("=" * 80)
 
+resources.warm_up()
+
 obs = AgentObservability()
 planner = PlannerAgent(obs)
 researcher = ResearchAgent(obs)
@@ -22,6 +25,8 @@ state: AgentState = {
     "research_queries": [],
     "research_notes": [],
     "retrieved_documents": [],
+    "retrieval_results": [],
+    "retrieval_candidates": None,
     "executive_summary": "",
     "email_draft": "",
     "action_items": [],
@@ -37,7 +42,7 @@ state: AgentState = {
 }
 
 print("\n1/4 Running Planner Agent...")
-state = planner.plan(state)
+state.update(planner.plan(state))
 print(f"Plan created with {len(state['research_queries'])} queries")
 
 print("\n2/4 Running Research Agent...")
@@ -45,14 +50,14 @@ state = researcher.research(state)
 print(f"{len(state['research_notes'])} research notes created")
 
 print("\n3/4 Running Writer Agent...")
-state = writer.write(state)
+state.update(writer.write(state))
 print(f"Deliverables created:")
 print(f"   - Summary: {len(state['executive_summary'])} chars")
 print(f"   - Email: {len(state['email_draft'])} chars")
 print(f"   - Actions: {len(state['action_items'])} items")
 
 print("\n4/4 Running Verifier Agent...")
-state = verifier.verify(state)
+state.update(verifier.verify(state))
 print(f"Verification: {state['verification_status']}")
 
 print("\n" + "=" * 80)
@@ -87,4 +92,6 @@ print(f"Errors: {summary['error_count']}")
 
 print("\n" + "=" * 80)
 print("DAY 2 COMPLETE!")
-print("=" * 80)
\ No newline at end of file
+print("=" * 80)
+
+resources.shutdown()
\ No newline at end of file
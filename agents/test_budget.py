@@ -0,0 +1,89 @@
+import contextvars
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from budget import BudgetedLLM, CostCeilingExceeded, RunBudget
+from llm_cache import LLMResponseCache, with_cache
+from observability import AgentObservability
+
+
+class FakeLLM:
+    """Replies with fixed usage; invoke() blocks until release is set"""
+
+    max_tokens = 100
+
+    def __init__(self, usage: int = 50):
+        self.usage = usage
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def invoke(self, messages, **kwargs):
+        self.started.set()
+        self.release.wait()
+        return AIMessage(content="ok", response_metadata={"usage": {"input_tokens": self.usage, "output_tokens": 0}})
+
+    def stream(self, messages, **kwargs):
+        for _ in range(3):
+            yield AIMessageChunk(content="x", usage_metadata={"input_tokens": 0, "output_tokens": 10, "total_tokens": 10})
+
+
+def budget_of(tokens: int) -> RunBudget:
+    budget = RunBudget(ceiling_usd=tokens * 0.001, cost_per_token=0.001)
+    budget.start_run()
+    return budget
+
+
+def test_settles_to_actual_usage():
+    budget = budget_of(1000)
+    BudgetedLLM(FakeLLM(usage=50), budget).invoke([HumanMessage(content="hi")])
+    assert budget.tokens == 50
+    assert budget.remaining_tokens() == 950
+
+
+def test_calls_in_flight_count_against_the_ceiling():
+    budget = budget_of(200)
+    slow = FakeLLM()
+    slow.release.clear()
+    llm = BudgetedLLM(slow, budget)
+    # Another branch of the same run
+    first = threading.Thread(target=contextvars.copy_context().run,
+                             args=(llm.invoke, [HumanMessage(content="hi")]))
+    first.start()
+    try:
+        slow.started.wait()
+        # Nothing is spent yet, but the call in flight holds most of the budget
+        assert budget.tokens == 0
+        with pytest.raises(CostCeilingExceeded):
+            llm.invoke([HumanMessage(content="hi")])
+    finally:
+        slow.release.set()
+        first.join()
+    assert budget.tokens == 50
+    llm.invoke([HumanMessage(content="hi")])
+
+
+def test_abandoned_stream_settles():
+    budget = budget_of(1000)
+    stream = BudgetedLLM(FakeLLM(), budget).stream([HumanMessage(content="hi")])
+    next(stream)
+    stream.close()
+    assert budget.tokens == 10
+    assert budget.remaining_tokens() == 990
+
+
+def test_cache_hits_skip_the_reservation(tmp_path):
+    # The reply alone could take the run past this ceiling
+    budget = budget_of(50)
+    llm = with_cache(BudgetedLLM(FakeLLM(), budget), LLMResponseCache(path=tmp_path / "llm.sqlite"),
+                     AgentObservability(), "Planner")
+    messages = [HumanMessage(content="hi")]
+    with pytest.raises(CostCeilingExceeded):
+        llm.invoke(messages)
+
+    _, key = llm._key(messages)
+    llm.cache.put(key, "", "cached", {})
+    assert llm.invoke(messages).content == "cached"
+    assert budget.tokens == 0
@@ -0,0 +1,93 @@
+import pytest
+from langchain.schema import Document
+
+from dedup import ChunkDeduplicator, hamming, simhash
+
+PASSAGE = (
+    "Hand hygiene is the single most important measure for preventing healthcare associated "
+    "infections. Staff should clean their hands before and after every patient contact, after "
+    "removing gloves and after contact with the patient environment, using alcohol based rub "
+    "unless hands are visibly soiled."
+)
+
+
+def test_hamming_counts_differing_bits():
+    assert hamming("0000000000000000", "0000000000000000") == 0
+    assert hamming("0000000000000000", "f000000000000001") == 5
+    assert hamming("ffffffffffffffff", "0000000000000000") == 64
+
+
+def test_simhash_is_close_for_near_duplicates_only():
+    fingerprint = simhash(PASSAGE)
+    assert len(fingerprint) == 16
+    assert simhash(PASSAGE) == fingerprint
+
+    # Same passage with different whitespace and one word changed, as when a PDF repeats it
+    near = simhash(PASSAGE.replace("single most", "most").replace(". ", ".\n"))
+    unrelated = simhash("Central line bundles cut bloodstream infections in the ICU by half within a year.")
+    assert hamming(fingerprint, near) <= 8
+    assert hamming(fingerprint, unrelated) > 8
+
+
+def hit(chunk_id: str, text: str = None):
+    return Document(page_content=text or chunk_id, metadata={"chunk_id": chunk_id}), 0.0
+
+
+class FakeStore:
+    """Stored vectors by chunk ID; re-embedding counts calls"""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+        self.embeddings = self
+        self.embedded = []
+
+    def get_chunks(self, chunk_ids, include=None):
+        assert include == ["embeddings"]
+        found = [c for c in chunk_ids if c in self.vectors]
+        return {"ids": found, "embeddings": [self.vectors[c] for c in found]}
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.vectors[text] for text in texts]
+
+
+def test_suppress_drops_near_duplicates_of_seen_and_of_each_other():
+    dedup = ChunkDeduplicator(FakeStore({}), max_hamming=8)
+    seen = [simhash(PASSAGE)]
+    hits = [
+        (Document(page_content=PASSAGE.upper(), metadata={"chunk_id": "a"}), 0.1),
+        (Document(page_content="Catheter care bundle for urinary tract infections.", metadata={"chunk_id": "b"}), 0.2),
+        (Document(page_content="Catheter care bundle for urinary tract infections!", metadata={"chunk_id": "c"}), 0.3),
+    ]
+    kept, dropped = dedup.suppress(hits, seen)
+    assert [doc.metadata["chunk_id"] for doc, _ in kept] == ["b"]
+    assert dropped == 2
+
+
+def test_mmr_uses_stored_vectors_to_push_redundant_hits_down():
+    vectors = {"a": [1.0, 0.0], "a2": [0.99, 0.14], "b": [0.0, 1.0]}
+    store = FakeStore(vectors)
+    dedup = ChunkDeduplicator(store, lambda_mult=0.5)
+    hits = [hit("a"), hit("a2"), hit("b")]
+
+    assert [doc.metadata["chunk_id"] for doc, _ in dedup.mmr(hits)] == ["a", "b", "a2"]
+    assert store.embedded == []
+
+    # With lambda 1 only the incoming rank counts
+    assert ChunkDeduplicator(store, lambda_mult=1.0).mmr(hits) == hits
+
+
+def test_mmr_embeds_only_chunks_without_a_stored_vector():
+    store = FakeStore({"a": [1.0, 0.0], "b": [0.0, 1.0], "gone": [0.99, 0.14]})
+    dedup = ChunkDeduplicator(store, lambda_mult=0.5)
+    hits = [hit("a"), hit("gone"), hit("b")]
+
+    ordered = dedup.mmr(hits, vectors={"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    assert [doc.metadata["chunk_id"] for doc, _ in ordered] == ["a", "b", "gone"]
+    assert store.embedded == ["gone"]
+
+
+@pytest.mark.parametrize("count", [0, 1, 2])
+def test_mmr_leaves_short_lists_alone(count):
+    hits = [hit(str(i)) for i in range(count)]
+    assert ChunkDeduplicator(FakeStore({})).mmr(hits) == hits
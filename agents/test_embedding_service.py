@@ -0,0 +1,108 @@
+import threading
+
+import metrics
+import resources
+from embedding_service import EmbeddingService
+
+
+class FakeModel:
+    """Embeds a text as [len(text), call number] and records every batch"""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+            return [[float(len(text)), float(len(self.batches))] for text in texts]
+
+
+def test_disk_cache_survives_a_new_service(tmp_path):
+    path = tmp_path / "embeddings.sqlite"
+    first = EmbeddingService(FakeModel(), "model-a", cache_path=path)
+    vectors = first.embed_documents(["one", "three"])
+
+    model = FakeModel()
+    second = EmbeddingService(model, "model-a", cache_path=path)
+    assert second.embed_documents(["one", "three"]) == vectors
+    assert model.batches == []
+    assert second.stats()["disk_hits"] == 2
+
+    # Vectors from another model are never reused
+    other = EmbeddingService(model, "model-b", cache_path=path)
+    other.embed_documents(["one"])
+    assert model.batches == [["one"]]
+
+
+def test_embed_documents_batches_unique_misses_in_order(tmp_path):
+    model = FakeModel()
+    service = EmbeddingService(model, "model", cache_path="off", max_batch=2)
+    service.embed_documents(["a"])
+
+    vectors = service.embed_documents(["a", "bb", "ccc", "bb", "dddd"])
+
+    assert model.batches == [["a"], ["bb", "ccc"], ["dddd"]]
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 2.0, 4.0]
+    assert vectors[1] == vectors[3]
+
+
+def test_memory_cache_evicts_least_recently_used():
+    model = FakeModel()
+    service = EmbeddingService(model, "model", cache_path="off", memory_cache_size=2)
+    service.embed_documents(["a", "b"])
+    service.embed_documents(["a"])
+    service.embed_documents(["c"])
+
+    service.embed_documents(["a", "b"])
+    assert model.batches[-1] == ["b"]
+
+
+def test_concurrent_queries_share_one_model_call():
+    model = FakeModel()
+    service = EmbeddingService(model, "model", cache_path="off", max_wait_ms=500)
+    texts = ["w", "xx", "yyy", "xx"]
+    results = {}
+
+    def query(i):
+        results[i] = service.embed_query(texts[i])
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(model.batches) == 1
+    assert sorted(model.batches[0]) == ["w", "xx", "yyy"]
+    assert [results[i][0] for i in range(len(texts))] == [1.0, 2.0, 3.0, 2.0]
+    assert service.stats()["queries_batched"] == 4
+
+
+def test_close_stops_the_worker_and_the_disk_cache(tmp_path):
+    service = EmbeddingService(FakeModel(), "model", cache_path=tmp_path / "embeddings.sqlite")
+    service.embed_query("a")
+    worker = service._worker
+
+    service.close()
+
+    assert not worker.is_alive()
+    assert service._disk is None
+    # Still usable, from memory and a new worker
+    assert service.embed_query("a") == [1.0, 1.0]
+    assert service.embed_query("bb")[0] == 2.0
+    service.close()
+
+
+def test_resources_shutdown_closes_the_shared_service(monkeypatch):
+    service = EmbeddingService(FakeModel(), "model", cache_path="off")
+    monkeypatch.setattr(resources, "_resources", {("embeddings", "model"): service})
+    service.embed_query("a")
+    worker = service._worker
+    metrics.serve(0, host="127.0.0.1")
+
+    resources.shutdown()
+
+    assert not worker.is_alive()
+    assert resources._resources == {}
+    assert metrics._server is None
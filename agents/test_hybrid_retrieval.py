@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from bm25_index import BM25Index
+from hybrid_retriever import HybridRetriever
+
+CHUNKS = [
+    ("c0", "hand hygiene audit in the ICU"),
+    ("c1", "hand hygiene hand hygiene compliance"),
+    ("c2", "central line bundle for bloodstream infections"),
+    ("c3", "ventilator associated pneumonia bundle"),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BM25Index.build(iter(CHUNKS), str(tmp_path / "bm25"))
+
+
+def bm25(tf: float, df: int, length: int, avg_len: float, n: int, k1=1.5, b=0.75) -> float:
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+
+
+def test_bm25_scores_match_the_formula(index):
+    # Token counts after stopwords: 4, 5, 5 and 4
+    avg_len = 18 / 4
+    hits = dict(index.search("pneumonia", k=5))
+    assert list(hits) == ["c3"]
+    assert hits["c3"] == pytest.approx(bm25(1, 1, 4, avg_len, 4), rel=1e-5)
+
+    hits = index.search("hand hygiene", k=5)
+    assert [chunk_id for chunk_id, _ in hits] == ["c1", "c0"]
+    expected = 2 * bm25(2, 2, 5, avg_len, 4)
+    assert hits[0][1] == pytest.approx(expected, rel=1e-5)
+
+
+def test_bm25_ignores_stopwords_and_unknown_terms(index):
+    assert index.search("the of and", k=5) == []
+    assert index.search("zzz", k=5) == []
+    assert [chunk_id for chunk_id, _ in index.search("bundle", k=1)] == ["c3"]
+
+
+def test_index_reloads_from_disk(index):
+    reopened = BM25Index(str(index.path))
+    assert reopened.search("bundle infections", k=5) == index.search("bundle infections", k=5)
+
+
+def test_rrf_sums_reciprocal_ranks():
+    retriever = HybridRetriever(vector_store=None, rrf_k=60)
+    fused = retriever._fuse(["a", "b", "c"], ["c", "d"])
+
+    # c: 1/63 + 1/61 beats a: 1/61 alone; ties (b, d at rank 2) keep dense order first
+    assert fused == ["c", "a", "b", "d"]
+
+
+class FakeStore:
+    """Dense search over fixed vectors, with the BM25 index from the fixture"""
+
+    def __init__(self, index, vectors: dict):
+        self.index = index
+        self.vectors = vectors
+        self.embeddings = self
+        self.fetched = []
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def bm25_index(self):
+        return self.index
+
+    def similarity_search_batch(self, queries, k=5, dedup=False):
+        # Always c0, then c2, whatever the query
+        return [[(self._doc(c), self._distance(c)) for c in ("c0", "c2")[:k]] for _ in queries]
+
+    def get_chunks(self, chunk_ids, include=None):
+        self.fetched.extend(chunk_ids)
+        return {
+            "ids": chunk_ids,
+            "documents": [dict(CHUNKS)[c] for c in chunk_ids],
+            "metadatas": [{"chunk_id": c} for c in chunk_ids],
+            "embeddings": [self.vectors[c] for c in chunk_ids]
+        }
+
+    def _doc(self, chunk_id):
+        return Document(page_content=dict(CHUNKS)[chunk_id], metadata={"chunk_id": chunk_id})
+
+    def _distance(self, chunk_id):
+        return float(np.sum((np.asarray(self.vectors[chunk_id]) - [1.0, 0.0]) ** 2))
+
+
+def test_hybrid_adds_lexical_hits_with_dense_distances(index):
+    vectors = {"c0": [1.0, 0.0], "c1": [0.0, 1.0], "c2": [0.6, 0.8], "c3": [0.0, -1.0]}
+    store = FakeStore(index, vectors)
+    retriever = HybridRetriever(store, candidates=4)
+
+    hits = retriever.similarity_search("hand hygiene compliance", k=3)
+
+    # c0 is first in both rankings; c1 only the lexical index found, fetched with its stored vector
+    assert [doc.metadata["chunk_id"] for doc, _ in hits] == ["c0", "c1", "c2"]
+    assert store.fetched == ["c1"]
+    assert hits[1][1] == pytest.approx(2.0)
+
+
+def test_hybrid_is_dense_until_an_index_exists():
+    store = FakeStore(None, {"c0": [1.0, 0.0], "c2": [0.6, 0.8]})
+    hits = HybridRetriever(store).similarity_search("anything", k=2)
+    assert [doc.metadata["chunk_id"] for doc, _ in hits] == ["c0", "c2"]
@@ -0,0 +1,120 @@
+import pytest
+
+from document_loader import HealthcareDocumentLoader
+from vector_store import HealthcareVectorStore
+
+PAGES = [
+    "Hand hygiene before and after every patient contact.",
+    "Central line bundles reduce bloodstream infections.",
+    "Elevate the head of the bed to prevent ventilator pneumonia.",
+    "Remove urinary catheters as soon as they are not needed.",
+    "Give surgical prophylaxis within an hour of incision.",
+]
+
+
+def write_pdf(path, pages):
+    """A minimal PDF with one line of Helvetica text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def corpus(tmp_path, embeddings):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_pdf(data / "guide.pdf", PAGES)
+    loader = HealthcareDocumentLoader(str(data))
+    store = HealthcareVectorStore(persist_directory=str(tmp_path / "chroma_db"), embeddings=embeddings)
+    return data / "guide.pdf", loader, store
+
+
+def crash_after_first_batch(store, monkeypatch) -> list:
+    """Make store's next sync die right after committing its first batch; returns the committed IDs"""
+    upsert = store._upsert_batch
+    committed = []
+
+    def upsert_then_crash(batch, *args):
+        upsert(batch, *args)
+        if batch:
+            committed.extend(c.metadata["chunk_id"] for c in batch)
+            raise Crash()
+
+    monkeypatch.setattr(store, "_upsert_batch", upsert_then_crash)
+    return committed
+
+
+def stored_ids(store) -> set:
+    return set(store.vectorstore._collection.get(include=[])["ids"])
+
+
+def test_interrupted_sync_resumes_after_the_last_committed_batch(corpus, monkeypatch):
+    path, loader, store = corpus
+    committed = crash_after_first_batch(store, monkeypatch)
+    with pytest.raises(Crash):
+        store.sync(loader, batch_size=2)
+    assert len(committed) == 2
+    assert store._read_checkpoint()["chunks_committed"] == 2
+    monkeypatch.undo()
+
+    added = []
+    add_documents = store.vectorstore.add_documents
+    monkeypatch.setattr(store.vectorstore, "add_documents",
+                        lambda docs, ids: added.extend(ids) or add_documents(docs, ids=ids))
+    result = store.sync(loader, batch_size=2)
+
+    assert result == {"ingested": 1, "removed": 0, "failed": {}}
+    # The committed batch isn't embedded again
+    assert not set(committed) & set(added)
+    chunk_ids = store._read_manifest()["files"][str(path)]["chunk_ids"]
+    assert len(chunk_ids) == len(PAGES)
+    assert stored_ids(store) == set(chunk_ids)
+    assert store._read_checkpoint() == {}
+
+
+def test_file_changed_after_an_interrupted_sync_leaves_no_orphans(corpus, monkeypatch):
+    path, loader, store = corpus
+    crash_after_first_batch(store, monkeypatch)
+    with pytest.raises(Crash):
+        store.sync(loader, batch_size=2)
+    monkeypatch.undo()
+
+    write_pdf(path, PAGES[:3])
+    store.sync(loader, batch_size=2)
+
+    new_hash = loader.hash_file(path)
+    assert len(stored_ids(store)) == 3
+    assert all(chunk_id.startswith(new_hash[:12]) for chunk_id in stored_ids(store))
+
+
+def test_reused_loader_forgets_files_that_failed_before(corpus):
+    path, loader, store = corpus
+    path.write_bytes(b"not a pdf")
+    assert str(path) in store.sync(loader)["failed"]
+    assert stored_ids(store) == set()
+
+    write_pdf(path, PAGES)
+    assert store.sync(loader)["failed"] == {}
+    assert len(stored_ids(store)) == len(PAGES)
+    assert str(path) in store._read_manifest()["files"]
@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+import metrics
+from job_queue import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, AdmissionError, JobQueue
+
+
+@pytest.fixture(autouse=True)
+def default_limits(monkeypatch):
+    for name in ("SERVER_TOKEN_BUDGET", "SERVER_TOKENS_PER_JOB", "SERVER_JOB_RETENTION"):
+        monkeypatch.delenv(name, raising=False)
+
+
+class FakeSystem:
+    """arun_stream() that runs until its query's gate opens; "fail" raises instead of answering"""
+
+    def __init__(self):
+        self.gates = {}
+        self.running = 0
+        self.peak = 0
+
+    def gate(self, query: str) -> asyncio.Event:
+        return self.gates.setdefault(query, asyncio.Event())
+
+    async def arun_stream(self, query: str, mode: str):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            yield {"type": "node", "node": "planner"}
+            yield {"type": "token", "text": "Hello"}
+            await self.gate(query).wait()
+            if query == "fail":
+                raise RuntimeError("boom")
+            yield {"type": "result", "result": {"answer": query, "observability": {"total_tokens_used": 12000}}}
+        finally:
+            self.running -= 1
+
+
+async def until(condition):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0)
+    await asyncio.wait_for(poll(), 1)
+
+
+def run(test):
+    """Run test(jobs, system) on a fresh loop with a started queue"""
+    def wrapper(**kwargs):
+        async def main():
+            system = FakeSystem()
+            jobs = JobQueue(system, **kwargs)
+            jobs.start()
+            try:
+                await test(jobs, system)
+            finally:
+                for gate in system.gates.values():
+                    gate.set()
+                await jobs.drain(timeout=1)
+        asyncio.run(main())
+    return wrapper
+
+
+def test_job_runs_and_publishes_its_events():
+    @run
+    async def check(jobs, system):
+        job = await jobs.submit("q", "executive")
+        assert job.status == QUEUED
+        await until(lambda: job.status == RUNNING)
+        system.gate("q").set()
+        events = [event async for event in job.follow()]
+
+        assert [e["type"] for e in events] == ["status", "status", "node", "token", "result"]
+        assert job.status == SUCCEEDED
+        assert job.to_dict()["result"]["answer"] == "q"
+        # Later followers get everything but the token stream
+        assert [e["type"] async for e in job.follow()] == ["status", "status", "node", "result"]
+
+    check(workers=1)
+
+
+def test_failed_job_reports_its_error():
+    @run
+    async def check(jobs, system):
+        job = await jobs.submit("fail", "executive")
+        system.gate("fail").set()
+        events = [event async for event in job.follow()]
+
+        assert job.status == FAILED
+        assert job.error == "boom"
+        assert events[-1] == {"type": "error", "status": FAILED, "error": "boom"}
+        assert "result" not in job.to_dict()
+
+    check(workers=1)
+
+
+def test_full_backlog_is_rejected_with_retry_after():
+    @run
+    async def check(jobs, system):
+        running = await jobs.submit("a", "executive")
+        await until(lambda: running.status == RUNNING)
+        waiting = [await jobs.submit(q, "executive") for q in ("b", "c")]
+        assert [jobs.position(job) for job in waiting] == [1, 2]
+        assert jobs.position(running) is None
+
+        rejected = metrics.JOBS_REJECTED.value(reason="backlog")
+        with pytest.raises(AdmissionError) as error:
+            await jobs.submit("d", "executive")
+        assert error.value.status == 429
+        # No finished jobs yet: the default 60s per job over one worker
+        assert error.value.retry_after == 60.0
+        assert metrics.JOBS_REJECTED.value(reason="backlog") == rejected + 1
+
+        system.gate("a").set()
+        await until(lambda: waiting[0].status == RUNNING)
+        assert [jobs.position(job) for job in waiting] == [None, 1]
+        assert (await jobs.submit("e", "executive")).status == QUEUED
+
+    check(workers=1, max_backlog=2)
+
+
+def test_token_budget_holds_jobs_back_until_they_fit():
+    @run
+    async def check(jobs, system):
+        queued = [await jobs.submit(q, "executive") for q in ("a", "b", "c")]
+        await until(lambda: system.running == 2)
+        await asyncio.sleep(0.05)
+        # Two jobs at the default 12000 tokens each fit in 25000; the third waits
+        assert [job.status for job in queued] == [RUNNING, RUNNING, QUEUED]
+        assert jobs.stats()["tokens_reserved"] == 24000
+
+        system.gate("a").set()
+        await until(lambda: queued[2].status == RUNNING)
+        assert system.peak == 2
+
+    check(workers=4, token_budget=25000)
+
+
+def test_drain_refuses_new_jobs_and_lets_accepted_ones_finish():
+    @run
+    async def check(jobs, system):
+        accepted = [await jobs.submit(q, "executive") for q in ("a", "b")]
+        draining = asyncio.create_task(jobs.drain(timeout=5))
+        await until(lambda: jobs.stats()["draining"])
+
+        with pytest.raises(AdmissionError) as error:
+            await jobs.submit("c", "executive")
+        assert error.value.status == 503
+
+        for q in ("a", "b"):
+            system.gate(q).set()
+        await draining
+        assert [job.status for job in accepted] == [SUCCEEDED, SUCCEEDED]
+
+    check(workers=1)
+
+
+def test_drain_timeout_cancels_running_and_queued_jobs():
+    @run
+    async def check(jobs, system):
+        running = await jobs.submit("a", "executive")
+        await until(lambda: running.status == RUNNING)
+        queued = await jobs.submit("b", "executive")
+
+        await jobs.drain(timeout=0.05)
+
+        assert (running.status, running.error) == (CANCELLED, "cancelled at shutdown")
+        assert (queued.status, queued.error) == (CANCELLED, "cancelled at shutdown before it started")
+        assert system.running == 0
+        assert jobs.stats()["queued"] == 0
+
+    check(workers=1)
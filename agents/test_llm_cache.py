@@ -0,0 +1,104 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import llm_cache
+from llm_cache import CachedLLM, LLMResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", ttl_seconds=60)
+    cache.put("k", "model", "answer", {})
+
+    clock.now += 59
+    assert cache.get("k")["content"] == "answer"
+
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_over_max_bytes(tmp_path, clock):
+    # Each entry is 10 bytes of content plus "{}", so three fit
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", max_bytes=36)
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, "model", key * 10, {})
+
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("d", "model", "d" * 10, {})
+
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    assert cache.stats() == {"entries": 3, "bytes": 36}
+
+
+def test_explicit_zero_overrides_the_environment(tmp_path, clock, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_TTL", "3600")
+    monkeypatch.setenv("LLM_CACHE_MAX_BYTES", "1000000")
+
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", ttl_seconds=0, max_bytes=0)
+    assert (cache.ttl_seconds, cache.max_bytes) == (0, 0)
+    # Nothing fits in zero bytes
+    cache.put("k", "model", "answer", {})
+    assert cache.get("k") is None
+
+
+def test_key_covers_model_temperature_and_messages():
+    messages = [HumanMessage(content="hi")]
+    key = LLMResponseCache.make_key("model", 0.1, messages)
+    assert key == LLMResponseCache.make_key("model", 0.1, [HumanMessage(content="hi")])
+    assert key != LLMResponseCache.make_key("other", 0.1, messages)
+    assert key != LLMResponseCache.make_key("model", 0.2, messages)
+    assert key != LLMResponseCache.make_key("model", 0.1, [HumanMessage(content="hello")])
+
+
+class FakeLLM:
+    model = "fake"
+    temperature = 0.1
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content="answer", response_metadata={"usage": {"input_tokens": 5, "output_tokens": 7}})
+
+
+class FakeObservability:
+    def __init__(self):
+        self.lookups = []
+
+    def log_cache_lookup(self, agent_name, hit):
+        self.lookups.append(hit)
+
+
+def test_cached_llm_serves_repeats_without_tokens(tmp_path):
+    llm, obs = FakeLLM(), FakeObservability()
+    cached = CachedLLM(llm, LLMResponseCache(tmp_path / "cache.sqlite"), obs, "Writer")
+    messages = [HumanMessage(content="hi")]
+
+    first = cached.invoke(messages)
+    second = cached.invoke(messages)
+
+    assert llm.calls == 1
+    assert second.content == first.content
+    assert second.response_metadata["usage"] == {"input_tokens": 0, "output_tokens": 0}
+    assert second.response_metadata["cache_hit"]
+    assert obs.lookups == [False, True]
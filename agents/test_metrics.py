@@ -0,0 +1,88 @@
+import threading
+
+from metrics import Counter, Gauge, Histogram
+
+
+def in_threads(fn, count: int):
+    threads = [threading.Thread(target=fn, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_quantile_interpolates_within_buckets():
+    histogram = Histogram("latency", "", buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) is None
+
+    for value in (0.5, 0.5, 1.5, 1.5):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.75) == 1.5
+    assert histogram.quantile(1.0) == 2.0
+
+
+def test_quantile_beyond_the_last_bucket_is_the_last_bound():
+    histogram = Histogram("latency", "", buckets=(1, 2))
+    histogram.observe(0.5)
+    histogram.observe(30)
+    assert histogram.quantile(0.99) == 2
+
+
+def test_quantile_by_label_or_across_labels():
+    histogram = Histogram("latency", "", ("agent",), buckets=(1, 2))
+    histogram.observe(0.5, agent="Planner")
+    histogram.observe(1.5, agent="Writer")
+
+    assert histogram.quantile(0.5, agent="Planner") == 0.5
+    assert histogram.quantile(0.5, agent="Writer") == 1.5
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.5, agent="Verifier") is None
+
+
+def test_shards_of_exited_threads_are_folded():
+    counter = Counter("calls", "", ("agent",))
+    histogram = Histogram("latency", "", buckets=(1, 2))
+
+    def record(i):
+        counter.inc(agent="Research")
+        counter.inc(2, agent="Writer" if i % 2 else "Research")
+        histogram.observe(0.5 if i % 2 else 1.5)
+
+    in_threads(record, 8)
+
+    assert counter.values() == {("Research",): 16, ("Writer",): 8}
+    # The dead threads' shards are now merged into one
+    assert counter._shards == []
+    assert counter.values() == {("Research",): 16, ("Writer",): 8}
+
+    counts, total, count = histogram.merged()[()]
+    assert counts == [4, 4, 0]
+    assert (total, count) == (8.0, 8)
+
+    in_threads(record, 2)
+    assert counter.value(agent="Research") == 20
+    assert histogram.merged()[()][2] == 10
+
+
+def test_gauge_sums_across_threads():
+    gauge = Gauge("in_flight", "")
+    gauge.inc(3)
+    in_threads(lambda i: gauge.dec(), 3)
+    assert gauge.value() == 0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "", ("agent",), buckets=(1, 2.5))
+    histogram.observe(0.5, agent="Writer")
+    histogram.observe(2, agent="Writer")
+    histogram.observe(3, agent="Writer")
+
+    assert histogram.render() == [
+        'latency_seconds_bucket{agent="Writer",le="1"} 1',
+        'latency_seconds_bucket{agent="Writer",le="2.5"} 2',
+        'latency_seconds_bucket{agent="Writer",le="+Inf"} 3',
+        'latency_seconds_sum{agent="Writer"} 5.5',
+        'latency_seconds_count{agent="Writer"} 3',
+    ]
@@ -24,8 +24,6 @@ print("ANALYST MODE")
 print("-" * 40)
 
 
-system.obs = system.obs.__class__()
-
 analyst_result = system.run(query, output_mode="analyst")
 
 print("\nAnalyst Summary:")
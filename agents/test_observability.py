@@ -0,0 +1,53 @@
+import threading
+
+from observability import AgentObservability
+
+
+def log_step(obs: AgentObservability, agent: str, error: str = None):
+    start = obs.log_agent_start(agent, {"query": agent})
+    obs.log_agent_end(agent, start, {"done": True}, tokens=10, error=error)
+
+
+def test_concurrent_runs_never_share_a_trace():
+    obs = AgentObservability(max_runs=10)
+    # Both runs are open and logging at the same time
+    barrier = threading.Barrier(2)
+    summaries = {}
+
+    def run(agent: str):
+        with obs.run_scope(run_id=agent) as trace:
+            for _ in range(3):
+                barrier.wait()
+                log_step(obs, agent, error="boom" if agent == "Writer" else None)
+            summaries[agent] = trace.summary()
+
+    threads = [threading.Thread(target=run, args=(agent,)) for agent in ("Planner", "Writer")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for agent, errors in (("Planner", 0), ("Writer", 3)):
+        summary = summaries[agent]
+        assert {trace["agent"] for trace in summary["detailed_trace"]} == {agent}
+        assert summary["total_agents_executed"] == 3
+        assert summary["total_tokens_used"] == 30
+        assert summary["error_count"] == errors
+    assert sorted(r["run_id"] for r in obs.recent_runs()) == ["Planner", "Writer"]
+    # Nothing leaked into the ad-hoc run
+    assert obs.get_summary()["detailed_trace"] == []
+
+
+def test_adhoc_run_is_archived_once_full():
+    obs = AgentObservability(max_adhoc_traces=4)
+
+    for _ in range(3):
+        log_step(obs, "Verifier", error="boom")
+
+    archived = obs.recent_runs()
+    assert [r["run_id"] for r in archived] == ["adhoc"]
+    assert len(archived[0]["detailed_trace"]) == 4
+    assert archived[0]["error_count"] == 2
+    current = obs.get_summary()
+    assert len(current["detailed_trace"]) == 2
+    assert current["error_count"] == 1
@@ -0,0 +1,95 @@
+import pytest
+
+import prompt_packer
+from prompt_packer import OUTPUT_RESERVE_TOKENS, PromptPacker
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """One token per word, so sizes don't depend on whether tiktoken is available"""
+    monkeypatch.setattr(prompt_packer, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(prompt_packer, "truncate_to_tokens",
+                        lambda text, n: " ".join(text.split()[:max(n, 0)]))
+
+
+def words(n: int, word: str = "w") -> str:
+    return " ".join([word] * n)
+
+
+def note(query_index: int, content: str, score: float) -> dict:
+    return {"query_index": query_index, "query": f"q{query_index}", "content": content,
+            "citations": [{"source": "doc", "page": 1, "chunk_id": f"c{query_index}", "score": score}]}
+
+
+def render_note(i: int, note: dict, content: str) -> str:
+    # Two tokens of header per note
+    return f"[{i}] {note['query']} {content}".strip()
+
+
+def test_small_sections_hand_their_slack_to_the_others():
+    packer = PromptPacker(100, {"question": 0.5, "draft": 0.5})
+
+    packed = packer.pack({"question": words(10, "q"), "draft": words(200, "d")})
+
+    assert packed["sections"]["question"] == words(10, "q")
+    assert packed["sections"]["draft"] == words(90, "d")
+    assert packed["tokens_packed"] == 100
+    assert packed["tokens_dropped"] == 110
+
+
+def test_everything_fits_untouched():
+    packer = PromptPacker(100, {"question": 0.2, "draft": 0.8})
+
+    packed = packer.pack({"question": words(5), "draft": words(20)})
+
+    assert packed["sections"] == {"question": words(5), "draft": words(20)}
+    assert packed["tokens_packed"] == 25
+    assert packed["tokens_dropped"] == 0
+
+
+def test_every_note_gets_a_slice_before_confidence_ranks_them():
+    packer = PromptPacker(100, {"notes": 1.0})
+    notes = [note(0, words(10, "a"), 0.1), note(1, words(50, "b"), 0.9), note(2, words(50, "c"), 0.5)]
+
+    packed = packer.pack({"notes": notes}, render_note=render_note)
+
+    # 94 tokens after headers: 31 each (note 0 only needs 10), then the
+    # leftover 22 goes to the most confident note first
+    rendered = packed["sections"]["notes"].split("\n\n")
+    assert rendered == [
+        render_note(0, notes[0], words(10, "a")),
+        render_note(1, notes[1], words(50, "b")),
+        render_note(2, notes[2], words(34, "c") + "..."),
+    ]
+    assert packed["tokens_packed"] == 100
+    assert packed["tokens_dropped"] == 16
+
+
+def test_notes_are_dropped_only_when_their_headers_dont_fit():
+    packer = PromptPacker(5, {"notes": 1.0})
+    notes = [note(0, words(10, "a"), 0.2), note(1, words(10, "b"), 0.9), note(2, words(10, "c"), 0.5)]
+
+    packed = packer.pack({"notes": notes}, render_note=render_note)
+
+    # Room for two headers: the two most confident notes stay, in planner order
+    rendered = packed["sections"]["notes"].split("\n\n")
+    assert rendered == [render_note(0, notes[1], "b..."), render_note(1, notes[2], "...")]
+    assert packed["tokens_packed"] == 5
+    assert packed["tokens_dropped"] == 31
+
+
+def test_limit_leaves_room_for_the_answer():
+    packer = PromptPacker(5000, {"draft": 1.0})
+
+    packed = packer.pack({"draft": words(200)}, limit=OUTPUT_RESERVE_TOKENS + 50)
+    assert packed["budget"] == 50
+    assert packed["sections"]["draft"] == words(50)
+
+    # A limit below the reserve leaves nothing for the prompt
+    packed = packer.pack({"draft": words(200)}, limit=OUTPUT_RESERVE_TOKENS // 2)
+    assert packed["budget"] == 0
+    assert packed["sections"]["draft"] == ""
+    assert packed["tokens_dropped"] == 200
+
+    # Without a limit the packer's own budget applies
+    assert packer.pack({"draft": words(200)})["budget"] == 5000
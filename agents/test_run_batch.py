@@ -0,0 +1,103 @@
+import pytest
+
+import metrics
+import tracing
+
+QUESTIONS = [
+    "How does hand hygiene compliance affect infection rates?",
+    "Which central line bundles reduce bloodstream infections?",
+    "How can ventilator associated pneumonia be prevented?",
+    "What surveillance is used for catheter associated infections?",
+    "When should surgical antibiotic prophylaxis be given?",
+]
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    """Traces handed to the exporters, i.e. those whose root span was closed"""
+    traces = []
+    monkeypatch.setattr(tracing, "_export", traces.append)
+    return traces
+
+
+def test_results_are_yielded_in_input_order(system):
+    results = list(system.run_batch(QUESTIONS, modes=["executive", "analyst"] * 2 + ["clinical"], concurrency=2))
+
+    assert [r["user_query"] for r in results] == QUESTIONS
+    assert [r["output_mode"] for r in results] == ["executive", "analyst"] * 2 + ["clinical"]
+    for result in results:
+        assert result["errors"] == []
+        assert result["sources"]
+        assert result["observability"]["spans"][0]["name"] == "run"
+
+
+def test_duplicate_requests_get_their_own_copy(system):
+    results = list(system.run_batch([QUESTIONS[0], QUESTIONS[1], QUESTIONS[0]]))
+
+    first, _, repeat = results
+    assert repeat == first
+    assert repeat is not first
+    repeat["action_items"].append({"task": "extra"})
+    repeat["sources"][0]["pages"].append(-1)
+    assert {"task": "extra"} not in first["action_items"]
+    assert -1 not in first["sources"][0]["pages"]
+
+
+def test_a_failing_plan_leaves_the_other_requests_alone(system, monkeypatch):
+    plan = system.planner.plan
+
+    def failing_plan(state):
+        if state["user_query"] == "fail":
+            raise RuntimeError("planner down")
+        return plan(state)
+
+    monkeypatch.setattr(system.planner, "plan", failing_plan)
+    in_flight = metrics.RUNS_IN_FLIGHT.value()
+
+    batch = system.run_batch([QUESTIONS[0], QUESTIONS[1], "fail"], concurrency=3)
+    for question in QUESTIONS[:2]:
+        result = next(batch)
+        assert result["user_query"] == question
+        assert result["errors"] == []
+        assert result["executive_summary"]
+    with pytest.raises(RuntimeError, match="planner down"):
+        next(batch)
+    assert metrics.RUNS_IN_FLIGHT.value() == in_flight
+
+
+def test_failed_pooled_search_falls_back_to_each_request(system, monkeypatch):
+    search = system.researcher.search
+    calls = []
+
+    def flaky_search(queries):
+        calls.append(queries)
+        if len(calls) == 1:
+            raise ConnectionError("chroma unavailable")
+        return search(queries)
+
+    monkeypatch.setattr(system.researcher, "search", flaky_search)
+    fallbacks = metrics.BATCH_SEARCH_FALLBACKS.value()
+
+    results = list(system.run_batch(QUESTIONS[:3], concurrency=3))
+
+    assert metrics.BATCH_SEARCH_FALLBACKS.value() == fallbacks + 1
+    # One pooled search for the group, then one retrieval per request
+    assert len(calls) == 4
+    for result in results:
+        assert result["errors"] == []
+        assert result["sources"]
+
+
+def test_closing_early_closes_every_run_and_root_span(system, exported):
+    in_flight = metrics.RUNS_IN_FLIGHT.value()
+
+    batch = system.run_batch(QUESTIONS, concurrency=2)
+    assert next(batch)["user_query"] == QUESTIONS[0]
+    batch.close()
+
+    assert metrics.RUNS_IN_FLIGHT.value() == in_flight
+    # Only the first group was started, and both of its runs were closed
+    assert len(exported) == 2
+    roots = [span for trace in exported for span in trace.spans if span.parent_id is None]
+    assert [span.name for span in roots] == ["run", "run"]
+    assert all(span.end_ns is not None for span in roots)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticQueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        # Every call is a later instant, so last_access never ties
+        self.now += 1
+        return self.now
+
+
+class FakeEmbeddings:
+    """Fixed vectors per query; paraphrases point almost the same way"""
+
+    VECTORS = {
+        "How do we cut readmissions?": [1.0, 0.0, 0.0],
+        "How can readmissions be reduced?": [0.98, 0.2, 0.0],
+        "What is hand hygiene?": [0.0, 1.0, 0.0],
+        "Who audits catheters?": [0.0, 0.0, 1.0],
+    }
+
+    def embed_query(self, text):
+        return self.VECTORS[text]
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    monkeypatch.setattr(semantic_cache.time, "time", Clock())
+
+
+@pytest.fixture
+def version():
+    return ["v1"]
+
+
+def make_cache(tmp_path, version, **kwargs):
+    return SemanticQueryCache(FakeEmbeddings(), lambda: version[0], path=tmp_path / "semantic.sqlite", **kwargs)
+
+
+def remember(cache, query: str, mode: str = "executive"):
+    cache.store(cache.embed(query), query, mode, {"executive_summary": f"answer to {query}"})
+
+
+def test_paraphrase_above_threshold_hits(tmp_path, version):
+    cache = make_cache(tmp_path, version, threshold=0.95)
+    remember(cache, "How do we cut readmissions?")
+
+    hit = cache.lookup(cache.embed("How can readmissions be reduced?"), "executive")
+    assert hit["executive_summary"] == "answer to How do we cut readmissions?"
+    assert hit["cache_hit"] is True
+    assert hit["cached_query"] == "How do we cut readmissions?"
+    assert 0.95 <= hit["cache_similarity"] < 1.0
+
+    assert cache.lookup(cache.embed("What is hand hygiene?"), "executive") is None
+
+
+def test_other_output_mode_misses(tmp_path, version):
+    cache = make_cache(tmp_path, version)
+    remember(cache, "How do we cut readmissions?", mode="executive")
+
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "analyst") is None
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "executive") is not None
+
+
+def test_entries_from_another_corpus_version_are_dropped(tmp_path, version):
+    cache = make_cache(tmp_path, version)
+    remember(cache, "How do we cut readmissions?")
+
+    version[0] = "v2"
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "executive") is None
+    # Gone for good, not just hidden while the version differs
+    version[0] = "v1"
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "executive") is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, version):
+    cache = make_cache(tmp_path, version, max_entries=2)
+    remember(cache, "How do we cut readmissions?")
+    remember(cache, "What is hand hygiene?")
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "executive") is not None
+
+    remember(cache, "Who audits catheters?")
+
+    assert cache.lookup(cache.embed("What is hand hygiene?"), "executive") is None
+    assert cache.lookup(cache.embed("How do we cut readmissions?"), "executive") is not None
+    assert cache.lookup(cache.embed("Who audits catheters?"), "executive") is not None
+
+
+def test_explicit_zero_overrides_the_environment(tmp_path, version, monkeypatch):
+    monkeypatch.setenv("SEMANTIC_CACHE_THRESHOLD", "0.95")
+    monkeypatch.setenv("SEMANTIC_CACHE_MAX_ENTRIES", "500")
+
+    cache = make_cache(tmp_path, version, threshold=0.0, max_entries=0)
+    assert cache.threshold == 0.0
+    assert cache.max_entries == 0
+
+    cache = make_cache(tmp_path, version, threshold=0.0)
+    remember(cache, "How do we cut readmissions?")
+    assert cache.lookup(cache.embed("What is hand hygiene?"), "executive") is not None
@@ -0,0 +1,64 @@
+import time
+
+from state import append_log, merge_research_notes
+
+QUERIES = [
+    "hand hygiene compliance",
+    "central line bloodstream infection",
+    "ventilator associated pneumonia prevention",
+    "catheter associated urinary tract infection",
+    "surgical site infection prophylaxis",
+    "isolation precautions for resistant organisms",
+]
+
+
+def note(query_index: int, content: str = "finding") -> dict:
+    return {"query_index": query_index, "query": f"q{query_index}", "content": content, "citations": []}
+
+
+def test_notes_are_kept_in_planner_order():
+    merged = merge_research_notes([note(2)], [note(0)])
+    merged = merge_research_notes(merged, [note(3), note(1)])
+    assert [n["query_index"] for n in merged] == [0, 1, 2, 3]
+
+
+def test_one_note_per_query_and_the_last_write_wins():
+    merged = merge_research_notes([note(0, "old"), note(1)], [note(0, "new")])
+    assert merged == [note(0, "new"), note(1)]
+
+    # Within one update too
+    assert merge_research_notes([], [note(0, "first"), note(0, "second")]) == [note(0, "second")]
+
+
+def test_merge_leaves_its_inputs_alone():
+    existing, new = [note(1)], [note(0)]
+    merge_research_notes(existing, new)
+    assert existing == [note(1)]
+    assert new == [note(0)]
+
+
+def test_append_log_appends_in_order():
+    assert append_log([], []) == []
+    assert append_log(["a"], ["b", "c"]) == ["a", "b", "c"]
+    assert append_log(["a", "b"], []) == ["a", "b"]
+
+
+def test_every_research_branch_lands_one_note_in_order(system, monkeypatch):
+    synthesize = system.researcher._synthesize_note
+
+    def last_query_first(query, query_index, results):
+        # Early queries finish last, so arrival order is the reverse of planner order
+        time.sleep(0.02 * (len(QUERIES) - query_index))
+        return synthesize(query, query_index, results)
+
+    monkeypatch.setattr(system.researcher, "_synthesize_note", last_query_first)
+    state = system._initial_state("How do hospitals prevent infections?", "executive")
+    state["research_queries"] = QUERIES
+
+    # batch_app starts at retrieval, so the plan above is what fans out
+    final = system.batch_app.invoke(state, config={"max_concurrency": len(QUERIES)})
+
+    assert final["error_log"] == []
+    assert [n["query_index"] for n in final["research_notes"]] == list(range(len(QUERIES)))
+    assert [n["query"] for n in final["research_notes"]] == QUERIES
+    assert all(n["citations"] for n in final["research_notes"])
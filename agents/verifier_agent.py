@@ -1,7 +1,10 @@
-from langchain_anthropic import ChatAnthropic
 from langchain.prompts import ChatPromptTemplate
-from state import AgentState
+from state import AgentState, format_citation
 from observability import AgentObservability
+from llm_cache import LLMResponseCache, with_cache
+from budget import RunBudget, with_budget
+from prompt_packer import PromptPacker
+import resources
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -13,13 +16,18 @@ load_dotenv(dotenv_path=env_path)
 class VerifierAgent:
     """Checks for hallucinations, missing evidence, contradictions"""
     
-    def __init__(self, observability: AgentObservability):
-        self.llm = ChatAnthropic(
-            model=os.getenv("MODEL_NAME", "claude-sonnet-4-20250514"),
-            temperature=0,
-            api_key=os.getenv("ANTHROPIC_API_KEY")
+    def __init__(self, observability: AgentObservability, cache: LLMResponseCache = None,
+                 budget: RunBudget = None):
+        self.llm = with_cache(
+            with_budget(resources.get_llm(temperature=0), budget), cache, observability, "Verifier"
         )
         self.obs = observability
+        self.budget = budget
+        # Deliverables get most of their share back when they are short
+        self.packer = PromptPacker(
+            int(os.getenv("VERIFIER_PROMPT_BUDGET", "3000")),
+            {"notes": 0.5, "summary": 0.15, "email": 0.25, "actions": 0.1}
+        )
         
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a fact-checking verification agent.
@@ -54,63 +62,100 @@ Action Items:
 Verify all content above.""")
         ])
     
-    def verify(self, state: AgentState) -> AgentState:
+    def verify(self, state: AgentState) -> dict:
         """Verify deliverables against research notes"""
-        start_time = self.obs.log_agent_start("Verifier", {
-            "summary_length": len(state.get("executive_summary", "")),
-            "notes_count": len(state["research_notes"])
-        })
+        start_time = self._start(state)
         
         try:
-            # Format inputs
-            notes_text = "\n\n".join([
-                f"{i+1}. {note['content'][:200]}...\n   Source: {note['source']}, {note['chunk_id']}"
-                for i, note in enumerate(state["research_notes"][:10])
-            ])
-            
-            actions_text = "\n".join([
-                f"- {action['task']} (Owner: {action['owner']})"
-                for action in state["action_items"]
-            ])
-            
-            response = self.llm.invoke(
-                self.prompt.format_messages(
-                    research_notes=notes_text,
-                    summary=state["executive_summary"],
-                    email=state["email_draft"],
-                    actions=actions_text
-                )
-            )
-            
-            content = response.content
-            
-            # Parse verification results
-            if "VERIFIED: All claims supported" in content:
-                state["verification_status"] = "PASSED"
-                state["hallucination_flags"] = []
-                state["missing_evidence"] = []
-            else:
-                state["verification_status"] = "ISSUES_FOUND"
-                state["hallucination_flags"] = self._extract_issues(content, "Hallucination")
-                state["missing_evidence"] = self._extract_issues(content, "Missing Evidence")
+            with self.obs.llm_call("Verifier") as call:
+                response = self.llm.invoke(self._messages(state))
+                call.record(response)
+            return self._apply(state, response, start_time)
             
-            state["current_agent"] = "Verifier"
-            
-            # Get token usage
-            usage = response.response_metadata.get('usage', {})
-            tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
-            
-            self.obs.log_agent_end("Verifier", start_time, {
-                "status": state["verification_status"],
-                "issues_found": len(state["hallucination_flags"]) + len(state["missing_evidence"])
-            }, tokens=tokens)
-            
-            return state
+        except Exception as e:
+            return self._fail(state, start_time, e)
+    
+    async def averify(self, state: AgentState) -> dict:
+        """Async counterpart of verify(), for arun()"""
+        start_time = self._start(state)
+        
+        try:
+            with self.obs.llm_call("Verifier") as call:
+                response = await self.llm.ainvoke(self._messages(state))
+                call.record(response)
+            return self._apply(state, response, start_time)
             
         except Exception as e:
-            self.obs.log_agent_end("Verifier", start_time, None, error=str(e))
-            state["error_log"].append(f"Verifier error: {str(e)}")
-            return state
+            return self._fail(state, start_time, e)
+    
+    def _start(self, state: AgentState) -> float:
+        return self.obs.log_agent_start("Verifier", {
+            "summary_length": len(state.get("executive_summary", "")),
+            "notes_count": len(state["research_notes"])
+        })
+    
+    def _messages(self, state: AgentState) -> list:
+        # Format inputs
+        actions_text = "\n".join([
+            f"- {action['task']} (Owner: {action['owner']})"
+            for action in state["action_items"]
+        ])
+        
+        packed = self.packer.pack(
+            {
+                "notes": state["research_notes"],
+                "summary": state["executive_summary"],
+                "email": state["email_draft"],
+                "actions": actions_text
+            },
+            render_note=self._render_note,
+            limit=self.budget.remaining_tokens() if self.budget else None
+        )
+        self.obs.log_prompt_pack("Verifier", packed["tokens_packed"], packed["tokens_dropped"])
+        sections = packed["sections"]
+        
+        return self.prompt.format_messages(
+            research_notes=sections["notes"],
+            summary=sections["summary"],
+            email=sections["email"],
+            actions=sections["actions"]
+        )
+    
+    def _apply(self, state: AgentState, response, start_time: float) -> dict:
+        content = response.content
+        
+        # Parse verification results
+        if "VERIFIED: All claims supported" in content:
+            update = {
+                "verification_status": "PASSED",
+                "hallucination_flags": [],
+                "missing_evidence": []
+            }
+        else:
+            update = {
+                "verification_status": "ISSUES_FOUND",
+                "hallucination_flags": self._extract_issues(content, "Hallucination"),
+                "missing_evidence": self._extract_issues(content, "Missing Evidence")
+            }
+        update["current_agent"] = "Verifier"
+        
+        # Get token usage
+        usage = response.response_metadata.get('usage', {})
+        tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        
+        self.obs.log_agent_end("Verifier", start_time, {
+            "status": update["verification_status"],
+            "issues_found": len(update["hallucination_flags"]) + len(update["missing_evidence"])
+        }, tokens=tokens)
+        
+        return update
+    
+    def _fail(self, state: AgentState, start_time: float, e: Exception) -> dict:
+        self.obs.log_agent_end("Verifier", start_time, None, error=str(e))
+        return {"error_log": [f"Verifier error: {str(e)}"]}
+    
+    def _render_note(self, i: int, note: dict, content: str) -> str:
+        return f"{i+1}. {content}\n   Sources: {' '.join(format_citation(c) for c in note['citations'])}"
     
     def _extract_issues(self, text: str, issue_type: str) -> list:
         """Extract specific types of issues from verification report"""
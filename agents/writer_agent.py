@@ -1,9 +1,15 @@
-from langchain_anthropic import ChatAnthropic
 from langchain.prompts import ChatPromptTemplate
-from state import AgentState, ActionItem
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import StreamWriter
+from state import AgentState, ActionItem, format_citation
 from observability import AgentObservability
-import os
+from llm_cache import LLMResponseCache, with_cache
+from budget import RunBudget, with_budget
+from prompt_packer import PromptPacker
+import resources
 import json
+import os
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -13,13 +19,17 @@ load_dotenv(dotenv_path=env_path)
 
 class WriterAgent:
     
-    def __init__(self, observability: AgentObservability):
-        self.llm = ChatAnthropic(
-            model=os.getenv("MODEL_NAME", "claude-sonnet-4-20250514"),
-            temperature=0.3,
-            api_key=os.getenv("ANTHROPIC_API_KEY")
+    def __init__(self, observability: AgentObservability, cache: LLMResponseCache = None,
+                 budget: RunBudget = None):
+        self.llm = with_cache(
+            with_budget(resources.get_llm(temperature=0.3), budget), cache, observability, "Writer"
         )
         self.obs = observability
+        self.budget = budget
+        self.packer = PromptPacker(
+            int(os.getenv("WRITER_PROMPT_BUDGET", "3000")),
+            {"plan": 0.15, "notes": 0.85}
+        )
         
         self.executive_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an executive report writer for healthcare leadership.
@@ -70,59 +80,147 @@ Provide 3-5 action items in JSON format:
 
 Cite sources as: [Source: DocumentName, Page X]"""
     
-    def write(self, state: AgentState) -> AgentState:
-        """Generate deliverables based on output mode"""
-        start_time = self.obs.log_agent_start("Writer", {
-            "mode": state["output_mode"],
-            "research_notes_count": len(state["research_notes"])
-        })
+    def write(self, state: AgentState, config: RunnableConfig = None,
+              writer: StreamWriter = None) -> dict:
+        """Generate deliverables based on output mode
+        
+        When the graph is streamed with stream_tokens set in the configurable,
+        response tokens are forwarded to LangGraph's stream writer as they arrive.
+        """
+        stream_tokens = self._stream_tokens(config, writer)
+        start_time = self._start(state)
         
         try:
-
-            notes_text = "\n\n".join([
-                f"Finding {i+1}:\n{note['content']}\n"
-                f"[Source: {note['source']}, Page {note['page']}, {note['chunk_id']}]"
-                for i, note in enumerate(state["research_notes"][:10])
-            ])
-            
-            prompt = self.executive_prompt if state["output_mode"] == "executive" else self.analyst_prompt
-            
-            response = self.llm.invoke(
-                prompt.format_messages(
-                    query=state["user_query"],
-                    plan=state["execution_plan"],
-                    research_notes=notes_text
-                )
-            )
+            messages = self._messages(state)
             
-            content = response.content
+            ttft = None
+            with self.obs.llm_call("Writer", streaming=stream_tokens) as call:
+                if not stream_tokens:
+                    response = self.llm.invoke(messages)
+                    usage = response.response_metadata.get('usage', {})
+                else:
+                    response, ttft = self._stream(messages, writer)
+                    usage = response.usage_metadata or response.response_metadata.get('usage', {})
+                    call.set_attribute("llm.ttft_seconds", ttft)
+                call.record(response)
             
-            summary = self._extract_section(content, "EXECUTIVE SUMMARY", "CLIENT-READY EMAIL")
-            email = self._extract_section(content, "CLIENT-READY EMAIL", "ACTION ITEMS")
-            actions_text = self._extract_section(content, "ACTION ITEMS", "---END---")
+            return self._apply(state, response, usage, ttft, start_time)
             
-            action_items = self._parse_actions(actions_text)
-            
-            state["executive_summary"] = summary.strip()
-            state["email_draft"] = email.strip()
-            state["action_items"] = action_items
-            state["current_agent"] = "Writer"
-            
-            usage = response.response_metadata.get('usage', {})
-            tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        except Exception as e:
+            return self._fail(state, start_time, e)
+    
+    async def awrite(self, state: AgentState, config: RunnableConfig = None,
+                     writer: StreamWriter = None) -> dict:
+        """Async counterpart of write(), for arun()"""
+        stream_tokens = self._stream_tokens(config, writer)
+        start_time = self._start(state)
+        
+        try:
+            messages = self._messages(state)
             
-            self.obs.log_agent_end("Writer", start_time, {
-                "summary_length": len(summary),
-                "email_length": len(email),
-                "action_count": len(action_items)
-            }, tokens=tokens)
+            ttft = None
+            with self.obs.llm_call("Writer", streaming=stream_tokens) as call:
+                if not stream_tokens:
+                    response = await self.llm.ainvoke(messages)
+                    usage = response.response_metadata.get('usage', {})
+                else:
+                    response, ttft = await self._astream(messages, writer)
+                    usage = response.usage_metadata or response.response_metadata.get('usage', {})
+                    call.set_attribute("llm.ttft_seconds", ttft)
+                call.record(response)
             
-            return state
+            return self._apply(state, response, usage, ttft, start_time)
             
         except Exception as e:
-            self.obs.log_agent_end("Writer", start_time, None, error=str(e))
-            state["error_log"].append(f"Writer error: {str(e)}")
-            return state
+            return self._fail(state, start_time, e)
+    
+    @staticmethod
+    def _stream_tokens(config: RunnableConfig, writer: StreamWriter) -> bool:
+        return writer is not None and (config or {}).get("configurable", {}).get("stream_tokens", False)
+    
+    def _start(self, state: AgentState) -> float:
+        return self.obs.log_agent_start("Writer", {
+            "mode": state["output_mode"],
+            "research_notes_count": len(state["research_notes"])
+        })
+    
+    def _messages(self, state: AgentState) -> list:
+        """Pack the plan and notes into the prompt budget and render the mode's prompt"""
+        packed = self.packer.pack(
+            {"plan": state["execution_plan"], "notes": state["research_notes"]},
+            render_note=self._render_note,
+            limit=self.budget.remaining_tokens() if self.budget else None
+        )
+        self.obs.log_prompt_pack("Writer", packed["tokens_packed"], packed["tokens_dropped"])
+        
+        prompt = self.executive_prompt if state["output_mode"] == "executive" else self.analyst_prompt
+        
+        return prompt.format_messages(
+            query=state["user_query"],
+            plan=packed["sections"]["plan"],
+            research_notes=packed["sections"]["notes"]
+        )
+    
+    def _apply(self, state: AgentState, response, usage: dict, ttft: float, start_time: float) -> dict:
+        """Split the response into the deliverables, as the node's state update"""
+        content = response.content
+        
+        summary = self._extract_section(content, "EXECUTIVE SUMMARY", "CLIENT-READY EMAIL")
+        email = self._extract_section(content, "CLIENT-READY EMAIL", "ACTION ITEMS")
+        actions_text = self._extract_section(content, "ACTION ITEMS", "---END---")
+        
+        action_items = self._parse_actions(actions_text)
+        
+        tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        
+        self.obs.log_agent_end("Writer", start_time, {
+            "summary_length": len(summary),
+            "email_length": len(email),
+            "action_count": len(action_items),
+            "ttft_seconds": ttft
+        }, tokens=tokens)
+        
+        return {
+            "executive_summary": summary.strip(),
+            "email_draft": email.strip(),
+            "action_items": action_items,
+            "current_agent": "Writer"
+        }
+    
+    def _fail(self, state: AgentState, start_time: float, e: Exception) -> dict:
+        self.obs.log_agent_end("Writer", start_time, None, error=str(e))
+        return {"error_log": [f"Writer error: {str(e)}"]}
+    
+    def _stream(self, messages: list, writer: StreamWriter) -> tuple:
+        """Stream the response through writer; returns (aggregated message, seconds to first token)"""
+        start = time.perf_counter()
+        ttft = None
+        full = None
+        for chunk in self.llm.stream(messages):
+            if chunk.content:
+                if ttft is None:
+                    ttft = round(time.perf_counter() - start, 3)
+                writer({"type": "token", "node": "writer", "text": chunk.content})
+            full = chunk if full is None else full + chunk
+        return full, ttft
+    
+    async def _astream(self, messages: list, writer: StreamWriter) -> tuple:
+        start = time.perf_counter()
+        ttft = None
+        full = None
+        async for chunk in self.llm.astream(messages):
+            if chunk.content:
+                if ttft is None:
+                    ttft = round(time.perf_counter() - start, 3)
+                writer({"type": "token", "node": "writer", "text": chunk.content})
+            full = chunk if full is None else full + chunk
+        return full, ttft
+    
+    def _render_note(self, i: int, note: dict, content: str) -> str:
+        return (
+            f"Finding {i+1} ({note['query']}):\n{content}\n"
+            f"Sources: {' '.join(format_citation(c) for c in note['citations'])}"
+        )
     
     def _extract_section(self, text: str, start_marker: str, end_marker: str) -> str:
         """Extract text between two markers"""
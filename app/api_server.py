@@ -0,0 +1,127 @@
+"""HTTP/JSON service in front of HealthcareMultiAgentSystem
+
+    POST /jobs              {"query": "...", "mode": "executive"} -> 202 with the job
+    GET  /jobs/{id}         the job's status, and its result once it has succeeded
+    GET  /jobs/{id}/events  server-sent events: status, node and token progress,
+                            then a final result or error event
+    GET  /healthz           queue depth and admission state
+    GET  /metrics           Prometheus metrics
+
+One process serves every client from a single event loop, running jobs
+through arun_stream() on the queue in agents/job_queue.py. A full backlog
+is answered with 429 and Retry-After. On SIGTERM/SIGINT the queue drains
+before the listener closes: new submissions get 503, polling keeps working,
+and accepted jobs are given SERVER_DRAIN_TIMEOUT seconds to finish.
+
+    cd app
+    python api_server.py    # SERVER_HOST / SERVER_PORT, default 0.0.0.0:8000
+"""
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Literal
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+parent_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(parent_dir))
+sys.path.insert(0, str(parent_dir / 'agents'))
+
+from graph import HealthcareMultiAgentSystem
+from job_queue import AdmissionError, JobQueue
+import metrics
+import resources
+
+
+class JobRequest(BaseModel):
+    query: str = Field(min_length=1)
+    mode: Literal["executive", "analyst"] = "executive"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model loading and Chroma are blocking; keep them off the loop
+    await asyncio.to_thread(resources.warm_up)
+    system = await asyncio.to_thread(HealthcareMultiAgentSystem)
+    app.state.jobs = JobQueue(system)
+    app.state.jobs.start()
+    yield
+    # A no-op after _Server.shutdown(); drains here when run by plain uvicorn
+    await app.state.jobs.drain()
+
+
+app = FastAPI(title="Healthcare Multi-Agent Copilot", lifespan=lifespan)
+
+
+def _job_or_404(request: Request, job_id: str):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"no job {job_id}")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(body: JobRequest, request: Request):
+    jobs = request.app.state.jobs
+    try:
+        job = await jobs.submit(body.query, body.mode)
+    except AdmissionError as e:
+        headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+        return JSONResponse({"detail": str(e)}, status_code=e.status, headers=headers)
+    return job.to_dict(jobs.position(job))
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    job = _job_or_404(request, job_id)
+    return job.to_dict(request.app.state.jobs.position(job))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    job = _job_or_404(request, job_id)
+
+    async def stream():
+        async for event in job.follow():
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/healthz")
+async def healthz(request: Request):
+    return request.app.state.jobs.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.REGISTRY.render()
+
+
+class _Server(uvicorn.Server):
+    async def shutdown(self, sockets=None):
+        # Drain while still listening, so event streams end with their jobs
+        # rather than being held open through uvicorn's own shutdown
+        await app.state.jobs.drain()
+        await super().shutdown(sockets)
+
+
+def main():
+    config = uvicorn.Config(
+        app,
+        host=os.getenv("SERVER_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVER_PORT", "8000")),
+        timeout_graceful_shutdown=5
+    )
+    _Server(config).run()
+
+
+if __name__ == "__main__":
+    main()
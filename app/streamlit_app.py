@@ -3,7 +3,10 @@ import sys
 import os
 from pathlib import Path
 import pandas as pd
+import altair as alt
 import json
+import re
+import requests
 from datetime import datetime
 
 parent_dir = Path(__file__).parent.parent
@@ -11,6 +14,7 @@ sys.path.insert(0, str(parent_dir))
 sys.path.insert(0, str(parent_dir / 'agents'))
 
 from graph import HealthcareMultiAgentSystem
+import resources
 
 st.set_page_config(
     page_title="Healthcare Multi-Agent Copilot",
@@ -18,10 +22,36 @@ st.set_page_config(
     layout="wide"
 )
 
+# With API_URL set (e.g. http://localhost:8000) the app is a thin client of
+# api_server.py; otherwise it runs the system in-process
+API_URL = os.getenv("API_URL", "").rstrip("/")
+
 @st.cache_resource
 def get_system():
+    resources.warm_up()
     return HealthcareMultiAgentSystem()
 
+def run_events(user_query: str, output_mode: str):
+    """run_stream() events, from the API service when API_URL is set"""
+    if not API_URL:
+        yield from get_system().run_stream(user_query, output_mode)
+        return
+    
+    response = requests.post(f"{API_URL}/jobs", json={"query": user_query, "mode": output_mode}, timeout=10)
+    if response.status_code != 202:
+        retry = response.headers.get("Retry-After")
+        raise RuntimeError(response.json().get("detail", response.text) + (f" (retry in {retry}s)" if retry else ""))
+    job = response.json()
+    
+    with requests.get(f"{API_URL}/jobs/{job['id']}/events", stream=True, timeout=(10, None)) as stream:
+        for line in stream.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event["type"] == "error":
+                raise RuntimeError(event["error"])
+            yield event
+
 st.markdown("""
 <style>
     .main-header {
@@ -88,15 +118,56 @@ with col2:
             del st.session_state['last_result']
         st.rerun()
 
+NODE_LABELS = {
+    "planner": "Planner created the research plan",
+    "research_retrieve": "Retrieved evidence for all research queries",
+    "research_query": "Research query synthesized",
+    "research_reduce": "Research complete, writing deliverables...",
+    "writer": "Writer finished, verifying claims...",
+    "verifier": "Verification complete"
+}
+
+def live_summary(text: str) -> str:
+    """The executive summary section of a partially streamed writer response"""
+    start = text.find("EXECUTIVE SUMMARY")
+    if start == -1:
+        return ""
+    section = text[start + len("EXECUTIVE SUMMARY"):]
+    end = section.find("CLIENT-READY EMAIL")
+    if end != -1:
+        section = section[:end]
+    # Drop the "2." that numbers the next section
+    return re.sub(r"\n\s*\d+\.?\s*$", "", section.strip()).strip()
+
 if submit_btn and user_query:
-    with st.spinner("Multi-agent system working..."):
-        try:
-            system = get_system()
-            result = system.run(user_query, output_mode)
-            st.session_state['last_result'] = result
+    status = st.status("Multi-agent system working...", expanded=True)
+    summary_placeholder = st.empty()
+    try:
+        streamed = ""
+        result = None
+        for event in run_events(user_query, output_mode):
+            if event["type"] == "node":
+                status.write(NODE_LABELS.get(event["node"], event["node"]))
+            elif event["type"] == "token":
+                streamed += event["text"]
+                summary = live_summary(streamed)
+                if summary:
+                    summary_placeholder.info(summary)
+            elif event["type"] == "result":
+                result = event["result"]
+
+        summary_placeholder.empty()
+        if result is None:
+            raise RuntimeError("stream ended without a result")
+        status.update(label="Multi-agent system finished", state="complete", expanded=False)
+        st.session_state['last_result'] = result
+        if result.get('cache_hit'):
+            st.success(f"Served from cache (matched: \"{result['cached_query']}\")")
+        else:
             st.success("Analysis Complete!")
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
+    except Exception as e:
+        status.update(label="Multi-agent system failed", state="error")
+        st.error(f"Error: {str(e)}")
 
 if 'last_result' in st.session_state:
     result = st.session_state['last_result']
@@ -189,6 +260,13 @@ if 'last_result' in st.session_state:
         col3.metric("Agents Executed", obs['total_agents_executed'])
         col4.metric("Errors", obs['error_count'])
         
+        timing = obs.get('timing', {})
+        if timing.get('duration_seconds') is not None:
+            col1, col2 = st.columns(2)
+            ttft = timing.get('ttft_seconds')
+            col1.metric("Time to First Token", f"{ttft}s" if ttft is not None else "n/a")
+            col2.metric("Total Duration", f"{timing['duration_seconds']}s")
+        
         st.subheader("Agent Performance Breakdown")
         
         trace_data = []
@@ -234,6 +312,28 @@ if 'last_result' in st.session_state:
                     st.info(f"Estimated Cost: ${cost:.4f}")
     
     with tab5:
+        spans = obs.get('spans', [])
+        if spans:
+            st.subheader("Span Waterfall")
+            df_spans = pd.DataFrame([{
+                "Span": f"{i:02d} " + "\u00a0\u00a0" * span['depth'] + span['name'],
+                "Kind": span['name'].split('.')[0],
+                "Start (ms)": span['offset_ms'],
+                "End (ms)": span['offset_ms'] + span['duration_ms'],
+                "Duration (ms)": span['duration_ms'],
+                "Status": span['status'],
+                "Attributes": json.dumps(span['attributes'], default=str)
+            } for i, span in enumerate(spans)])
+            
+            waterfall = alt.Chart(df_spans).mark_bar().encode(
+                x=alt.X("Start (ms):Q", title="Milliseconds since request"),
+                x2="End (ms):Q",
+                y=alt.Y("Span:N", sort=None, title=None),
+                color="Kind:N",
+                tooltip=["Span", "Duration (ms)", "Status", "Attributes"]
+            ).properties(height=max(200, 22 * len(df_spans)))
+            st.altair_chart(waterfall, use_container_width=True)
+        
         st.subheader("Detailed Agent Trace Log")
         st.json(obs['detailed_trace'], expanded=False)
     
@@ -0,0 +1,70 @@
+import sys
+import os
+import time
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(parent_dir / 'retrieval'))
+
+from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+from document_loader import HealthcareDocumentLoader
+
+
+def load_baseline(data_dir: str) -> list:
+    """The loader's original path: DirectoryLoader over PyPDFLoader, one file at a time"""
+    return DirectoryLoader(data_dir, glob="**/*.pdf", loader_cls=PyPDFLoader).load()
+
+
+def load_with_workers(data_dir: str, workers: int) -> list:
+    return HealthcareDocumentLoader(data_dir=data_dir, workers=workers).load_documents()
+
+
+def benchmark(label: str, load, repeats: int = 3) -> dict:
+    """Time load() and report the best pages/sec over a few repeats"""
+    best = None
+    pages = 0
+    
+    for _ in range(repeats):
+        start = time.perf_counter()
+        documents = load()
+        elapsed = time.perf_counter() - start
+        
+        pages = len(documents)
+        best = elapsed if best is None else min(best, elapsed)
+    
+    return {
+        "label": label,
+        "pages": pages,
+        "seconds": round(best, 3),
+        "pages_per_sec": round(pages / best, 1) if best else 0.0
+    }
+
+
+def main():
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else str(parent_dir / 'data')
+    worker_counts = [1, 2, 4, os.cpu_count() or 1]
+    
+    print("=" * 80)
+    print("PDF LOADER BENCHMARK")
+    print("=" * 80)
+    print(f"Data dir: {data_dir}")
+    
+    baseline = benchmark("DirectoryLoader", lambda: load_baseline(data_dir))
+    results = [baseline] + [
+        benchmark(f"{w} workers" if w > 1 else "1 (serial)", lambda w=w: load_with_workers(data_dir, w))
+        for w in sorted(set(worker_counts))
+    ]
+    
+    print("\n" + "=" * 80)
+    print(f"{'Loader':>16} {'Pages':>8} {'Seconds':>10} {'Pages/sec':>12} {'Speedup':>9}")
+    print("-" * 80)
+    for r in results:
+        # Relative to the original DirectoryLoader + PyPDFLoader path
+        speedup = baseline["seconds"] / r["seconds"] if r["seconds"] else 0.0
+        print(f"{r['label']:>16} {r['pages']:>8} {r['seconds']:>10} {r['pages_per_sec']:>12} {speedup:>8.2f}x")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare a pytest-benchmark JSON report against the stored baseline
+
+    pytest eval/benchmarks --benchmark-json=eval/benchmarks/results.json
+    python eval/benchmarks/compare.py eval/benchmarks/results.json
+    python eval/benchmarks/compare.py eval/benchmarks/results.json --save
+
+Benchmarks are matched by name and compared on the median, which is less
+sensitive to a noisy round than the mean. Exits with status 1 when any
+benchmark is slower than the baseline by more than the threshold
+(BENCH_REGRESSION_THRESHOLD, default 0.15 = 15%).
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+def load_medians(path) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    # Keyed without the directory, so runs from the repo root and from here line up
+    return {b["fullname"].split("/")[-1]: b["stats"]["median"] for b in report["benchmarks"]}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Rows of (name, baseline, current, relative change, status)"""
+    rows = []
+    for name, median in sorted(current.items()):
+        before = baseline.get(name)
+        if before is None:
+            rows.append((name, None, median, None, "new"))
+            continue
+        change = (median - before) / before if before else 0.0
+        rows.append((name, before, median, change, "REGRESSED" if change > threshold else "ok"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("results", help="JSON written by --benchmark-json")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.15")))
+    parser.add_argument("--save", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    current = load_medians(args.results)
+
+    if args.save:
+        with open(args.results) as f:
+            report = json.load(f)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline} ({len(current)} benchmarks)")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; create one with --save")
+        return 1
+
+    rows = compare(current, load_medians(args.baseline), args.threshold)
+
+    print(f"{'benchmark':70} {'baseline':>10} {'current':>10} {'change':>8}")
+    print("-" * 102)
+    for name, before, median, change, status in rows:
+        before_text = f"{before * 1000:9.2f}ms" if before is not None else f"{'-':>10}"
+        change_text = f"{change:+7.1%}" if change is not None else f"{'':>7}"
+        print(f"{name[-70:]:70} {before_text} {median * 1000:9.2f}ms {change_text}  {status}")
+
+    regressed = [row for row in rows if row[4] == "REGRESSED"]
+    print(f"\n{len(regressed)} of {len(rows)} benchmarks regressed by more than {args.threshold:.0%}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
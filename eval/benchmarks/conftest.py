@@ -0,0 +1,163 @@
+"""Shared setup for the offline benchmark suite
+
+Nothing here needs network access: the LLM is the synthetic backend
+(agents/llm_backend.py) and, unless BENCH_EMBEDDINGS=model, text is
+embedded with a feature-hashing stand-in for MiniLM so corpora of 100k
+chunks can be built in seconds. Search and orchestration costs are real;
+only the model inference is replaced.
+
+Synthetic corpora are cached under .cache/benchmarks/ and reused by later
+sessions. Sizes come from BENCH_CORPUS_SIZES (default 1000,10000,100000).
+"""
+import os
+import random
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / 'agents'))
+sys.path.insert(0, str(ROOT / 'retrieval'))
+
+# Offline defaults; anything already set in the environment wins
+for name, value in {
+    "LLM_BACKEND": "synthetic",
+    "SEMANTIC_CACHE": "off",
+    "RERANK": "off",
+    "EMBEDDING_CACHE_PATH": "off",
+    "TRACE_EXPORTERS": ""
+}.items():
+    os.environ.setdefault(name, value)
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain.schema import Document
+
+import resources
+from embedding_service import EmbeddingService
+from vector_store import HealthcareVectorStore, EMBEDDING_MODEL
+
+CORPUS_DIR = ROOT / '.cache' / 'benchmarks'
+CORPUS_SIZES = [int(n) for n in os.getenv("BENCH_CORPUS_SIZES", "1000,10000,100000").split(",")]
+DIMENSIONS = 384
+
+VOCABULARY = (
+    "patient hospital infection prevention hand hygiene catheter bloodstream pneumonia ventilator "
+    "sepsis antibiotic stewardship surveillance compliance audit nurse physician protocol bundle "
+    "readmission discharge heart failure diabetes screening outcome mortality incidence rate "
+    "intervention cohort randomized trial guideline evidence quality safety isolation precaution "
+    "disinfection environmental cleaning surgical site wound urinary tract transmission outbreak "
+    "vaccination staff education training leadership cost reduction policy monitoring feedback"
+).split()
+
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag of words, L2-normalised; deterministic and model-free"""
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def synthetic_text(rng: random.Random, words: int = 150) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def synthetic_pages(count: int, words: int = 600, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        Document(page_content=synthetic_text(rng, words),
+                 metadata={"source": f"synthetic_{i // 10}.pdf", "page": i % 10})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(scope="session")
+def embeddings():
+    """EmbeddingService over MiniLM with BENCH_EMBEDDINGS=model, else over HashEmbeddings"""
+    if os.getenv("BENCH_EMBEDDINGS", "hash") == "model":
+        return resources.get_embeddings()
+    return EmbeddingService(HashEmbeddings(), "hash-embeddings", cache_path="off")
+
+
+def build_corpus(size: int, embeddings) -> HealthcareVectorStore:
+    """Vector store (plus BM25 index) of size synthetic chunks, built once and cached on disk"""
+    directory = CORPUS_DIR / f"{embeddings.model_name.replace('/', '_')}_{size}"
+    store = HealthcareVectorStore(persist_directory=str(directory), embeddings=embeddings)
+    if directory.exists():
+        store.load_vectorstore()
+        if store.vectorstore._collection.count() == size:
+            return store
+        store.vectorstore.delete_collection()
+        store.vectorstore = None
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(size)
+    store.vectorstore = Chroma(
+        persist_directory=str(directory),
+        embedding_function=embeddings,
+        collection_name="healthcare_docs"
+    )
+    # Chroma caps a single add at ~5k records
+    for start in range(0, size, 5000):
+        chunks = [
+            Document(
+                page_content=synthetic_text(rng),
+                metadata={"source": f"synthetic_{i // 50}.pdf", "doc_name": f"synthetic_{i // 50}",
+                          "page": i % 50, "chunk_id": f"bench-{i:06d}"}
+            )
+            for i in range(start, min(start + 5000, size))
+        ]
+        store.vectorstore.add_documents(chunks, ids=[c.metadata["chunk_id"] for c in chunks])
+    store.build_bm25_index()
+    return store
+
+
+@pytest.fixture(scope="session", params=CORPUS_SIZES, ids=lambda n: f"{n // 1000}k")
+def corpus(request, embeddings):
+    return build_corpus(request.param, embeddings)
+
+
+@pytest.fixture(scope="session")
+def system(embeddings, tmp_path_factory):
+    """HealthcareMultiAgentSystem on the synthetic LLM over the smallest corpus
+
+    The agents open "../chroma_db" relative to the working directory, so the
+    system is built from a directory whose sibling is the benchmark corpus.
+    Everything is opened during construction, so the directory is only
+    needed until then.
+    """
+    from graph import HealthcareMultiAgentSystem
+
+    store = build_corpus(min(CORPUS_SIZES), embeddings)
+    root = tmp_path_factory.mktemp("system")
+    (root / "chroma_db").symlink_to(Path(store.persist_directory).resolve(), target_is_directory=True)
+    (root / "work").mkdir()
+
+    previous_cwd = os.getcwd()
+    previous_get_embeddings = resources.get_embeddings
+    os.chdir(root / "work")
+    resources.get_embeddings = lambda model_name=EMBEDDING_MODEL: embeddings
+    try:
+        system = HealthcareMultiAgentSystem()
+    finally:
+        resources.get_embeddings = previous_get_embeddings
+        os.chdir(previous_cwd)
+    yield system
+    resources.shutdown()
@@ -0,0 +1,87 @@
+"""Load test: hundreds of concurrent arun() calls on one event loop
+
+Every synthetic LLM call takes LOAD_LLM_LATENCY (default fixed:0.5), so
+requests spend most of their life waiting on the "API", as real ones do.
+The test checks that all LOAD_REQUESTS (default 300) are in flight at
+once, that waiting requests hold no thread, and that resident memory grows
+by less than LOAD_MAX_KB_PER_REQUEST (default 512) per request. Memory is
+read from /proc, so that check only runs on Linux.
+"""
+import asyncio
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+import metrics
+from llm_backend import LatencyModel
+
+REQUESTS = int(os.getenv("LOAD_REQUESTS", "300"))
+LATENCY = os.getenv("LOAD_LLM_LATENCY", "fixed:0.5")
+MAX_KB_PER_REQUEST = int(os.getenv("LOAD_MAX_KB_PER_REQUEST", "512"))
+STATM = Path("/proc/self/statm")
+TOPICS = ["central line infections", "hand hygiene compliance", "C. difficile transmission",
+          "catheter-associated urinary tract infections", "surgical site infections"]
+
+
+@pytest.fixture
+def slow_system(system, monkeypatch):
+    """The shared system with LATENCY on every agent's synthetic model, restored afterwards"""
+    for agent in (system.planner, system.researcher, system.writer, system.verifier):
+        llm = agent.llm
+        # BudgetedLLM -> RateLimitedLLM -> SyntheticLLM
+        while hasattr(llm, "llm"):
+            llm = llm.llm
+        monkeypatch.setattr(llm, "latency", LatencyModel.parse(LATENCY))
+    return system
+
+
+def _rss() -> int:
+    """Resident set size in bytes, or 0 where /proc isn't available"""
+    if not STATM.exists():
+        return 0
+    return int(STATM.read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def _load(system, requests: int) -> dict:
+    peak = {"in_flight": 0, "threads": 0, "rss": 0}
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            peak["in_flight"] = max(peak["in_flight"], metrics.RUNS_IN_FLIGHT.value())
+            peak["threads"] = max(peak["threads"], threading.active_count())
+            peak["rss"] = max(peak["rss"], _rss())
+            await asyncio.sleep(0.02)
+
+    sampler = asyncio.create_task(sample())
+    results = await asyncio.gather(*(
+        system.arun(f"What reduces {TOPICS[i % len(TOPICS)]}? (case {i})",
+                    "executive" if i % 2 else "analyst")
+        for i in range(requests)
+    ))
+    done.set()
+    await sampler
+    return {"results": results, **peak}
+
+
+def test_arun_concurrent_load(benchmark, slow_system):
+    baseline_threads = threading.active_count()
+    baseline_rss = _rss()
+    load = benchmark.pedantic(asyncio.run, args=(_load(slow_system, REQUESTS),), rounds=1)
+
+    kb_per_request = max(load["rss"] - baseline_rss, 0) / 1024 / REQUESTS
+    benchmark.extra_info.update({
+        "requests": REQUESTS,
+        "peak_in_flight": load["in_flight"],
+        "peak_threads": load["threads"],
+        "peak_kb_per_request": round(kb_per_request, 1)
+    })
+
+    assert all(not r["errors"] and r["sources"] for r in load["results"])
+    assert load["in_flight"] >= REQUESTS * 0.9
+    # The default executor's workers (for Chroma and embeddings), not one thread per request
+    assert load["threads"] - baseline_threads <= min(32, (os.cpu_count() or 1) + 4) + 4
+    if baseline_rss:
+        assert kb_per_request < MAX_KB_PER_REQUEST
@@ -0,0 +1,21 @@
+"""Macro benchmarks: whole runs through the graph on the synthetic LLM"""
+import pytest
+
+QUERY = "What are evidence-based strategies to reduce central line infections?"
+
+
+@pytest.mark.parametrize("mode", ["executive", "analyst"])
+def test_run(benchmark, system, mode):
+    result = benchmark.pedantic(system.run, args=(QUERY, mode), rounds=10, warmup_rounds=1)
+
+    assert not result["errors"] and result["sources"]
+    benchmark.extra_info["agents_executed"] = result["observability"]["total_agents_executed"]
+
+
+def test_run_stream(benchmark, system):
+    def consume():
+        return list(system.run_stream(QUERY, "executive"))
+
+    events = benchmark.pedantic(consume, rounds=10, warmup_rounds=1)
+
+    assert events[-1]["type"] == "result"
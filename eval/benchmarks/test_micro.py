@@ -0,0 +1,86 @@
+"""Micro benchmarks: ingestion, embedding, search and the agents' parsing helpers"""
+import os
+import random
+
+import pytest
+
+from conftest import synthetic_pages, synthetic_text
+from document_loader import HealthcareDocumentLoader
+from observability import AgentObservability
+from verifier_agent import VerifierAgent
+
+VERIFIER_REPORT = "\n".join(
+    ["Verification report", "", "Hallucinations:"]
+    + [f"- Claim {i}: the summary cites a {i}% reduction that no research note supports" for i in range(20)]
+    + ["", "Missing Evidence:"]
+    + [f"* Topic {i} is recommended without a source citation" for i in range(20)]
+    + ["", "Contradictions:", "- None found"]
+)
+
+
+def test_splitter_throughput(benchmark):
+    loader = HealthcareDocumentLoader(data_dir=".", workers=1)
+    pages = synthetic_pages(200)
+    hashes = {page.metadata["source"]: "0" * 64 for page in pages}
+
+    chunks = benchmark(lambda: list(loader.iter_chunks(pages, dict(hashes))))
+
+    benchmark.extra_info["pages"] = len(pages)
+    benchmark.extra_info["chunks"] = len(chunks)
+
+
+def test_embedding_throughput(benchmark, embeddings):
+    """Raw model throughput, bypassing EmbeddingService's cache"""
+    if os.getenv("BENCH_EMBEDDINGS", "hash") != "model":
+        pytest.skip("measures the real model; set BENCH_EMBEDDINGS=model")
+    rng = random.Random(1)
+    texts = [synthetic_text(rng) for _ in range(256)]
+
+    benchmark.pedantic(embeddings.model.embed_documents, args=(texts,), rounds=5, warmup_rounds=1)
+
+    benchmark.extra_info["texts"] = len(texts)
+
+
+def test_embedding_cache_hits(benchmark, embeddings):
+    rng = random.Random(2)
+    texts = [synthetic_text(rng) for _ in range(256)]
+    embeddings.embed_documents(texts)
+
+    benchmark(embeddings.embed_documents, texts)
+
+
+@pytest.mark.parametrize("k", [4, 20, 50])
+def test_similarity_search(benchmark, corpus, k):
+    query = "hand hygiene compliance audit in surgical units"
+
+    results = benchmark(corpus.similarity_search, query, k)
+
+    assert len(results) == k
+    benchmark.extra_info["chunks"] = corpus.vectorstore._collection.count()
+
+
+def test_compile_sources(benchmark, system):
+    notes = [
+        {
+            "query_index": q,
+            "query": f"query {q}",
+            "content": "finding",
+            "citations": [
+                {"source": f"doc_{(q * 7 + c) % 12}", "page": c % 30, "chunk_id": f"chunk-{q}-{c}", "score": 0.5}
+                for c in range(40)
+            ]
+        }
+        for q in range(5)
+    ]
+
+    sources = benchmark(system._compile_sources, notes)
+
+    assert len(sources) == 12
+
+
+def test_extract_issues(benchmark):
+    verifier = VerifierAgent(AgentObservability())
+
+    issues = benchmark(verifier._extract_issues, VERIFIER_REPORT, "Hallucination")
+
+    assert len(issues) == 20
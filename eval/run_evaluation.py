@@ -1,6 +1,10 @@
+import argparse
+import csv
 import json
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import pandas as pd
 from pathlib import Path
@@ -11,82 +15,165 @@ sys.path.insert(0, str(parent_dir))
 sys.path.insert(0, str(parent_dir / 'agents'))
 
 from graph import HealthcareMultiAgentSystem
+import resources
+import metrics
 
-def run_evaluation():
-    """Run all test queries and collect results"""
+RESULT_FIELDS = [
+    "query_id", "query", "mode", "status", "verification_status",
+    "summary_length", "summary_chars", "action_items_count", "sources_count",
+    "latency_seconds", "duration_seconds", "tokens_used", "error_count",
+    "hallucinations", "missing_evidence", "agents_executed", "error"
+]
+
+def print_latency_percentiles():
+    """p50/p95/p99 from the same histograms the /metrics endpoint serves"""
+    rows = [("End-to-end run", metrics.RUN_LATENCY, {})]
+    rows += [(f"Agent: {key[0]}", metrics.AGENT_LATENCY, {"agent": key[0]}) for key in sorted(metrics.AGENT_LATENCY.merged())]
+    rows += [(f"LLM call: {key[0]}", metrics.LLM_LATENCY, {"agent": key[0]}) for key in sorted(metrics.LLM_LATENCY.merged())]
+    rows.append(("Retrieval", metrics.RETRIEVAL_LATENCY, {}))
+    
+    print(f"\nLATENCY PERCENTILES (seconds, estimated from histogram buckets)")
+    print("-" * 80)
+    print(f"{'':30} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, histogram, labels in rows:
+        values = [histogram.quantile(q, **labels) for q in (0.5, 0.95, 0.99)]
+        if values[0] is None:
+            continue
+        print(f"{label:30} " + " ".join(f"{v:8.2f}" for v in values))
+
+def evaluate_query(system, test) -> dict:
+    """Run one test query and turn the result into a CSV row"""
+    try:
+        result = system.run(test['query'], test['mode'])
+        
+        return {
+            "query_id": test['id'],
+            "query": test['query'],
+            "mode": test['mode'],
+            "status": "SUCCESS",
+            "verification_status": result['verification_status'],
+            "summary_length": len(result['executive_summary'].split()),
+            "summary_chars": len(result['executive_summary']),
+            "action_items_count": len(result['action_items']),
+            "sources_count": len(result['sources']),
+            "latency_seconds": result['observability']['total_latency_seconds'],
+            "duration_seconds": result['observability']['timing']['duration_seconds'],
+            "tokens_used": result['observability']['total_tokens_used'],
+            "error_count": result['observability']['error_count'],
+            "hallucinations": len(result['hallucinations']),
+            "missing_evidence": len(result['missing_evidence']),
+            "agents_executed": result['observability']['total_agents_executed']
+        }
     
-    with open('test_queries_short.json', 'r') as f:
+    except Exception as e:
+        return {
+            "query_id": test['id'],
+            "query": test['query'],
+            "mode": test['mode'],
+            "status": "FAILED",
+            "error": str(e)
+        }
+
+def completed_queries(csv_file: str) -> set:
+    """(query_id, mode) pairs that already succeeded in csv_file; failed ones are rerun"""
+    if not os.path.exists(csv_file):
+        return set()
+    with open(csv_file, newline='') as f:
+        return {(row['query_id'], row['mode']) for row in csv.DictReader(f) if row['status'] == 'SUCCESS'}
+
+def append_result(csv_file: str, row: dict):
+    """Append one row, so an interrupted evaluation keeps everything finished so far"""
+    new_file = not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0
+    with open(csv_file, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, restval='')
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+def load_results(csv_file: str) -> pd.DataFrame:
+    """Latest row per query; a rerun of a failed query supersedes the failure"""
+    df = pd.read_csv(csv_file)
+    return df.drop_duplicates(subset=['query_id', 'mode'], keep='last').reset_index(drop=True)
+
+def run_evaluation(queries_file: str = 'test_queries_short.json', concurrency: int = None,
+                   csv_file: str = None, parquet_file: str = None):
+    """Run the test queries concurrently over one shared system
+    
+    Rows are appended to csv_file as each query finishes. Pointing csv_file
+    at an earlier, interrupted evaluation resumes it: queries that already
+    succeeded there are skipped. Anthropic calls from every worker share
+    the process-wide rate limiter (ANTHROPIC_RPM / ANTHROPIC_TPM).
+    """
+    concurrency = concurrency or int(os.getenv("EVAL_CONCURRENCY", "4"))
+    csv_file = csv_file or f'eval_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    
+    with open(queries_file, 'r') as f:
         test_queries = json.load(f)
     
+    done = completed_queries(csv_file)
+    pending = [test for test in test_queries if (test['id'], test['mode']) not in done]
+    
+    # Load the embedding model, vector store and clients once for every query
+    resources.warm_up()
     system = HealthcareMultiAgentSystem()
-    results = []
     
     print("=" * 80)
     print("STARTING EVALUATION")
     print("=" * 80)
     print(f"Total queries: {len(test_queries)}")
+    if done:
+        print(f"Resuming {csv_file}: {len(test_queries) - len(pending)} already done")
+    print(f"Concurrency: {concurrency}")
     print(f"Timestamp: {datetime.now().isoformat()}")
     print("=" * 80)
     
-    for i, test in enumerate(test_queries, 1):
-        print(f"\n[{i}/{len(test_queries)}] Processing {test['id']}: {test['query'][:60]}...")
-        
-        try:
-            system = HealthcareMultiAgentSystem()
-            
-            result = system.run(test['query'], test['mode'])
-            
-            eval_result = {
-                "query_id": test['id'],
-                "query": test['query'],
-                "mode": test['mode'],
-                "status": "SUCCESS",
-                "verification_status": result['verification_status'],
-                "summary_length": len(result['executive_summary'].split()),
-                "summary_chars": len(result['executive_summary']),
-                "action_items_count": len(result['action_items']),
-                "sources_count": len(result['sources']),
-                "latency_seconds": result['observability']['total_latency_seconds'],
-                "tokens_used": result['observability']['total_tokens_used'],
-                "error_count": result['observability']['error_count'],
-                "hallucinations": len(result['hallucinations']),
-                "missing_evidence": len(result['missing_evidence']),
-                "agents_executed": result['observability']['total_agents_executed']
-            }
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="eval") as pool:
+        futures = {pool.submit(evaluate_query, system, test): test for test in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            eval_result = future.result()
+            append_result(csv_file, eval_result)
             
+            print(f"\n[{i}/{len(pending)}] {eval_result['query_id']}: {eval_result['query'][:60]}...")
             print(f"  Status: {eval_result['status']}")
-            print(f"  Verification: {eval_result['verification_status']}")
-            print(f"  Latency: {eval_result['latency_seconds']}s")
-            print(f"  Tokens: {eval_result['tokens_used']}")
-            
-        except Exception as e:
-            eval_result = {
-                "query_id": test['id'],
-                "query": test['query'],
-                "mode": test['mode'],
-                "status": "FAILED",
-                "error": str(e)
-            }
-            print(f"  Status: FAILED")
-            print(f"  Error: {str(e)[:100]}")
-        
-        results.append(eval_result)
+            if eval_result['status'] == 'SUCCESS':
+                print(f"  Verification: {eval_result['verification_status']}")
+                print(f"  Latency: {eval_result['duration_seconds']}s")
+                print(f"  Tokens: {eval_result['tokens_used']}")
+            else:
+                print(f"  Error: {eval_result['error'][:100]}")
+    elapsed = time.perf_counter() - start
+
+    resources.shutdown()
 
-    df = pd.DataFrame(results)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_file = f'eval_results_{timestamp}.csv'
-    df.to_csv(csv_file, index=False)
+    df = load_results(csv_file)
+    results = df.to_dict('records')
+    
+    if parquet_file:
+        try:
+            df.to_parquet(parquet_file, index=False)
+        except ImportError as e:
+            print(f"Parquet output needs pyarrow or fastparquet: {e}")
+            parquet_file = None
     
 
     print("\n" + "=" * 80)
     print("EVALUATION SUMMARY")
     print("=" * 80)
     print(f"Total Queries: {len(results)}")
+    print(f"Wall Clock: {elapsed:.1f}s for {len(pending)} queries at concurrency {concurrency}")
     
     success_results = [r for r in results if r['status'] == 'SUCCESS']
     print(f"Successful: {len(success_results)}")
     print(f"Failed: {len(results) - len(success_results)}")
     
+    retries = metrics.LLM_RETRIES.values()
+    if retries:
+        print("LLM Retries: " + ", ".join(f"{key[0]}={int(value)}" for key, value in sorted(retries.items())))
+    rate_limit_wait = metrics.RATE_LIMIT_WAIT.merged().get((), [None, 0.0, 0])
+    if rate_limit_wait[2]:
+        print(f"Rate Limit Waits: {rate_limit_wait[2]} calls, {rate_limit_wait[1]:.1f}s total")
+    
     if success_results:
         print(f"\nPERFORMANCE METRICS (Successful queries only)")
         print("-" * 80)
@@ -96,9 +183,11 @@ def run_evaluation():
         
         print(f"Average Latency: {avg_latency:.2f}s")
         print(f"Average Tokens: {avg_tokens:.0f}")
-        print(f"Total Tokens Used: {sum(r['tokens_used'] for r in success_results):,}")
+        print(f"Total Tokens Used: {int(sum(r['tokens_used'] for r in success_results)):,}")
         print(f"Estimated Cost: ${sum(r['tokens_used'] for r in success_results) * 0.000003:.4f}")
         
+        print_latency_percentiles()
+        
         verified = sum(1 for r in success_results if r['verification_status'] == 'PASSED')
         print(f"\nVerification PASSED: {verified}/{len(success_results)} ({verified/len(success_results)*100:.1f}%)")
         
@@ -128,15 +217,23 @@ def run_evaluation():
             print(f"Analyst Mode Avg Summary: {analyst_avg_words:.0f} words")
     
     print(f"\nResults saved to: {csv_file}")
+    if parquet_file:
+        print(f"Parquet copy: {parquet_file}")
     print("=" * 80)
     
     return df
 
-if __name__ == "__main__":
-    print("\nWARNING: This will take 10-15 minutes and cost ~$1.00 in API credits")
-    response = input("Continue? (yes/no): ")
+def main():
+    parser = argparse.ArgumentParser(description="Run the evaluation queries (costs API credits)")
+    parser.add_argument("--queries", default="test_queries_short.json", help="test query file")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="queries in flight at once (default EVAL_CONCURRENCY or 4)")
+    parser.add_argument("--output", default=None,
+                        help="results CSV; an existing file is resumed (default eval_results_<timestamp>.csv)")
+    parser.add_argument("--parquet", default=None, help="also write the final results to this Parquet file")
+    args = parser.parse_args()
     
-    if response.lower() in ['yes', 'y']:
-        run_evaluation()
-    else:
-        print("Evaluation cancelled.")
\ No newline at end of file
+    run_evaluation(args.queries, args.concurrency, args.output, args.parquet)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
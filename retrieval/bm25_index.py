@@ -0,0 +1,121 @@
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import List
+import json
+import os
+import re
+import shutil
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "was", "were", "with"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Lexical BM25 index over the chunks in the Chroma collection
+
+    Postings are stored as flat numpy arrays with the BM25 weight of every
+    (term, chunk) pair precomputed, so a query is a handful of array slices
+    and a sum. The arrays are memory-mapped on load, which makes opening the
+    index instant regardless of corpus size.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / "vocab.json") as f:
+            self.vocab = json.load(f)
+        with open(self.path / "chunk_ids.json") as f:
+            self.chunk_ids = json.load(f)
+
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.postings = np.load(self.path / "postings.npy", mmap_mode="r")
+        self.weights = np.load(self.path / "weights.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return (Path(path) / "weights.npy").exists()
+
+    @classmethod
+    def build(cls, chunks, path: str, k1: float = 1.5, b: float = 0.75):
+        """Build from an iterable of (chunk_id, text) and persist to path"""
+        chunk_ids = []
+        lengths = []
+        term_postings = defaultdict(list)
+
+        for doc_idx, (chunk_id, text) in enumerate(chunks):
+            tokens = tokenize(text)
+            chunk_ids.append(chunk_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_postings[term].append((doc_idx, tf))
+
+        n_docs = len(chunk_ids)
+        avg_len = (sum(lengths) / n_docs) if n_docs else 0.0
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        vocab = {}
+        offsets = [0]
+        postings = []
+        weights = []
+        for term_id, term in enumerate(sorted(term_postings)):
+            entries = term_postings[term]
+            vocab[term] = term_id
+
+            df = len(entries)
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            docs = np.fromiter((d for d, _ in entries), dtype=np.int32, count=df)
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=df)
+            norm = k1 * (1 - b + b * lengths[docs] / avg_len) if avg_len else k1
+
+            postings.append(docs)
+            weights.append((idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+            offsets.append(offsets[-1] + df)
+
+        # Written to a sibling directory and swapped in, so readers never see a partial index
+        target = Path(path)
+        tmp = target.with_name(target.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        with open(tmp / "vocab.json", "w") as f:
+            json.dump(vocab, f)
+        with open(tmp / "chunk_ids.json", "w") as f:
+            json.dump(chunk_ids, f)
+        np.save(tmp / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(tmp / "postings.npy", np.concatenate(postings) if postings else np.zeros(0, np.int32))
+        np.save(tmp / "weights.npy", np.concatenate(weights) if weights else np.zeros(0, np.float32))
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        return cls(path)
+
+    def search(self, query: str, k: int = 10) -> list:
+        """Return up to k (chunk_id, bm25_score) pairs, best first"""
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        matched = False
+
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # A term lists each chunk at most once, so plain fancy indexing is safe
+            scores[self.postings[start:end]] += self.weights[start:end]
+            matched = True
+
+        if not matched:
+            return []
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.chunk_ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,111 @@
+from typing import List
+import hashlib
+import re
+import numpy as np
+
+SHINGLE_SIZE = 3
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def simhash(text: str) -> str:
+    """64-bit SimHash over word 3-shingles, as a hex string for Chroma metadata"""
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    # Each bit of the fingerprint is a majority vote across shingles
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+
+    value = sum(1 << i for i in np.flatnonzero(majority).tolist())
+    return f"{value:016x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class ChunkDeduplicator:
+    """Near-duplicate suppression plus maximal marginal relevance ordering
+
+    Chunks whose SimHash is within max_hamming bits of a chunk already kept
+    (for this query or an earlier query in the run) are dropped. The rest
+    are reordered by MMR, trading the incoming rank against similarity to
+    chunks already chosen. Similarity uses the embeddings already stored in
+    the vector store, so no chunk is embedded again at query time.
+    """
+
+    def __init__(self, vector_store, lambda_mult: float = 0.7, max_hamming: int = 8):
+        self.vector_store = vector_store
+        self.lambda_mult = lambda_mult
+        self.max_hamming = max_hamming
+
+    def fingerprint(self, doc) -> str:
+        # Chunks ingested before fingerprints existed are hashed on the fly
+        return doc.metadata.get("simhash") or simhash(doc.page_content)
+
+    def suppress(self, hits: list, seen: List[str]) -> tuple:
+        """Drop hits that near-duplicate seen or each other; returns (kept, dropped count)"""
+        kept = []
+        local = list(seen)
+        for doc, score in hits:
+            fp = self.fingerprint(doc)
+            if any(hamming(fp, other) <= self.max_hamming for other in local):
+                continue
+            local.append(fp)
+            kept.append((doc, score))
+        return kept, len(hits) - len(kept)
+
+    def vectors(self, hits_per_query: List[list]) -> dict:
+        """Stored embeddings of every hit, by chunk ID, read from Chroma in one call"""
+        chunk_ids = list(dict.fromkeys(
+            doc.metadata["chunk_id"] for hits in hits_per_query for doc, _ in hits
+        ))
+        if not chunk_ids:
+            return {}
+        raw = self.vector_store.get_chunks(chunk_ids, include=["embeddings"])
+        return {
+            chunk_id: np.asarray(embedding, dtype=np.float32)
+            for chunk_id, embedding in zip(raw["ids"], raw["embeddings"])
+        }
+
+    def mmr(self, hits: list, vectors: dict = None) -> list:
+        """Reorder hits (already ranked best first) by maximal marginal relevance
+
+        vectors maps chunk IDs to stored embeddings, as from vectors(); by
+        default they are read for these hits.
+        """
+        if len(hits) < 3:
+            return hits
+
+        vectors = self.vectors([hits]) if vectors is None else vectors
+        chunk_ids = [doc.metadata["chunk_id"] for doc, _ in hits]
+        missing = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in vectors]
+        if missing:
+            # Only chunks deleted since the search, e.g. by a sync, are embedded again
+            embedded = self.vector_store.embeddings.embed_documents([hits[i][0].page_content for i in missing])
+            vectors = dict(vectors)
+            for i, vector in zip(missing, embedded):
+                vectors[chunk_ids[i]] = np.asarray(vector, dtype=np.float32)
+
+        matrix = np.stack([vectors[chunk_id] for chunk_id in chunk_ids])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        similarity = matrix @ matrix.T
+
+        # Relevance from incoming rank, so the reranker's ordering is respected
+        relevance = 1.0 - np.arange(len(hits)) / len(hits)
+
+        selected = [0]
+        remaining = list(range(1, len(hits)))
+        while remaining:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            scores = self.lambda_mult * relevance[remaining] - (1 - self.lambda_mult) * redundancy
+            best = remaining[int(np.argmax(scores))]
+            selected.append(best)
+            remaining.remove(best)
+
+        return [hits[i] for i in selected]
@@ -1,46 +1,205 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from collections import deque
 from pathlib import Path
+from dedup import simhash
+import hashlib
 import os
 
+
+def _parse_page_range(path: str, start: int, end: int) -> tuple:
+    """Worker: extract pages [start, end) of one PDF as PyPDFLoader would"""
+    try:
+        reader = PdfReader(path)
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
+    return _read_pages(reader, path, start, end)
+
+
+def _read_pages(reader: PdfReader, path: str, start: int, end: int) -> tuple:
+    try:
+        pages = [
+            Document(
+                page_content=reader.pages[i].extract_text(),
+                metadata={"source": path, "page": i}
+            )
+            for i in range(start, end)
+        ]
+        return pages, None
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
+
+
 class HealthcareDocumentLoader:
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", workers: int = None, pages_per_task: int = None):
         self.data_dir = data_dir
+        # Serial by default; LOADER_WORKERS > 1 parses on that many processes
+        self.workers = workers or int(os.getenv("LOADER_WORKERS", "1"))
+        self.pages_per_task = pages_per_task or int(os.getenv("LOADER_PAGES_PER_TASK", "25"))
+        self.max_pending = int(os.getenv("LOADER_MAX_PENDING", self.workers * 2))
+        self.failed_files = {}
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True
         )
     
     def load_documents(self):
         print(f"Loading documents from {self.data_dir}...")
         
-        loader = DirectoryLoader(
-            self.data_dir,
-            glob="**/*.pdf",
-            loader_cls=PyPDFLoader,
-            show_progress=True
-        )
-        
-        documents = loader.load()
-        print(f"✓ Loaded {len(documents)} document pages")
+        # Serial or not, a PDF that fails to parse is skipped and listed in failed_files
+        documents = list(self.iter_documents())
+        workers = f" with {self.workers} workers" if self.workers > 1 else ""
+        print(f"✓ Loaded {len(documents)} document pages{workers}")
+        if self.failed_files:
+            print(f"  {len(self.failed_files)} file(s) could not be parsed: {list(self.failed_files)}")
         return documents
     
-    def split_documents(self, documents):
+    def iter_documents(self, paths: list = None):
+        """Yield pages of the given PDFs (default: all of data_dir) in file/page order
+        
+        With one worker, each file is opened once and parsed in-process.
+        Otherwise files, and page ranges of large files, are parsed on a
+        process pool. At most max_pending ranges are in flight, so a slow consumer holds the
+        parsers back instead of letting parsed pages pile up in memory.
+        A PDF that fails to parse is recorded in failed_files and skipped;
+        failed_files is reset at the start of every call.
+        """
+        self.failed_files = {}
+        if paths is None:
+            paths = [str(p) for p in sorted(Path(self.data_dir).glob("**/*.pdf"))]
+        
+        if self.workers <= 1:
+            # One reader per file, where pool workers each open their own per range
+            for path, reader, page_count in self._iter_readers(paths):
+                for start, end in self._page_ranges(page_count):
+                    yield from self._collect(path, _read_pages(reader, path, start, end))
+            return
+        
+        tasks = self._iter_tasks(paths)
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append((task[0], pool.submit(_parse_page_range, *task)))
+                if len(pending) >= self.max_pending:
+                    path, future = pending.popleft()
+                    yield from self._collect(path, future.result())
+            
+            # Drained in submission order, so output is deterministic
+            while pending:
+                path, future = pending.popleft()
+                yield from self._collect(path, future.result())
+        finally:
+            pool.shutdown(cancel_futures=True)
+    
+    def _iter_readers(self, paths: list):
+        """(path, reader, page count) per PDF that opens; the rest go to failed_files"""
+        for path in paths:
+            try:
+                reader = PdfReader(path)
+                page_count = len(reader.pages)
+            except Exception as e:
+                self.failed_files[path] = f"{type(e).__name__}: {e}"
+                print(f"✗ Skipping {path}: {self.failed_files[path]}")
+                continue
+            yield path, reader, page_count
+    
+    def _iter_tasks(self, paths: list):
+        for path, _, page_count in self._iter_readers(paths):
+            for start, end in self._page_ranges(page_count):
+                yield path, start, end
+    
+    def _page_ranges(self, page_count: int):
+        for start in range(0, page_count, self.pages_per_task):
+            yield start, min(start + self.pages_per_task, page_count)
+    
+    def _collect(self, path: str, result: tuple) -> list:
+        pages, error = result
+        if error:
+            self.failed_files[path] = error
+            print(f"✗ Failed to parse {path}: {error}")
+            return []
+        return pages
+    
+    def list_files(self) -> dict:
+        """Map every PDF under data_dir to the SHA-256 of its contents"""
+        files = {}
+        for path in sorted(Path(self.data_dir).glob("**/*.pdf")):
+            files[str(path)] = self.hash_file(path)
+        return files
+    
+    @staticmethod
+    def hash_file(path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def diff_manifest(self, manifest: dict) -> tuple:
+        """Compare data_dir against a manifest from a previous ingestion
+        
+        Returns (files to ingest as {path: hash}, paths that are gone or changed).
+        """
+        current = self.list_files()
+        previous = manifest.get("files", {})
+        
+        to_ingest = {
+            path: file_hash for path, file_hash in current.items()
+            if previous.get(path, {}).get("sha256") != file_hash
+        }
+        stale = [
+            path for path in previous
+            if path not in current or path in to_ingest
+        ]
+        return to_ingest, stale
+    
+    def split_documents(self, documents, file_hashes: dict = None):
         print("Splitting documents into chunks...")
         
         chunks = self.text_splitter.split_documents(documents)
+        self._tag_chunks(chunks, {} if file_hashes is None else file_hashes)
         
-        for idx, chunk in enumerate(chunks):
-            chunk.metadata['chunk_id'] = f"chunk_{idx:04d}"
-            
+        print(f"✓ Created {len(chunks)} chunks")
+        return chunks
+    
+    def iter_chunks(self, pages, file_hashes: dict = None):
+        """Split a stream of pages lazily, one page at a time"""
+        file_hashes = {} if file_hashes is None else file_hashes
+        for page in pages:
+            chunks = self.text_splitter.split_documents([page])
+            self._tag_chunks(chunks, file_hashes)
+            yield from chunks
+    
+    def _tag_chunks(self, chunks: list, file_hashes: dict):
+        for chunk in chunks:
             source = chunk.metadata.get('source', '')
+            doc_hash = file_hashes.get(source) or self.hash_file(source)
+            file_hashes[source] = doc_hash
+            
+            # Stable across re-ingestion: only changes when this file's content does
+            chunk.metadata['doc_hash'] = doc_hash
+            chunk.metadata['chunk_id'] = (
+                f"{doc_hash[:12]}-p{chunk.metadata.get('page', 0):04d}"
+                f"-{chunk.metadata.get('start_index', 0):06d}"
+            )
             chunk.metadata['doc_name'] = Path(source).stem
+            # Near-duplicate fingerprint, checked cheaply at query time
+            chunk.metadata['simhash'] = simhash(chunk.page_content)
+    
+    def process_files(self, files: dict):
+        """Load and split only the given {path: hash} files"""
+        docs = list(self.iter_documents(list(files)))
         
-        print(f"✓ Created {len(chunks)} chunks")
-        return chunks
+        if not docs:
+            return []
+        return self.split_documents(docs, dict(files))
     
     def process_all(self):
         """Load and split all documents"""
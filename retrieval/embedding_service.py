@@ -0,0 +1,237 @@
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+import numpy as np
+import tracing
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / '.cache' / 'embeddings.sqlite'
+
+
+class EmbeddingService(Embeddings):
+    """Batched, cached front end for a sentence-transformers embedding model
+
+    Concurrent embed_query() calls are gathered for up to max_wait_ms and
+    sent to the model as one batch. Every vector is cached in memory (LRU)
+    and on disk keyed by model name + text hash, so repeated queries and
+    unchanged chunks never reach the model again. Drop-in for Chroma's
+    embedding_function.
+    """
+
+    def __init__(self, model, model_name: str, cache_path: str = None,
+                 memory_cache_size: int = None, max_batch: int = None, max_wait_ms: float = None):
+        self.model = model
+        self.model_name = model_name
+        self.memory_cache_size = memory_cache_size or int(os.getenv("EMBEDDING_MEMORY_CACHE", "10000"))
+        self.max_batch = max_batch or int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+        self.max_wait = (max_wait_ms or float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))) / 1000
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+        self._disk = None
+        cache_path = cache_path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        if str(cache_path).lower() != "off":
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            self._disk = sqlite3.connect(str(cache_path), check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._disk.commit()
+
+        self.counters = {
+            "texts_requested": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "texts_embedded": 0,
+            "model_calls": 0,
+            "model_seconds": 0.0,
+            "query_batches": 0,
+            "queries_batched": 0
+        }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with tracing.span("embedding.embed_documents", {"texts": len(texts)}) as span:
+            return self._embed_documents(texts, span)
+
+    def _embed_documents(self, texts: List[str], span) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = self._lookup(keys)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        span.set_attribute("cache_hits", len(texts) - len(missing))
+        # Identical texts in one call are only embedded once
+        unique = list(OrderedDict((keys[i], texts[i]) for i in missing).items())
+
+        computed = {}
+        for start in range(0, len(unique), self.max_batch):
+            batch = unique[start:start + self.max_batch]
+            embedded = self._run_model([text for _, text in batch])
+            self._store([key for key, _ in batch], embedded)
+            computed.update(zip([key for key, _ in batch], embedded))
+
+        for i in missing:
+            vectors[i] = computed[keys[i]]
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with tracing.span("embedding.embed_query") as span:
+            key = self._key(text)
+            cached = self._lookup([key])[0]
+            span.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                return cached
+
+            future = Future()
+            self._queue.put((key, text, future))
+            self._ensure_worker()
+            return future.result()
+
+    def close(self):
+        """Stop the query batching worker and close the disk cache
+
+        Queries already queued are answered first. A later call starts a new
+        worker and only uses the in-memory cache.
+        """
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        embedded = counters["texts_embedded"]
+        seconds = counters["model_seconds"]
+        counters["texts_per_second"] = round(embedded / seconds, 1) if seconds else 0.0
+        counters["avg_model_call_ms"] = (
+            round(seconds / counters["model_calls"] * 1000, 2) if counters["model_calls"] else 0.0
+        )
+        requested = counters["texts_requested"]
+        counters["cache_hit_ratio"] = (
+            round((counters["memory_hits"] + counters["disk_hits"]) / requested, 3) if requested else 0.0
+        )
+        return counters
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: list) -> list:
+        vectors = [None] * len(keys)
+        disk_keys = []
+
+        with self._lock:
+            self.counters["texts_requested"] += len(keys)
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[i] = self._memory[key]
+                    self.counters["memory_hits"] += 1
+                else:
+                    disk_keys.append(i)
+
+            if self._disk is not None and disk_keys:
+                for i in disk_keys:
+                    row = self._disk.execute(
+                        "SELECT vector FROM embeddings WHERE key = ?", (keys[i],)
+                    ).fetchone()
+                    if row:
+                        vectors[i] = np.frombuffer(row[0], dtype=np.float32).tolist()
+                        self._remember(keys[i], vectors[i])
+                        self.counters["disk_hits"] += 1
+
+        return vectors
+
+    def _store(self, keys: list, vectors: list):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [(key, np.asarray(v, dtype=np.float32).tobytes()) for key, v in zip(keys, vectors)]
+                )
+                self._disk.commit()
+
+    def _remember(self, key: str, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_cache_size:
+            self._memory.popitem(last=False)
+
+    def _run_model(self, texts: list) -> list:
+        with self._model_lock, tracing.span("embedding.model", {"texts": len(texts)}):
+            start = time.perf_counter()
+            vectors = self.model.embed_documents(texts)
+            elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.counters["model_calls"] += 1
+            self.counters["texts_embedded"] += len(texts)
+            self.counters["model_seconds"] += elapsed
+        return vectors
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._batch_queries, daemon=True)
+                self._worker.start()
+
+    def _batch_queries(self):
+        while True:
+            first = self._queue.get()
+            # None is close() asking the worker to stop
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                unique = list(OrderedDict((key, text) for key, text, _ in batch).items())
+                vectors = self._run_model([text for _, text in unique])
+                self._store([key for key, _ in unique], vectors)
+                by_key = dict(zip([key for key, _ in unique], vectors))
+
+                with self._lock:
+                    self.counters["query_batches"] += 1
+                    self.counters["queries_batched"] += len(batch)
+
+                for key, _, future in batch:
+                    future.set_result(by_key[key])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            if stopping:
+                return
@@ -0,0 +1,98 @@
+from langchain.schema import Document
+from typing import List
+import numpy as np
+import tracing
+
+
+class HybridRetriever:
+    """Dense + BM25 retrieval fused with reciprocal rank fusion
+
+    Drop-in for HealthcareVectorStore.similarity_search(_batch): results are
+    (Document, distance) pairs, where the distance is the same squared L2
+    distance Chroma reports, also for chunks only the lexical index found.
+
+    The BM25 index is taken from the vector store on every search, so one
+    rebuilt by a sync is used straight away. Until an index exists, this
+    is plain dense search.
+    """
+
+    def __init__(self, vector_store, candidates: int = 20, rrf_k: int = 60):
+        self.vector_store = vector_store
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def similarity_search(self, query: str, k: int = 5):
+        return self.similarity_search_batch([query], k=k)[0]
+
+    def similarity_search_batch(self, queries: List[str], k: int = 5, dedup: bool = False) -> List[list]:
+        if not queries:
+            return []
+        index = self.vector_store.bm25_index()
+        if index is None:
+            return self.vector_store.similarity_search_batch(queries, k=k, dedup=dedup)
+
+        n = max(k, self.candidates)
+        dense = self.vector_store.similarity_search_batch(queries, k=n)
+        query_vectors = self.vector_store.embeddings.embed_documents(list(queries))
+
+        fused = []
+        missing = set()
+        for query, hits in zip(queries, dense):
+            with tracing.span("bm25.search", {"k": n}):
+                lexical = index.search(query, n)
+            ranked = self._fuse(
+                [doc.metadata['chunk_id'] for doc, _ in hits],
+                [chunk_id for chunk_id, _ in lexical]
+            )
+            fused.append(ranked)
+            known = {doc.metadata['chunk_id'] for doc, _ in hits}
+            missing.update(chunk_id for chunk_id in ranked[:k] if chunk_id not in known)
+
+        lexical_only = self._fetch(missing)
+
+        seen = set()
+        results = []
+        for ranked, hits, query_vector in zip(fused, dense, query_vectors):
+            by_id = {doc.metadata['chunk_id']: (doc, score) for doc, score in hits}
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+
+            picked = []
+            for chunk_id in ranked:
+                if len(picked) == k:
+                    break
+                if dedup and chunk_id in seen:
+                    continue
+                if chunk_id in by_id:
+                    picked.append(by_id[chunk_id])
+                elif chunk_id in lexical_only:
+                    doc, embedding = lexical_only[chunk_id]
+                    picked.append((doc, float(np.sum((embedding - query_vector) ** 2))))
+                else:
+                    continue
+                seen.add(chunk_id)
+            results.append(picked)
+
+        return results
+
+    def _fuse(self, dense_ids: list, lexical_ids: list) -> list:
+        scores = {}
+        for ranking in (dense_ids, lexical_ids):
+            for rank, chunk_id in enumerate(ranking):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        # Ties keep dense order first, which keeps results stable between runs
+        order = {chunk_id: i for i, chunk_id in enumerate(dense_ids + lexical_ids)}
+        return sorted(scores, key=lambda c: (-scores[c], order[c]))
+
+    def _fetch(self, chunk_ids: set) -> dict:
+        if not chunk_ids:
+            return {}
+        raw = self.vector_store.get_chunks(sorted(chunk_ids))
+        return {
+            chunk_id: (
+                Document(page_content=text, metadata=metadata or {}),
+                np.asarray(embedding, dtype=np.float32)
+            )
+            for chunk_id, text, metadata, embedding in zip(
+                raw["ids"], raw["documents"], raw["metadatas"], raw["embeddings"]
+            )
+        }
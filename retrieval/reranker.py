@@ -0,0 +1,66 @@
+from typing import List
+import threading
+from tokens import count_tokens
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Rescores (query, chunk) pairs with a small CPU cross-encoder"""
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = 32):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, device="cpu")
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, hits: list) -> list:
+        return self.rerank_batch([query], [hits])[0]
+
+    def rerank_batch(self, queries: List[str], hits_per_query: List[list]) -> List[list]:
+        """Score every candidate of every query in one batched forward pass
+
+        Each hits list holds (Document, distance) pairs; the result keeps
+        that shape, sorted best first by cross-encoder score.
+        """
+        pairs = [
+            (query, doc.page_content)
+            for query, hits in zip(queries, hits_per_query)
+            for doc, _ in hits
+        ]
+        if not pairs:
+            return [[] for _ in queries]
+
+        with self._lock:
+            scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+
+        reranked = []
+        position = 0
+        for hits in hits_per_query:
+            scored = list(zip(hits, scores[position:position + len(hits)]))
+            position += len(hits)
+            scored.sort(key=lambda item: -float(item[1]))
+            reranked.append([hit for hit, _ in scored])
+        return reranked
+
+
+def pack_by_tokens(hits: list, token_budget: int) -> tuple:
+    """Keep the best-ranked hits whose chunks fit in token_budget
+
+    Hits that would overflow the budget are skipped in favour of smaller
+    ones further down; the top hit is always kept. Returns
+    (packed hits, tokens packed, tokens dropped).
+    """
+    packed = []
+    used = 0
+    dropped = 0
+    for doc, score in hits:
+        tokens = count_tokens(doc.page_content)
+        if packed and used + tokens > token_budget:
+            dropped += tokens
+            continue
+        packed.append((doc, score))
+        used += tokens
+    return packed, used, dropped
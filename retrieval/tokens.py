@@ -0,0 +1,39 @@
+import threading
+
+_encoder = None
+_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        with _lock:
+            if _encoder is None:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # No BPE file available (e.g. offline): fall back to a chars/4 estimate
+                    _encoder = False
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Local token estimate; cl100k_base is close enough to Claude's tokenizer for budgeting"""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder()
+    if encoder:
+        tokens = encoder.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoder.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
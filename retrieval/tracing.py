@@ -0,0 +1,277 @@
+"""Lightweight span tracing shared by the agents and the retrieval layer
+
+Spans nest through a context variable: run -> agent -> retrieval / embedding /
+LLM call. A span opened outside a run, or with TRACING=off, is a shared no-op
+object, so instrumented code costs one function call when tracing is unused.
+Finished runs are handed to the exporters named in TRACE_EXPORTERS
+("jsonl", "otlp", or both) on a background thread.
+"""
+from contextvars import ContextVar
+from pathlib import Path
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+
+DEFAULT_JSONL_PATH = Path(__file__).parent.parent / '.cache' / 'traces.jsonl'
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+SERVICE_NAME = "healthcare-multiagent"
+
+_enabled = os.getenv("TRACING", "on").lower() not in ("off", "false", "0")
+_current = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """Spans of one run, plus the offset from perf_counter_ns to wall clock"""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "_token")
+
+    def __init__(self, name: str, trace: _Trace, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "ok"
+        self.start_ns = None
+        self.end_ns = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict):
+        self.attributes.update(attributes)
+
+    def start(self):
+        self.start_ns = time.perf_counter_ns()
+        self._token = _current.set(self)
+        return self
+
+    def end(self, error: str = None):
+        self.end_ns = time.perf_counter_ns()
+        if error:
+            self.status = "error"
+            self.attributes["error"] = error
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Ended from a different context (e.g. a generator closed elsewhere)
+            pass
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            _export(self.trace)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=f"{exc_type.__name__}: {exc}" if exc_type else None)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_unix_ns": self.start_ns + self.trace.epoch_offset_ns,
+            "end_unix_ns": (self.end_ns or self.start_ns) + self.trace.epoch_offset_ns,
+            "duration_ms": round(((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": dict(self.attributes)
+        }
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def start(self):
+        return self
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, attributes: dict = None, root: bool = False):
+    """Context manager for a child of the current span (or a new trace when root=True)"""
+    if not _enabled:
+        return NOOP_SPAN
+    parent = _current.get()
+    if parent is not None:
+        return Span(name, parent.trace, parent.span_id, attributes)
+    if root:
+        return Span(name, _Trace(), None, attributes)
+    return NOOP_SPAN
+
+
+def start_span(name: str, attributes: dict = None):
+    """Open a child span without a with-block; close it with end_span(name)"""
+    return span(name, attributes).start()
+
+
+def end_span(name: str, attributes: dict = None, error: str = None):
+    """End the current span if it is the one called name"""
+    current = _current.get()
+    if current is None or current.name != name:
+        return
+    if attributes:
+        current.set_attributes(attributes)
+    current.end(error=error)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def collect(root) -> list:
+    """Finished spans of root's trace for display, ordered by start, with depth and offset"""
+    if not isinstance(root, Span):
+        return []
+
+    spans = sorted(root.trace.spans, key=lambda s: s.start_ns)
+    depth = {root.span_id: 0}
+    rows = []
+    for s in spans:
+        if s.span_id != root.span_id:
+            depth[s.span_id] = depth.get(s.parent_id, 0) + 1
+        row = s.to_dict()
+        row["depth"] = depth[s.span_id]
+        row["offset_ms"] = round((s.start_ns - root.start_ns) / 1e6, 3)
+        rows.append(row)
+    return rows
+
+
+def llm_attributes(response) -> dict:
+    """Token and cache attributes for an LLM call span"""
+    usage = getattr(response, "usage_metadata", None) or response.response_metadata.get("usage", {})
+    return {
+        "llm.input_tokens": usage.get("input_tokens", 0),
+        "llm.output_tokens": usage.get("output_tokens", 0),
+        "llm.cache_hit": bool(response.response_metadata.get("cache_hit", False))
+    }
+
+
+class JsonlExporter:
+    def __init__(self, path: str = None):
+        self.path = Path(path or os.getenv("TRACE_JSONL_PATH", DEFAULT_JSONL_PATH))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: list):
+        with open(self.path, "a") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+class OtlpExporter:
+    """Posts spans to an OTLP/HTTP collector using the JSON encoding"""
+
+    def __init__(self, endpoint: str = None, timeout: float = 2.0):
+        self.endpoint = endpoint or os.getenv("OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT)
+        self.timeout = timeout
+
+    def export(self, spans: list):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [self._encode(s) for s in spans]
+                }]
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+    def _encode(self, s: Span) -> dict:
+        data = s.to_dict()
+        encoded = {
+            "traceId": data["trace_id"],
+            "spanId": data["span_id"],
+            "name": data["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(data["start_unix_ns"]),
+            "endTimeUnixNano": str(data["end_unix_ns"]),
+            "attributes": [_otlp_attribute(k, v) for k, v in data["attributes"].items()],
+            "status": {"code": 2 if s.status == "error" else 1}
+        }
+        if data["parent_id"]:
+            encoded["parentSpanId"] = data["parent_id"]
+        return encoded
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+_exporters = None
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _get_exporters() -> list:
+    global _exporters
+    if _exporters is None:
+        names = [n.strip() for n in os.getenv("TRACE_EXPORTERS", "").split(",") if n.strip()]
+        factories = {"jsonl": JsonlExporter, "otlp": OtlpExporter}
+        _exporters = [factories[name]() for name in names if name in factories]
+    return _exporters
+
+
+def _export(trace: _Trace):
+    global _worker
+    if not _get_exporters():
+        return
+    _queue.put(list(trace.spans))
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_export_loop, daemon=True)
+                _worker.start()
+
+
+def _export_loop():
+    while True:
+        spans = _queue.get()
+        for exporter in _get_exporters():
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                print(f"Trace export via {type(exporter).__name__} failed: {e}")
@@ -2,36 +2,280 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from typing import List
 from langchain.schema import Document
+from pathlib import Path
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
+from collections import deque
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from embedding_service import EmbeddingService
+from bm25_index import BM25Index
+import tracing
+
 load_dotenv()
 
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
 class HealthcareVectorStore:
     
-    def __init__(self, persist_directory: str = "chroma_db"):
+    def __init__(self, persist_directory: str = "chroma_db", embeddings=None):
         self.persist_directory = persist_directory
-        # Use free local embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
+        # Use free local embeddings; pass a shared instance to skip reloading the model
+        self.embeddings = embeddings or EmbeddingService(
+            HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL), EMBEDDING_MODEL
         )
         self.vectorstore = None
+        self._lock = threading.Lock()
+        # (manifest and checkpoint stats, fingerprint) from the last corpus_version()
+        self._corpus_version = None
+        # (stats of the index on disk, BM25Index) from the last bm25_index()
+        self._bm25 = None
+        # Timing of the most recent searches, newest last
+        self.search_metrics = deque(maxlen=1000)
     
     def create_vectorstore(self, documents: List[Document]):
         print(f"Creating vector store with {len(documents)} documents...")
         print("Using local embeddings (this may take a few minutes)...")
         
+        chunk_ids = [doc.metadata['chunk_id'] for doc in documents]
         self.vectorstore = Chroma.from_documents(
             documents=documents,
             embedding=self.embeddings,
+            ids=chunk_ids,
             persist_directory=self.persist_directory,
             collection_name="healthcare_docs"
         )
         
+        manifest = {"files": {}}
+        for doc in documents:
+            entry = manifest["files"].setdefault(doc.metadata['source'], {
+                "sha256": doc.metadata['doc_hash'],
+                "chunk_ids": []
+            })
+            entry["chunk_ids"].append(doc.metadata['chunk_id'])
+        self._write_manifest(manifest)
+        
         print(f"✓ Vector store created and saved to {self.persist_directory}")
         return self.vectorstore
     
+    def sync(self, loader, batch_size: int = None):
+        """Incrementally bring the index in line with loader.data_dir
+        
+        Only new or changed PDFs are parsed and embedded; vectors for removed
+        or changed files are deleted. A manifest of file hashes and their
+        chunk IDs is kept next to the Chroma files.
+        
+        Pages stream from the loader through the splitter into embedding and
+        upsert batches of batch_size chunks, so memory stays flat however
+        large data/ gets. After every batch a checkpoint records how far the
+        current file got; an interrupted sync picks up from there.
+        """
+        batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        manifest = self._read_manifest()
+        checkpoint = self._read_checkpoint()
+        to_ingest, stale = loader.diff_manifest(manifest)
+        
+        print(f"Sync: {len(to_ingest)} new/changed files, {len(stale)} stale files")
+        
+        if self.vectorstore is None:
+            self.vectorstore = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embeddings,
+                collection_name="healthcare_docs"
+            )
+        
+        if not manifest["files"] and not checkpoint and self.vectorstore._collection.count() > 0:
+            # Built before manifests existed: its chunk IDs can't be matched to files
+            print("No ingest manifest found, re-indexing existing collection from scratch")
+            self.vectorstore.delete_collection()
+            self.vectorstore = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embeddings,
+                collection_name="healthcare_docs"
+            )
+        
+        for path in stale:
+            chunk_ids = manifest["files"].pop(path)["chunk_ids"]
+            if chunk_ids:
+                self.vectorstore.delete(ids=chunk_ids)
+            print(f"  - removed {len(chunk_ids)} chunks from {Path(path).name}")
+        self._write_manifest(manifest)
+        
+        if checkpoint.get("path") and to_ingest.get(checkpoint["path"]) != checkpoint.get("sha256"):
+            # The interrupted file changed or went away since: what it committed is
+            # keyed by the old hash and in no manifest entry, so nothing else removes it
+            self.vectorstore._collection.delete(where={
+                "$and": [{"source": checkpoint["path"]}, {"doc_hash": checkpoint["sha256"]}]
+            })
+            print(f"  - removed partial ingest of {Path(checkpoint['path']).name}")
+            checkpoint = {}
+            self._write_checkpoint(checkpoint)
+        
+        pages = loader.iter_documents(list(to_ingest))
+        current, chunk_ids, batch, skip = None, [], [], 0
+        
+        for chunk in loader.iter_chunks(pages, dict(to_ingest)):
+            path = chunk.metadata['source']
+            if path != current:
+                # Batches never span files, so a checkpoint only ever names one file
+                self._upsert_batch(batch, current, to_ingest, len(chunk_ids))
+                self._finish_file(loader, manifest, current, to_ingest, chunk_ids)
+                current, chunk_ids, batch = path, [], []
+                skip = checkpoint.get("chunks_committed", 0) if (
+                    checkpoint.get("path") == path and checkpoint.get("sha256") == to_ingest[path]
+                ) else 0
+            
+            chunk_ids.append(chunk.metadata['chunk_id'])
+            if len(chunk_ids) <= skip:
+                continue
+            
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                self._upsert_batch(batch, current, to_ingest, len(chunk_ids))
+                batch = []
+        
+        self._upsert_batch(batch, current, to_ingest, len(chunk_ids))
+        self._finish_file(loader, manifest, current, to_ingest, chunk_ids)
+        
+        # PDFs with no extractable text never show up in the chunk stream
+        for path in to_ingest:
+            if path not in manifest["files"] and path not in loader.failed_files:
+                self._finish_file(loader, manifest, path, to_ingest, [])
+        
+        if to_ingest or stale or not BM25Index.exists(self.bm25_path):
+            self.build_bm25_index()
+        
+        return {"ingested": len(to_ingest), "removed": len(stale), "failed": dict(loader.failed_files)}
+    
+    @property
+    def bm25_path(self) -> str:
+        return os.path.join(self.persist_directory, "bm25")
+    
+    def build_bm25_index(self, page_size: int = 1000) -> BM25Index:
+        """Rebuild the lexical index from every chunk in the collection"""
+        def iter_chunks():
+            offset = 0
+            while True:
+                page = self.vectorstore._collection.get(
+                    include=["documents"], limit=page_size, offset=offset
+                )
+                if not page["ids"]:
+                    return
+                yield from zip(page["ids"], page["documents"])
+                offset += len(page["ids"])
+        
+        index = BM25Index.build(iter_chunks(), self.bm25_path)
+        self._bm25 = (self._stat(self._bm25_weights_path()), index)
+        print(f"✓ BM25 index built over {len(index.chunk_ids)} chunks")
+        return index
+    
+    def bm25_index(self):
+        """The lexical index, or None until one is built
+        
+        Cached against the stats of the files on disk, so an index rebuilt
+        by a sync, here or in another process, replaces the loaded one.
+        """
+        key = self._stat(self._bm25_weights_path())
+        cached = self._bm25
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        index = BM25Index(self.bm25_path) if key is not None else None
+        self._bm25 = (key, index)
+        return index
+    
+    def _bm25_weights_path(self) -> str:
+        # Written with the rest of the index and swapped in with it, so its stats identify a build
+        return os.path.join(self.bm25_path, "weights.npy")
+    
+    def get_chunks(self, chunk_ids: List[str], include: List[str] = None) -> dict:
+        """Fetch stored text, metadata and embeddings (or just the fields in include) for the given chunk IDs"""
+        if not self.vectorstore:
+            self.load_vectorstore()
+        include = include or ["documents", "metadatas", "embeddings"]
+        with tracing.span("chroma.get", {"chunks": len(chunk_ids)}), self._lock:
+            return self.vectorstore._collection.get(ids=chunk_ids, include=include)
+    
+    def rebuild(self, loader, batch_size: int = None):
+        """Drop the collection and stream the whole of data_dir back in"""
+        if os.path.exists(self.persist_directory):
+            Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embeddings,
+                collection_name="healthcare_docs"
+            ).delete_collection()
+        self.vectorstore = None
+        self._write_manifest({"files": {}})
+        self._write_checkpoint({})
+        return self.sync(loader, batch_size=batch_size)
+    
+    def _upsert_batch(self, batch: list, path: str, to_ingest: dict, chunks_committed: int):
+        if not batch:
+            return
+        # Chunk IDs are stable, so re-adding a batch after a crash just overwrites it
+        self.vectorstore.add_documents(batch, ids=[c.metadata['chunk_id'] for c in batch])
+        self._write_checkpoint({
+            "path": path,
+            "sha256": to_ingest[path],
+            "chunks_committed": chunks_committed
+        })
+    
+    def _finish_file(self, loader, manifest: dict, path: str, to_ingest: dict, chunk_ids: list):
+        if path is None:
+            return
+        
+        if path in loader.failed_files:
+            # Drop whatever made it in and leave the file out of the manifest
+            # so the next sync retries it
+            if chunk_ids:
+                self.vectorstore.delete(ids=chunk_ids)
+            print(f"  ✗ {Path(path).name} failed to parse, will retry on next sync")
+        else:
+            manifest["files"][path] = {"sha256": to_ingest[path], "chunk_ids": chunk_ids}
+            print(f"  + added {len(chunk_ids)} chunks from {Path(path).name}")
+        
+        self._write_manifest(manifest)
+        self._write_checkpoint({})
+    
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.persist_directory, "ingest_checkpoint.json")
+    
+    def _read_checkpoint(self) -> dict:
+        if not os.path.exists(self._checkpoint_path()):
+            return {}
+        with open(self._checkpoint_path()) as f:
+            return json.load(f)
+    
+    def _write_checkpoint(self, checkpoint: dict):
+        self._write_json(self._checkpoint_path(), checkpoint)
+    
+    def _manifest_path(self) -> str:
+        return os.path.join(self.persist_directory, "ingest_manifest.json")
+    
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self._manifest_path()):
+            return {"files": {}}
+        with open(self._manifest_path()) as f:
+            return json.load(f)
+    
+    def _write_manifest(self, manifest: dict):
+        self._write_json(self._manifest_path(), manifest)
+    
+    def _write_json(self, path: str, data: dict):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    
     def load_vectorstore(self):
+        if self.vectorstore is not None:
+            return self.vectorstore
+        
         if os.path.exists(self.persist_directory):
             print(f"Loading existing vector store from {self.persist_directory}...")
             
@@ -49,15 +293,106 @@ class HealthcareVectorStore:
                 "Create it first using create_vectorstore()."
             )
     
+    def corpus_version(self) -> str:
+        """Fingerprint of what is indexed: the files and hashes in the ingest manifest
+        
+        Every sync, create_vectorstore() and rebuild() rewrites the manifest,
+        and a sync also checkpoints each batch it commits. The fingerprint is
+        cached against those two files' stats, so a lookup costs two stat
+        calls unless something was ingested since, here or in another process.
+        """
+        key = tuple(self._stat(path) for path in (self._manifest_path(), self._checkpoint_path()))
+        cached = self._corpus_version
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        
+        files = self._read_manifest()["files"]
+        digest = hashlib.sha256()
+        digest.update(json.dumps({
+            "files": {path: entry["sha256"] for path, entry in files.items()},
+            "checkpoint": self._read_checkpoint()
+        }, sort_keys=True).encode())
+        version = digest.hexdigest()
+        self._corpus_version = (key, version)
+        return version
+    
+    @staticmethod
+    def _stat(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
     def similarity_search(self, query: str, k: int = 5):
         if not self.vectorstore:
             self.load_vectorstore()
         
-        print(f"Searching for: '{query}'")
-        results = self.vectorstore.similarity_search_with_score(query, k=k)
+        # Embedded outside the lock so concurrent searches can share a model batch
+        start = time.perf_counter()
+        embedding = self.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+        with tracing.span("chroma.query", {"queries": 1, "k": k}), self._lock:
+            results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        
+        self._record_search(1, k, start, embedded, len(results))
+        return results
+    
+    def similarity_search_batch(self, queries: List[str], k: int = 5, dedup: bool = False) -> List[list]:
+        """Search for many queries with one embedding pass and one Chroma query
+        
+        Returns one list of (Document, distance) per query, in input order.
+        With dedup=True a chunk is only returned for the first query that
+        retrieved it.
+        """
+        if not self.vectorstore:
+            self.load_vectorstore()
+        
+        if not queries:
+            return []
         
-        print(f"✓ Found {len(results)} results")
+        start = time.perf_counter()
+        embeddings = self.embeddings.embed_documents(list(queries))
+        embedded = time.perf_counter()
+        
+        with tracing.span("chroma.query", {"queries": len(queries), "k": k}), self._lock:
+            raw = self.vectorstore._collection.query(
+                query_embeddings=embeddings,
+                n_results=k,
+                include=["documents", "metadatas", "distances"]
+            )
+        
+        seen = set()
+        deduplicated = 0
+        results = []
+        for ids, texts, metadatas, distances in zip(
+            raw["ids"], raw["documents"], raw["metadatas"], raw["distances"]
+        ):
+            hits = []
+            for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances):
+                if dedup and chunk_id in seen:
+                    deduplicated += 1
+                    continue
+                seen.add(chunk_id)
+                hits.append((Document(page_content=text, metadata=metadata or {}), distance))
+            results.append(hits)
+        
+        self._record_search(len(queries), k, start, embedded, sum(len(r) for r in results), deduplicated)
         return results
+    
+    def _record_search(self, queries: int, k: int, start: float, embedded: float,
+                       results: int, deduplicated: int = 0):
+        now = time.perf_counter()
+        self.search_metrics.append({
+            "timestamp": time.time(),
+            "queries": queries,
+            "k": k,
+            "embed_ms": round((embedded - start) * 1000, 2),
+            "search_ms": round((now - embedded) * 1000, 2),
+            "total_ms": round((now - start) * 1000, 2),
+            "results": results,
+            "deduplicated": deduplicated
+        })
 
 
 if __name__ == "__main__":
@@ -68,11 +403,13 @@ if __name__ == "__main__":
     print("=" * 80)
     
     loader = HealthcareDocumentLoader()
-    chunks = loader.process_all()
     
-    print("\n" + "=" * 80)
     vs = HealthcareVectorStore()
-    vs.create_vectorstore(chunks)
+    if "--rebuild" in sys.argv:
+        vs.rebuild(loader)
+    else:
+        # Only parse and embed PDFs that changed since the last run
+        vs.sync(loader)
     
     print("\n" + "=" * 80)
     print("TESTING SEARCH")